@@ -1,25 +1,58 @@
+import argparse
+import bisect
+import copyreg
+import csv
+import gc
+import hashlib
+import io
+import json
 import math  
+import mmap
 import os  
+import pickle
+import queue
 import random  
+import struct
 import sys  
+import threading
 import time  
+import tracemalloc
+import weakref
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from itertools import compress
+from operator import itemgetter
+from typing import NamedTuple
 import pygame as pg  
+try:
+    import numpy as np
+except ImportError:  # NumPyがない環境ではProjectileEngineだけが使えない
+    np = None
+try:
+    from pygame._sdl2 import video
+except ImportError:  # pygame._sdl2がない環境ではTextureRendererだけが使えない
+    video = None
 
 
 WIDTH = 1100  # ゲームウィンドウの幅
 HEIGHT = 650  # ゲームウィンドウの高さ
 GROUND_Y = int(HEIGHT * 0.8)  #地面の高さ
+FPS = 50  # 1秒あたりのフレーム数
+PLAYER_IMAGES = (3, 2)  # 1人目，2人目のこうかとん画像ファイル名の番号
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
 
-def check_bound(obj_rct: pg.Rect) -> tuple[bool, bool]:  
+def check_bound(obj_rct: pg.Rect, area: pg.Rect = None) -> tuple[bool, bool]:  
     """  
     オブジェクトが画面内or画面外を判定し，真理値タプルを返す関数  
-    引数：こうかとんや爆弾，ビームなどのRect  
+    引数1：こうかとんや爆弾，ビームなどのRect  
+    引数2 area：判定する範囲（省略時は画面．横に長いステージではステージ内の有効範囲）
     戻り値：横方向，縦方向のはみ出し判定結果（画面内：True／画面外：False）  
     """  
+    left, right = (0, WIDTH) if area is None else (area.left, area.right)
     yoko, tate = True, True  
-    if obj_rct.left < 0 or WIDTH < obj_rct.right:  
+    if obj_rct.left < left or right < obj_rct.right:  
         yoko = False  
     if obj_rct.top < 0 or HEIGHT < obj_rct.bottom:  
         tate = False  
@@ -38,6 +71,604 @@ def calc_orientation(org: pg.Rect, dst: pg.Rect) -> tuple[float, float]:
     return x_diff/norm, y_diff/norm  
 
 
+class AssetCache:
+    """
+    画像ファイルを一度だけ読み込み，回転・拡大縮小・反転した派生画像を
+    パラメータごとにLRUで保持するクラス
+    """
+    def __init__(self, maxsize: int = 512):
+        """
+        引数 maxsize：保持する派生画像の最大数
+        """
+        self.maxsize = maxsize
+        self.images: dict[tuple[str, bool], pg.Surface] = {}  # (パス, α有無) -> 読み込み済み画像
+        self.variants: OrderedDict[tuple, pg.Surface] = OrderedDict()  # (パス, 変換列) -> 派生画像
+        self.circles: dict[tuple, pg.Surface] = {}  # (半径, 色) -> 爆弾の円（数が限られるのでLRUに入れない）
+        self.fills: dict[tuple, pg.Surface] = {}  # (大きさ, 色) -> 単色で塗ったα付き画像
+        self.masks = weakref.WeakKeyDictionary()  # 画像 -> 衝突判定用マスク（画像が捨てられたら消える）
+        self.origins = weakref.WeakKeyDictionary()  # 派生画像 -> (パス, 変換列, α有無)（描画時に変換する描画先用）
+        self.bundle: "AssetBundle|None" = None  # 指定した場合は画像ファイルより先にここから探す
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _prepare(img: pg.Surface, alpha: bool) -> pg.Surface:
+        """
+        画面が生成済みなら，画面のピクセル形式に変換する
+        """
+        if pg.display.get_init() and pg.display.get_surface() is not None:
+            return img.convert_alpha() if alpha else img.convert()
+        return img
+
+    @staticmethod
+    def _apply(img: pg.Surface, op: tuple) -> pg.Surface:
+        """
+        変換1つを画像に適用する
+        引数1 img：変換元の画像
+        引数2 op：("rotozoom", 角度, 倍率)，("flip", 横, 縦)，("scale", 幅, 高さ)，("scale_by", 倍率)，
+                 ("alpha", 透明度)（画像全体の透明度を設定した複製）
+        """
+        name, *args = op
+        if name == "rotozoom":
+            return pg.transform.rotozoom(img, *args)
+        if name == "flip":
+            return pg.transform.flip(img, *args)
+        if name == "scale":
+            return pg.transform.scale(img, args)
+        if name == "scale_by":
+            return pg.transform.scale(img, (int(img.get_width()*args[0]), int(img.get_height()*args[0])))
+        if name == "alpha":
+            img = img.copy()
+            img.set_alpha(args[0])
+            return img
+        raise ValueError(f"未知の変換です: {op}")
+
+    def _remember(self, key: tuple, img: pg.Surface) -> pg.Surface:
+        self.variants[key] = img
+        if len(self.variants) > self.maxsize:
+            self.variants.popitem(last=False)  # 最も長く使われていないものを捨てる
+        return img
+
+    def load(self, path: str, alpha: bool = True) -> pg.Surface:
+        """
+        画像ファイルを読み込む（2回目以降はキャッシュを返す）
+        """
+        img = self.images.get((path, alpha))
+        if img is None:
+            self.misses += 1
+            img = self.bundle.image(path, (), alpha) if self.bundle is not None else None
+            if img is None:
+                img = pg.image.load(path)
+            img = self.images[path, alpha] = self._prepare(img, alpha)
+        else:
+            self.hits += 1
+        return img
+
+    def get(self, path: str, *ops: tuple, alpha: bool = True) -> pg.Surface:
+        """
+        画像ファイルに変換列opsを順に適用した派生画像を返す
+        途中までの変換結果もキャッシュされるため，共通の前段は一度しか計算しない
+        引数1 path：画像ファイルのパス
+        引数2 ops：AssetCache._applyに渡す変換のタプル
+        """
+        if not ops:
+            return self.load(path, alpha)
+        key = (path, ops, alpha)
+        img = self.variants.get(key)
+        if img is not None:
+            self.hits += 1
+            self.variants.move_to_end(key)
+            return img
+        self.misses += 1
+        img = self.bundle.image(path, ops, alpha) if self.bundle is not None else None
+        if img is None:
+            img = self._apply(self.get(path, *ops[:-1], alpha=alpha), ops[-1])
+        img = self._prepare(img, alpha)
+        self.origins[img] = (path, ops, alpha)
+        return self._remember(key, img)
+
+    def circle(self, rad: int, color: tuple[int, int, int]) -> pg.Surface:
+        """
+        黒をカラーキーにした半径radの円Surfaceを返す（爆弾用）
+        """
+        img = self.circles.get((rad, color))
+        if img is not None:
+            self.hits += 1
+            return img
+        self.misses += 1
+        img = pg.Surface((2*rad, 2*rad))
+        pg.draw.circle(img, color, (rad, rad), rad)
+        img = self._prepare(img, False)
+        img.set_colorkey((0, 0, 0))
+        self.circles[rad, color] = img
+        return img
+
+    def fill(self, size: tuple[int, int], color: tuple[int, int, int, int]) -> pg.Surface:
+        """
+        色colorで塗りつぶした大きさsizeのα付きSurfaceを返す（炎柱用）
+        共有されるので，受け取った側で書き換えてはいけない
+        """
+        img = self.fills.get((size, color))
+        if img is not None:
+            self.hits += 1
+            return img
+        self.misses += 1
+        img = pg.Surface(size, pg.SRCALPHA)
+        img.fill(color)
+        img = self.fills[size, color] = self._prepare(img, True)
+        return img
+
+    def store(self, path: str, ops: tuple, alpha: bool, base: pg.Surface, img: pg.Surface):
+        """
+        別の場所で読み込み・変換した画像を登録する（AssetPreloader用）
+        すでに登録されているものは上書きしない
+        引数4 base：画像ファイルを読み込んだだけの画像（Noneなら登録しない）
+        引数5 img：baseに変換列opsを適用した画像
+        """
+        if base is not None and (path, alpha) not in self.images:
+            self.images[path, alpha] = self._prepare(base, alpha)
+        if ops and (path, ops, alpha) not in self.variants:
+            img = self._prepare(img, alpha)
+            self.origins[img] = (path, ops, alpha)
+            self._remember((path, ops, alpha), img)
+
+    def mask(self, img: pg.Surface) -> pg.mask.Mask:
+        """
+        画像imgの衝突判定用マスクを返す（共有画像ごとに一度だけ作る）
+        """
+        mask = self.masks.get(img)
+        if mask is None:
+            mask = self.masks[img] = pg.mask.from_surface(img)
+        return mask
+
+    def convert_all(self):
+        """
+        画面生成前に読み込んだ画像を画面のピクセル形式に変換し直す
+        派生画像は次に要求されたときに変換済みの画像から作り直される
+        """
+        for (path, alpha), img in self.images.items():
+            self.images[path, alpha] = self._prepare(img, alpha)
+        self.variants.clear()
+        for key, img in self.circles.items():
+            self.circles[key] = img = self._prepare(img, False)
+            img.set_colorkey((0, 0, 0))
+        for key, img in self.fills.items():
+            self.fills[key] = self._prepare(img, True)
+        self.masks.clear()
+
+    def stats(self) -> dict[str, int]:
+        """
+        キャッシュのヒット数，ミス数，保持数を返す
+        """
+        return {"hits": self.hits, "misses": self.misses, "files": len(self.images),
+                "variants": len(self.variants), "circles": len(self.circles), "fills": len(self.fills),
+                "masks": len(self.masks)}
+
+
+ASSETS = AssetCache()  # 全スプライトで共有する画像キャッシュ
+
+
+class AssetBundle:
+    """
+    build_bundle.pyで作った，変換済みの画像の生のピクセルとフォントファイルをまとめたファイルを読むクラス
+    ファイルはメモリマップするだけで，画像はデコードせずにその場所のバッファからSurfaceを作る
+    ファイルの内容：識別子，版数，目次(JSON)の長さ，目次，データ
+    目次の"sources"に元のファイルの大きさと更新時刻があり，変わったファイルの分は使わない
+    """
+    MAGIC = b"HSAB"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBI")  # 識別子，版数，目次の長さ
+    PATH = "assets.bundle"  # build_bundle.pyが書き出し，main()が読むファイル
+    FONTS = ("disturbed-zrrgd.ttf",)  # 画像と一緒に入れるフォントファイル
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size = self.HEADER.unpack_from(self.map)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"{path}はこの版のアセットバンドルではありません")
+        start = self.HEADER.size + size
+        index = json.loads(self.map[self.HEADER.size:start])
+        self.view = memoryview(self.map)[start:]
+        stale = {src for src, stamp in index["sources"].items() if self.stamp(src) != stamp}
+        self.images = {(path, tuple(tuple(op) for op in ops), alpha): (tuple(size), offset, length)
+                       for path, ops, alpha, size, offset, length in index["images"] if path not in stale}
+        self.files = {path: (offset, length) for path, offset, length in index["files"] if path not in stale}
+        self.stale = sorted(stale)
+
+    @staticmethod
+    def stamp(path: str) -> "list[int]|None":
+        """
+        ファイルの[大きさ, 更新時刻(ns)]（ファイルがなければNone）
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def image(self, path: str, ops: tuple, alpha: bool) -> "pg.Surface|None":
+        """
+        画像ファイルpathに変換列opsを適用した画像を返す（入っていなければNone）
+        画面があれば，バンドルのメモリを直接参照するSurfaceを返す（AssetCacheが画面の形式に変換して使う）
+        画面がなければ変換されずにそのまま使われるので，複製して返す
+        （参照したままだと読み取り専用で境界も揃っていないため，塗りつぶしや転送で書き込むと落ちる）
+        """
+        entry = self.images.get((path, ops, alpha))
+        if entry is None:
+            return None
+        size, offset, length = entry
+        img = pg.image.frombuffer(self.view[offset:offset+length], size, "RGBA" if alpha else "RGB")
+        return img if pg.display.get_init() and pg.display.get_surface() is not None else img.copy()
+
+    def file(self, path: str) -> "memoryview|None":
+        """
+        一緒に入れたファイル（フォント）の中身を返す（入っていなければNone）
+        """
+        entry = self.files.get(path)
+        if entry is None:
+            return None
+        offset, length = entry
+        return self.view[offset:offset+length]
+
+    def install(self) -> "AssetBundle":
+        """
+        ASSETSとTEXTがこのバンドルから読むようにする
+        """
+        ASSETS.bundle = TEXT.bundle = self
+        return self
+
+    @classmethod
+    def write(cls, path: str, images: list[tuple[str, tuple, bool, pg.Surface]], files: list[str]):
+        """
+        画像とファイルをまとめてバンドルに書き出す（build_bundle.py用）
+        引数2 images：(画像ファイルのパス, 変換列, α有無, 変換済みの画像)のリスト
+        引数3 files：そのまま入れるファイルのパス
+        """
+        chunks, entries, offset = [], [], 0
+        sources = {}
+        for src, ops, alpha, img in images:
+            data = pg.image.tobytes(img, "RGBA" if alpha else "RGB")
+            entries.append((src, ops, alpha, img.get_size(), offset, len(data)))
+            chunks.append(data)
+            offset += len(data)
+            sources[src] = cls.stamp(src)
+        index = {"sources": sources, "images": entries, "files": []}
+        for src in files:
+            with open(src, "rb") as f:
+                data = f.read()
+            index["files"].append((src, offset, len(data)))
+            chunks.append(data)
+            offset += len(data)
+            sources[src] = cls.stamp(src)
+        head = json.dumps(index).encode()
+        with open(path, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(head)))
+            f.write(head)
+            for data in chunks:
+                f.write(data)
+
+
+class AssetPreloader:
+    """
+    ステージで使う画像の読み込みと変換を別スレッドで先に済ませておくクラス
+    画面のピクセル形式への変換とキャッシュへの登録はメインスレッドで行う必要があるため，
+    毎フレームpoll()を呼んで少しずつASSETSへ移す
+    """
+    def __init__(self, specs: list[tuple[str, tuple, bool]], cache: AssetCache = ASSETS):
+        """
+        引数1 specs：(画像ファイルのパス, 変換列, α有無)のリスト
+        引数2 cache：登録先のキャッシュ
+        """
+        self.specs = list(specs)
+        self.cache = cache
+        self.ready_items = queue.SimpleQueue()  # 別スレッドで用意できたもの
+        self.loaded = 0  # キャッシュへ登録し終えた数
+        self.errors: list[str] = []
+        self.thread = threading.Thread(target=self._work, name="AssetPreloader", daemon=True)
+
+    def start(self) -> "AssetPreloader":
+        self.thread.start()
+        return self
+
+    def _work(self):
+        bases = {}  # パス -> 読み込んだ画像（同じファイルは一度だけ読む）
+        bundle = self.cache.bundle
+        for path, ops, alpha in self.specs:
+            img = bundle.image(path, ops, alpha) if bundle is not None else None
+            if img is not None:  # バンドルに変換済みのものがあればデコードしない
+                self.ready_items.put((path, ops, alpha, None, img))
+                continue
+            try:
+                if path not in bases:
+                    bases[path] = pg.image.load(path)
+                img = bases[path]
+                for op in ops:
+                    img = AssetCache._apply(img, op)
+                self.ready_items.put((path, ops, alpha, bases[path], img))
+            except Exception as e:  # 読めなかった画像は使うときに改めて読み込まれる
+                self.ready_items.put((path, ops, alpha, None, e))
+
+    def poll(self, budget: int = 1) -> int:
+        """
+        用意できた画像を最大budget個キャッシュへ登録する（メインスレッドから呼ぶ）
+        戻り値：登録した数
+        """
+        n = 0
+        while n < budget:
+            try:
+                path, ops, alpha, base, img = self.ready_items.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(img, Exception):
+                self.errors.append(f"{path}: {img}")
+            else:
+                self.cache.store(path, ops, alpha, base, img)
+            self.loaded += 1
+            n += 1
+        return n
+
+    def wait(self):
+        """
+        残りをすべて読み込み終えて登録するまで待つ
+        """
+        self.thread.join()
+        self.poll(len(self.specs))
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded >= len(self.specs)
+
+    def progress(self) -> dict:
+        """
+        読み込みの進み具合を返す
+        戻り値：{"loaded": 登録済みの数, "total": 全体の数, "ready": すべて終わったか, "errors": 失敗した画像}
+        """
+        return {"loaded": self.loaded, "total": len(self.specs), "ready": self.ready,
+                "errors": list(self.errors)}
+
+
+class Animation:
+    """
+    スプライトの種類ごとに一度だけ宣言するアニメーション表
+    経過フレームごとのコマ番号（と状態名）を前計算しておき，
+    各スプライトはコマ番号が変わったときだけ共有画像を差し替える
+    """
+    def __init__(self, frames: list, steps: list[tuple[int, int]],
+                 states: list[tuple[str, int]] = None, loop: bool = False):
+        """
+        引数1 frames：コマの画像を返す関数のリスト（画像はASSETSで共有される）
+        引数2 steps：(コマ番号, 表示フレーム数)のリスト
+        引数3 states：(状態名, フレーム数)のリスト（コマとは別の区切りで状態を持つ場合）
+        引数4 loop：最後まで進んだら最初に戻るか
+        """
+        self.frames = frames
+        self.index = tuple(i for i, n in steps for _ in range(n))  # 経過フレーム -> コマ番号
+        self.length = len(self.index)
+        self.states = tuple(s for s, n in states for _ in range(n)) if states else None
+        self.loop = loop
+        # コマか状態が前のフレームから変わる経過フレーム（タイマーで切り替えるスプライト用）
+        self.changes = tuple(t for t in range(1, self.length)
+                             if self.index[t] != self.index[t-1]
+                             or (self.states and self.states[t] != self.states[t-1]))
+
+    def image(self, i: int) -> pg.Surface:
+        """
+        コマ番号iの画像を返す
+        """
+        return self.frames[i]()
+
+
+class Animated:
+    """
+    クラス属性animationの表に従ってimageを切り替えるスプライト用の機能
+    """
+    animation: Animation
+
+    def start_animation(self, tick: int = 0, shown: "int|None" = None):
+        """
+        アニメーションを経過フレームtickから始める
+        引数2 shown：最初に表示するコマ番号（省略時は表のとおり）
+        """
+        anim = self.animation
+        self.tick = tick
+        self.shown = anim.index[tick % anim.length] if shown is None else shown
+        self.image = anim.image(self.shown)
+
+    def show(self, tick: int) -> bool:
+        """
+        経過フレームtickのコマを表示する
+        戻り値：画像を差し替えたか
+        """
+        anim = self.animation
+        self.tick = tick
+        if anim.loop:
+            tick %= anim.length
+        elif tick >= anim.length:
+            return False
+        i = anim.index[tick]
+        if i == self.shown:
+            return False
+        self.shown = i
+        self.image = anim.image(i)
+        return True
+
+    def animate(self) -> bool:
+        """
+        アニメーションを1フレーム進める
+        戻り値：画像を差し替えたか
+        """
+        return self.show(self.tick + 1)
+
+    @property
+    def finished(self) -> bool:
+        return not self.animation.loop and self.tick >= self.animation.length
+
+
+class TextCache:
+    """
+    フォントを(名前, サイズ)ごとに，描画済みの文字列Surfaceを(フォント, 文字列, 色)ごとにLRUで保持するクラス
+    """
+    def __init__(self, maxsize: int = 256):
+        """
+        引数 maxsize：保持する文字列Surfaceの最大数
+        """
+        self.maxsize = maxsize
+        self.fonts: dict[tuple, pg.font.Font] = {}  # (名前, サイズ, システムフォントか) -> フォント
+        self.surfaces: OrderedDict[tuple, pg.Surface] = OrderedDict()
+        self.bundle: "AssetBundle|None" = None  # 指定した場合はフォントファイルをここから読む
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, name: "str|None", size: int, sysfont: bool = False) -> pg.font.Font:
+        """
+        フォントを返す（2回目以降は読み込み済みのものを返す）
+        引数1 name：フォントファイルのパス（Noneで既定のフォント）またはシステムフォント名
+        引数3 sysfont：Trueならnameをシステムフォント名として探す
+        """
+        key = (name, size, sysfont)
+        font = self.fonts.get(key)
+        if font is None:
+            data = self.bundle.file(name) if self.bundle is not None and name and not sysfont else None
+            if data is not None:
+                font = pg.font.Font(io.BytesIO(data), size)
+            else:
+                font = pg.font.SysFont(name, size) if sysfont else pg.font.Font(name, size)
+            self.fonts[key] = font
+        return font
+
+    def render(self, text: str, color: tuple[int, int, int], name: "str|None" = None, size: int = 36,
+               sysfont: bool = False, antialias: bool = True) -> pg.Surface:
+        """
+        文字列を描画したSurfaceを返す（同じ組み合わせは描画し直さない）
+        """
+        key = (name, size, sysfont, text, color, antialias)
+        img = self.surfaces.get(key)
+        if img is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return img
+        self.misses += 1
+        img = self.surfaces[key] = self.font(name, size, sysfont).render(text, antialias, color)
+        if len(self.surfaces) > self.maxsize:
+            self.surfaces.popitem(last=False)
+        return img
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses,
+                "fonts": len(self.fonts), "surfaces": len(self.surfaces)}
+
+
+TEXT = TextCache()  # HUDやリザルト画面で共有する文字列キャッシュ
+
+
+class Timer:
+    """
+    TimerWheel.scheduleが返す予約（cancel()で取り消せる）
+    """
+    __slots__ = ("tick", "seq", "callback", "args", "cancelled", "wheel")
+
+    def __init__(self, tick: int, seq: int, callback, args: tuple, wheel: "TimerWheel"):
+        self.tick = tick  # 実行するフレーム
+        self.seq = seq  # 同じフレームの予約は予約した順に実行する
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.wheel = wheel
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self.wheel.pending -= 1
+
+
+class TimerWheel:
+    """
+    「kフレーム後にこれを実行する」という予約をまとめて管理する階層型タイマーホイール
+    1段目は1フレーム刻み，2段目以降は前の段の1周分の刻みでslots個ずつ枠を持ち，
+    上の段の枠は時刻がその区間に入ったときに下の段へ振り分け直す
+    1フレームの手間は実行される予約の数に比例し，待っているだけの予約の数にはよらない
+    """
+    def __init__(self, bits: int = 6, levels: int = 4, start: int = 0):
+        """
+        引数1 bits：1段の枠の数を2**bitsにする
+        引数2 levels：段の数（2**(bits*levels)フレームより先の予約はoverflowに置く）
+        引数3 start：最初の時刻
+        """
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.wheels = [[[] for _ in range(1 << bits)] for _ in range(levels)]
+        self.overflow: list[Timer] = []
+        self.now = start  # 最後に進めたフレーム
+        self.seq = 0
+        self.pending = 0  # 取り消されていない予約の数
+
+    def schedule(self, delay: int, callback, *args) -> "Timer|None":
+        """
+        delayフレーム後にcallback(*args)を実行するよう予約する
+        delayが0以下ならすぐに実行してNoneを返す
+        """
+        if delay <= 0:
+            callback(*args)
+            return None
+        self.seq += 1
+        timer = Timer(self.now + delay, self.seq, callback, args, self)
+        self.pending += 1
+        self._insert(timer)
+        return timer
+
+    def _insert(self, timer: Timer):
+        delta = timer.tick - self.now
+        for level, wheel in enumerate(self.wheels):
+            if delta < 1 << (self.bits * (level+1)):
+                wheel[(timer.tick >> (self.bits*level)) & self.mask].append(timer)
+                return
+        self.overflow.append(timer)
+
+    def _cascade(self):
+        """
+        時刻nowが区切りに来た段の枠を下の段へ振り分け直す
+        """
+        for level in range(len(self.wheels)-1, 0, -1):
+            if self.now & ((1 << (self.bits*level)) - 1):
+                continue
+            slot = (self.now >> (self.bits*level)) & self.mask
+            timers, self.wheels[level][slot] = self.wheels[level][slot], []
+            if level == len(self.wheels)-1:
+                timers, self.overflow = timers + self.overflow, []
+            for timer in timers:
+                if not timer.cancelled:
+                    self._insert(timer)
+
+    def advance_to(self, tick: int):
+        """
+        時刻をtickまで1フレームずつ進め，その間に期限が来た予約を実行する
+        """
+        if not self.pending:  # 待っている予約がなければ枠を空にして飛ばす
+            if self.now < tick:
+                for wheel in self.wheels:
+                    for slot in wheel:
+                        slot.clear()
+                self.overflow.clear()
+                self.now = tick
+            return
+        while self.now < tick:
+            self.now += 1
+            self._cascade()
+            slot = self.now & self.mask
+            due, self.wheels[0][slot] = self.wheels[0][slot], []
+            if len(due) > 1:
+                due.sort(key=lambda t: t.seq)
+            for timer in due:
+                if not timer.cancelled:
+                    timer.cancelled = True
+                    self.pending -= 1
+                    timer.callback(*timer.args)
+
+    def __len__(self) -> int:
+        return self.pending
+
+
 class Bird(pg.sprite.Sprite):  
     """  
     ゲームキャラクター（こうかとん）に関するクラス  
@@ -48,33 +679,41 @@ class Bird(pg.sprite.Sprite):
         pg.K_LEFT: (-1, 0),  
         pg.K_RIGHT: (+1, 0),  
     }  
-
-    def __init__(self, num: int, xy: tuple[int, int]):  
+    img0 = (("rotozoom", 0, 0.9),)  # 画像に適用する変換列
+    img = img0 + (("flip", True, False),)  # デフォルトのこうかとん
+    img_ops = {  # 向き -> 変換列
+        (+1, 0): img,  # 右
+        (+1, -1): img + (("rotozoom", 45, 0.9),),  # 右上
+        (0, -1): img + (("rotozoom", 90, 0.9),),  # 上
+        (-1, -1): img0 + (("rotozoom", -45, 0.9),),  # 左上
+        (-1, 0): img0,  # 左
+        (-1, +1): img0 + (("rotozoom", 45, 0.9),),  # 左下
+        (0, +1): img + (("rotozoom", -90, 0.9),),  # 下
+        (+1, +1): img + (("rotozoom", -45, 0.9),),  # 右下
+    }
+    del img0, img
+
+    def __init__(self, num: int, xy: tuple[int, int], timers: "TimerWheel|None" = None):  
         """  
         こうかとん画像Surfaceを生成する  
         引数1 num：こうかとん画像ファイル名の番号  
         引数2 xy：こうかとん画像の位置座標タプル  
+        引数3 timers：無敵時間の終わりを予約するタイマーホイール
         """  
         super().__init__()  
-        img0 = pg.transform.rotozoom(pg.image.load(f"fig/{num}.png"), 0, 0.9)  
-        img = pg.transform.flip(img0, True, False)  # デフォルトのこうかとん  
-        self.imgs = {  
-            (+1, 0): img,  # 右  
-            (+1, -1): pg.transform.rotozoom(img, 45, 0.9),  # 右上  
-            (0, -1): pg.transform.rotozoom(img, 90, 0.9),  # 上  
-            (-1, -1): pg.transform.rotozoom(img0, -45, 0.9),  # 左上  
-            (-1, 0): img0,  # 左  
-            (-1, +1): pg.transform.rotozoom(img0, 45, 0.9),  # 左下  
-            (0, +1): pg.transform.rotozoom(img, -90, 0.9),  # 下  
-            (+1, +1): pg.transform.rotozoom(img, -45, 0.9),  # 右下  
-        }  
+        path = f"fig/{num}.png"
+        self.imgs = {dire: ASSETS.get(path, *ops) for dire, ops in self.img_ops.items()}
+        # 無敵中の半透明の画像（共有の画像の透明度を変えると，同じ画像を使う他の描画まで点滅する）
+        self.blink_imgs = {dire: ASSETS.get(path, *ops, ("alpha", 100)) for dire, ops in self.img_ops.items()}
         self.dire = (+1, 0)  
         self.image = self.imgs[self.dire]  
         self.rect = self.image.get_rect()  
         self.rect.center = xy  
         self.speed = 10  
+        self.timers = TimerWheel() if timers is None else timers
         self.is_invincible = False  # 無敵状態かどうかのフラグ
-        self.invincible_timer = 0    # 無敵時間のタイマ
+        self.invincible_end = 0  # 無敵時間が終わるフレーム
+        self.invincible_event = None  # 無敵時間を終わらせる予約
 
         self.vx = 0  # 横方向速度
         self.vy = 0  # 縦方向速度（ジャンプや重力）
@@ -91,18 +730,18 @@ class Bird(pg.sprite.Sprite):
         引数2 screen：画面Surface
         """
 
-    def update(self, key_lst: list[bool], screen: pg.Surface):
+    def update(self, inputs: "Inputs", area: pg.Rect = None):
         """
-        押下キーに応じてこうかとんを移動させる
-        引数1 key_lst：押下キーの真理値リスト
-        引数2 screen：画面Surface
+        押下キーに応じてこうかとんを移動させる（描画はしない）
+        引数1 inputs：このフレームの入力
+        引数2 area：左右に動ける範囲（省略時は画面）
         """
         # 横移動
         self.vx = 0
-        if key_lst[pg.K_LEFT]:
+        if inputs.left:
             self.vx = -self.speed
             self.dire = (-1, 0)
-        if key_lst[pg.K_RIGHT]:
+        if inputs.right:
             self.vx = +self.speed
             self.dire = (+1, 0)
 
@@ -128,121 +767,606 @@ class Bird(pg.sprite.Sprite):
             self.on_ground = True
 
         # 画面外制限（左右のみ）
-        if self.rect.left < 0:
-            self.rect.left = 0
-        if self.rect.right > WIDTH:
-            self.rect.right = WIDTH
+        left, right = (0, WIDTH) if area is None else (area.left, area.right)
+        if self.rect.left < left:
+            self.rect.left = left
+        if self.rect.right > right:
+            self.rect.right = right
 
-        self.image = self.imgs.get(self.dire, self.image)
         # screen.blit(self.image, self.rect) 
-        # 無敵時間の処理
-        if self.is_invincible:
-            self.invincible_timer -= 1
-            if self.invincible_timer <= 0:
-                self.is_invincible = False
-                # 無敵解除時の画像に戻す（任意で元の方向の画像に戻しても良い）
-                self.image.set_alpha(255) # 不透明に戻す
-            else:
-                # 無敵中の点滅表現 (任意)
-                if self.invincible_timer % 10 < 5: # 10フレームごとに半透明と不透明を切り替え
-                    self.image.set_alpha(100) # 半透明にする
-                else:
-                    self.image.set_alpha(255) # 元に戻す
+        # 無敵時間の処理（解除はタイマーホイールの予約で行う）
+        if self.is_invincible and self.invincible_timer % 10 < 5:  # 10フレームごとに半透明と不透明を切り替え
+            self.image = self.blink_imgs.get(self.dire, self.image) # 半透明にする
         else:
-            self.image.set_alpha(255) # 無敵でないときは常に不透明
+            self.image = self.imgs.get(self.dire, self.image) # 無敵でないときは常に不透明
+
+    @property
+    def invincible_timer(self) -> int:
+        """
+        無敵時間の残りフレーム数
+        """
+        return max(0, self.invincible_end - self.timers.now) if self.is_invincible else 0
+
+    @invincible_timer.setter
+    def invincible_timer(self, frames: int):
+        if self.invincible_event is not None:
+            self.invincible_event.cancel()
+        self.invincible_end = self.timers.now + frames
+        self.invincible_event = self.timers.schedule(frames, self.end_invincible)
+
+    def end_invincible(self):
+        """
+        無敵状態を解除する（invincible_timerを設定したときに予約される）
+        """
+        self.is_invincible = False
+        self.invincible_event = None
+
+    @property
+    def mask(self) -> pg.mask.Mask:
+        return ASSETS.mask(self.imgs[self.dire])  # 精密な衝突判定用（点滅中も不透明の画像のマスクを使う）
+
+
+class SpritePool:
+    """
+    kill()されたスプライトを保管しておき，次の生成時に作り直さずに再利用するクラス
+    """
+    def __init__(self, cls: type, maxsize: int = 2048):
+        """
+        引数1 cls：プールするスプライトのクラス（reset()で初期化し直せること）
+        引数2 maxsize：保管しておく最大数
+        """
+        self.cls = cls
+        self.maxsize = maxsize
+        self.free = []
+        self.created = 0  # 新しく生成した数
+        self.reused = 0  # プールから再利用した数
+
+    def acquire(self, *args, **kwargs) -> pg.sprite.Sprite:
+        """
+        プールにあれば再利用し，なければ新しく生成したスプライトを返す
+        """
+        if self.free:
+            obj = self.free.pop()
+            obj.in_pool = False
+            obj.reset(*args, **kwargs)
+            self.reused += 1
+            return obj
+        self.created += 1
+        return self.cls(*args, **kwargs)
+
+    def release(self, obj: pg.sprite.Sprite):
+        """
+        不要になったスプライトをプールに戻す
+        """
+        if not obj.in_pool and len(self.free) < self.maxsize:
+            obj.in_pool = True
+            self.free.append(obj)
+
+    def stats(self) -> dict[str, float]:
+        total = self.created + self.reused
+        return {"free": len(self.free), "created": self.created, "reused": self.reused,
+                "reuse_rate": self.reused/total if total else 0.0}
+
+
+class Pooled:
+    """
+    kill()されたときにクラスのプールへ戻るスプライトのためのミックスイン
+    生成はClass.acquire(...)で行う
+    """
+    pool: SpritePool = None
+    in_pool = False
+
+    @classmethod
+    def acquire(cls, *args, **kwargs):
+        return cls.pool.acquire(*args, **kwargs)
 
-        screen.blit(self.image, self.rect)  
+    def kill(self):
+        super().kill()
+        self.pool.release(self)
 
 
-class Bomb(pg.sprite.Sprite):  
+class Bomb(Pooled, pg.sprite.Sprite):
     """  
     爆弾に関するクラス  
     """  
     colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255), (0, 255, 255)]  
 
-    def __init__(self, emy: "Enemy", bird: Bird, large = False):
+    def __init__(self, emy: "Enemy", bird: Bird, large = False, rng: random.Random = random, speed: int = 6):
+        super().__init__()
+        self.reset(emy, bird, large, rng, speed)
+
+    def reset(self, emy: "Enemy", bird: Bird, large = False, rng: random.Random = random, speed: int = 6):
         """
-        爆弾円Surfaceを生成する
+        爆弾円Surfaceを設定する（プールから再利用するときも呼ばれる）
         引数1 emy：爆弾を投下する敵機
         引数2 bird：攻撃対象のこうかとん
+        引数3 large：Trueならボスの大砲用の大きな爆弾
+        引数4 rng：半径と色を決める乱数生成器
+        引数5 speed：爆弾の速さ
         """
-        super().__init__()
-        rad = 70 if large else random.randint(10, 50)  # 爆弾円の半径：10以上50以下の乱数
-        self.image = pg.Surface((2*rad, 2*rad))
-        color = (255, 0, 0)
-        # self.image = pg.Surface((2*rad, 2*rad))
-        color = random.choice(__class__.colors)  # 爆弾円の色：クラス変数からランダム選択
-        pg.draw.circle(self.image, color, (rad, rad), rad)
-        self.image.set_colorkey((0, 0, 0))
+        rad = 70 if large else rng.randint(10, 50)  # 爆弾円の半径：10以上50以下の乱数
+        color = rng.choice(__class__.colors)  # 爆弾円の色：クラス変数からランダム選択
+        self.color = color
+        self.image = ASSETS.circle(rad, color)  # 起動時に描画済みの円を使い回す
         self.rect = self.image.get_rect()
         # 爆弾を投下するemyから見た攻撃対象のbirdの方向を計算
         self.vx, self.vy = calc_orientation(emy.rect, bird.rect)  
         self.rect.centerx = emy.rect.centerx  
         self.rect.centery = emy.rect.centery+emy.rect.height//2  
-        self.speed = 6  
+        self.speed = speed
 
-    def update(self):  
+    def update(self, area: pg.Rect = None):  
         """  
         爆弾を速度ベクトルself.vx, self.vyに基づき移動させる  
-        引数 screen：画面Surface  
+        引数 area：この範囲から出たら消える（省略時は画面）
         """  
         self.rect.move_ip(self.speed*self.vx, self.speed*self.vy)  
-        if check_bound(self.rect) != (True, True):  
+        if check_bound(self.rect, area) != (True, True):  
             self.kill()  
 
-class Flame(pg.sprite.Sprite):
+    @property
+    def mask(self) -> pg.mask.Mask:
+        return ASSETS.mask(self.image)  # 精密な衝突判定用（画像ごとに一度だけ作る）
+
+
+class PatternBomb(Bomb):
+    """
+    ボスの弾幕の表から作る爆弾
+    1フレームの移動量は表で計算済みなので，乱数もcalc_orientationも使わない
+    """
+    def __init__(self, center: tuple[int, int], dx: int, dy: int, rad: int, color: int):
+        super(Bomb, self).__init__()
+        self.reset(center, dx, dy, rad, color)
+
+    def reset(self, center: tuple[int, int], dx: int, dy: int, rad: int, color: int):
+        """
+        引数1 center：爆弾の中心座標
+        引数2, 3 dx, dy：1フレームの移動量（整数）
+        引数4 rad：半径
+        引数5 color：Bomb.colorsの添字
+        """
+        self.color = Bomb.colors[color]
+        self.image = ASSETS.circle(rad, self.color)
+        self.rect = self.image.get_rect(center=center)
+        self.vx, self.vy = dx, dy
+        self.speed = 1
+
+
+class ProjectileEngine:
+    """
+    爆弾をスプライトではなくNumPy配列（位置，速度，半径，色，生存フラグ，番号）でまとめて扱うクラス
+    移動・画面外判定・衝突判定を配列演算で一括して行い，
+    描画には半径と色ごとに共有される円Surfaceを使う
+    Bombスプライトと同じく，1フレームの移動量は小数点以下を切り捨てた整数になる
+    """
+    def __init__(self, capacity: int = 256):
+        """
+        引数 capacity：最初に確保する爆弾の数（足りなくなったら倍に増やす）
+        """
+        if np is None:
+            raise RuntimeError("ProjectileEngineにはNumPyが必要です")
+        self.n = 0  # 使用中の要素数（死んだ爆弾も次の詰め直しまでは含む）
+        self.left = np.zeros(capacity, np.int64)
+        self.top = np.zeros(capacity, np.int64)
+        self.dx = np.zeros(capacity, np.int64)  # 1フレームの移動量
+        self.dy = np.zeros(capacity, np.int64)
+        self.rad = np.zeros(capacity, np.int64)
+        self.color = np.zeros(capacity, np.int64)  # Bomb.colorsの添字
+        self.alive = np.zeros(capacity, bool)
+        self.prev_left = np.zeros(capacity, np.int64)  # remember()した時点の位置（補間描画用）
+        self.prev_top = np.zeros(capacity, np.int64)
+        self.ids = np.zeros(capacity, np.int64)  # 追加した順の通し番号（詰め直しても変わらない）
+        self.next_id = 1  # 次に追加する爆弾の番号
+
+    def _fields(self) -> tuple[str, ...]:
+        return ("left", "top", "dx", "dy", "rad", "color", "alive", "prev_left", "prev_top", "ids")
+
+    def __getstate__(self) -> dict:
+        """
+        pickle用の状態：使用中のn要素だけを保存し，確保した大きさは数だけ覚えておく
+        """
+        state = {name: getattr(self, name)[:self.n].copy() for name in self._fields()}
+        state["n"] = self.n
+        state["capacity"] = len(self.alive)
+        state["next_id"] = self.next_id
+        return state
+
+    def __setstate__(self, state: dict):
+        self.n = state["n"]
+        self.next_id = state["next_id"]
+        for name in self._fields():
+            arr = np.zeros(state["capacity"], state[name].dtype)
+            arr[:self.n] = state[name]
+            setattr(self, name, arr)
+
+    def _reserve(self, count: int):
+        need = self.n + count
+        if need <= len(self.alive):
+            return
+        if self.alive[:self.n].sum() * 2 < self.n:  # 半分以上が死んでいれば詰め直すだけにする
+            self.compact()
+            if self.n + count <= len(self.alive):
+                return
+        size = max(need, 2*len(self.alive))
+        for name in self._fields():
+            old = getattr(self, name)
+            new = np.zeros(size, old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def compact(self):
+        """
+        死んだ爆弾を取り除く（生きている爆弾の順番は保たれる）
+        """
+        keep = np.flatnonzero(self.alive[:self.n])
+        for name in self._fields():
+            arr = getattr(self, name)
+            arr[:len(keep)] = arr[keep]
+        self.alive[len(keep):self.n] = False
+        self.n = len(keep)
+
+    def spawn(self, cx, cy, dx, dy, rad, color):
+        """
+        爆弾をまとめて追加する（引数はスカラーでも配列でもよい）
+        引数1, 2 cx, cy：爆弾の中心座標
+        引数3, 4 dx, dy：1フレームの移動量（整数）
+        引数5 rad：半径
+        引数6 color：Bomb.colorsの添字
+        """
+        cx, cy, dx, dy, rad, color = np.broadcast_arrays(*(np.asarray(a, np.int64) for a in (cx, cy, dx, dy, rad, color)))
+        count = cx.size
+        self._reserve(count)
+        s = slice(self.n, self.n+count)
+        self.left[s] = self.prev_left[s] = cx.ravel() - rad.ravel()  # Bombと同じく幅2*radのRectの中心に合わせる
+        self.top[s] = self.prev_top[s] = cy.ravel() - rad.ravel()
+        self.dx[s], self.dy[s] = dx.ravel(), dy.ravel()
+        self.rad[s], self.color[s] = rad.ravel(), color.ravel()
+        self.alive[s] = True
+        self.ids[s] = np.arange(self.next_id, self.next_id+count)
+        self.next_id += count
+        self.n += count
+
+    def launch(self, src: pg.Rect, dst: pg.Rect, large: bool = False, center: tuple[int, int] = None,
+               speed: int = 6, rng: random.Random = random):
+        """
+        Bomb(src, dst, large, rng)と同じ乱数の使い方で，srcからdstへ向かう爆弾を1つ追加する
+        引数4 center：指定した場合は爆弾の中心をここにする（ボスの大砲攻撃用）
+        """
+        rad = 70 if large else rng.randint(10, 50)
+        color = Bomb.colors.index(rng.choice(Bomb.colors))
+        vx, vy = calc_orientation(src, dst)
+        cx, cy = center if center is not None else (src.centerx, src.centery+src.height//2)
+        self.spawn(cx, cy, int(speed*vx), int(speed*vy), rad, color)
+
+    def update(self, area: pg.Rect = None):
+        """
+        全爆弾を移動させ，画面外に出たものを消す（vectorized check_bound）
+        引数 area：この範囲から左右に出たら消える（省略時は画面）
+        """
+        x0, x1 = (0, WIDTH) if area is None else (area.left, area.right)
+        n = self.n
+        alive = self.alive[:n]
+        left, top = self.left[:n], self.top[:n]
+        left += self.dx[:n]
+        top += self.dy[:n]
+        size = 2*self.rad[:n]
+        alive &= (left >= x0) & (left+size <= x1) & (top >= 0) & (top+size <= HEIGHT)
+        if n > 64 and alive.sum() * 2 < n:
+            self.compact()
+
+    def _overlap(self, rect: pg.Rect) -> "np.ndarray":
+        """
+        rectとRectが重なる爆弾の真理値配列を返す（pg.Rect.colliderectと同じ判定）
+        """
+        n = self.n
+        left, top, size = self.left[:n], self.top[:n], 2*self.rad[:n]
+        return (self.alive[:n] & (left < rect.right) & (left+size > rect.left)
+                & (top < rect.bottom) & (top+size > rect.top))
+
+    def _circle_hits(self, idx: "np.ndarray", x, y, w, h) -> "np.ndarray":
+        """
+        爆弾idxの円と矩形(x, y, w, h)が重なるかの真理値配列を返す（circle_hits_rectの配列版）
+        """
+        rad = self.rad[idx]
+        cx, cy = self.left[idx] + rad, self.top[idx] + rad
+        dx = cx - np.clip(cx, x, x+w)
+        dy = cy - np.clip(cy, y, y+h)
+        return dx*dx + dy*dy <= rad*rad
+
+    def _mask_hits(self, i: int, mask: pg.mask.Mask, x: int, y: int) -> bool:
+        """
+        爆弾iの円のマスクが，左上(x, y)に置いたmaskと重なるか
+        """
+        circle = ASSETS.mask(ASSETS.circle(int(self.rad[i]), Bomb.colors[self.color[i]]))
+        return mask.overlap(circle, (int(self.left[i]) - x, int(self.top[i]) - y)) is not None
+
+    def collide_rect(self, rect: pg.Rect, dokill: bool, mask: pg.mask.Mask = None) -> list[pg.Rect]:
+        """
+        rectと衝突した爆弾のRectのリストを返す（pg.sprite.spritecollide相当）
+        引数3 mask：指定した場合は，円と矩形の式でふるってからrectの位置に置いたmaskと円のマスクを重ねる
+        """
+        hit = np.flatnonzero(self._overlap(rect))
+        if mask is not None and len(hit):
+            hit = hit[self._circle_hits(hit, *rect)]
+            hit = np.array([i for i in hit.tolist() if self._mask_hits(i, mask, rect.x, rect.y)], np.int64)
+        if dokill:
+            self.alive[hit] = False
+        return [self.rect(i) for i in hit]
+
+    def collide_group(self, group: pg.sprite.AbstractGroup, dokill: bool,
+                      precise: bool = False) -> list[pg.Rect]:
+        """
+        groupのスプライトと衝突した爆弾を消し，そのRectのリストを返す
+        pg.sprite.groupcollide(bombs, group, True, dokill)と同じく，
+        爆弾を追加順に処理し，先に消されたスプライトは後の爆弾に当たらない
+        引数3 precise：Trueなら円と矩形の式でふるってから各スプライトのmaskと円のマスクを重ねる
+        """
+        sprites = group.sprites()
+        if not sprites or not self.n:
+            return []
+        n = self.n
+        rects = np.array([tuple(s.rect) for s in sprites], np.int64)  # (x, y, w, h)
+        left, top, size = self.left[:n, None], self.top[:n, None], 2*self.rad[:n, None]
+        hit = (self.alive[:n, None] & (rects[:, 2] > 0) & (rects[:, 3] > 0)
+               & (left < rects[:, 0]+rects[:, 2]) & (left+size > rects[:, 0])
+               & (top < rects[:, 1]+rects[:, 3]) & (top+size > rects[:, 1]))
+        if precise:  # 矩形が重なった組だけ円の式でふるう
+            ii, jj = np.nonzero(hit)
+            r = rects[jj]
+            hit[ii, jj] = self._circle_hits(ii, r[:, 0], r[:, 1], r[:, 2], r[:, 3])
+        used = np.zeros(len(sprites), bool)
+        crashed = []
+        for i in np.flatnonzero(hit.any(axis=1)):
+            cols = hit[i] & ~used
+            if precise:
+                for j in np.flatnonzero(cols):
+                    cols[j] = self._mask_hits(i, sprites[j].mask, *sprites[j].rect.topleft)
+            if not cols.any():
+                continue
+            self.alive[i] = False
+            crashed.append(self.rect(i))
+            if dokill:
+                for j in np.flatnonzero(cols):
+                    used[j] = True
+                    sprites[j].kill()
+        return crashed
+
+    def remember(self):
+        """
+        現在の位置を補間描画の始点として覚える
+        """
+        self.prev_left[:self.n] = self.left[:self.n]
+        self.prev_top[:self.n] = self.top[:self.n]
+
+    def rect(self, i: int) -> pg.Rect:
+        size = 2*int(self.rad[i])
+        return pg.Rect(int(self.left[i]), int(self.top[i]), size, size)
+
+    def rects(self) -> list[pg.Rect]:
+        """
+        生きている爆弾のRectのリストを返す
+        """
+        return [self.rect(i) for i in np.flatnonzero(self.alive[:self.n])]
+
+    def draw(self, screen: pg.Surface, alpha: float = 1.0, offset: int = 0,
+             view: pg.Rect = None) -> list[pg.Rect]:
+        """
+        生きている爆弾を共有の円Surfaceでまとめて描画し，描画した範囲のリストを返す
+        引数2 alpha：remember()した位置から現在の位置までのどこに描くか（1.0なら現在の位置）
+        引数3 offset：カメラの位置（ステージの座標から引いて画面の座標にする）
+        引数4 view：指定した場合はこの範囲（ステージの座標）と重なる爆弾だけを描く
+        """
+        alive = self.alive[:self.n]
+        if view is not None:
+            left, size = self.left[:self.n], 2*self.rad[:self.n]
+            alive = alive & (left < view.right) & (left+size > view.left)
+        idx = np.flatnonzero(alive)
+        left, top = self.left[idx] - offset, self.top[idx]
+        if alpha < 1.0:
+            prev_left, prev_top = self.prev_left[idx] - offset, self.prev_top[idx]
+            left = np.rint(prev_left + (left-prev_left)*alpha).astype(np.int64)
+            top = np.rint(prev_top + (top-prev_top)*alpha).astype(np.int64)
+        bank = {}
+        seq = []
+        for rad, color, x, y in zip(self.rad[idx].tolist(), self.color[idx].tolist(),
+                                    left.tolist(), top.tolist()):
+            img = bank.get((rad, color))
+            if img is None:
+                img = bank[rad, color] = ASSETS.circle(rad, Bomb.colors[color])
+            seq.append((img, (x, y)))
+        return screen.blits(seq)
+
+    def __len__(self) -> int:
+        return int(self.alive[:self.n].sum())
+
+
+def launch_bomb(bombs: "pg.sprite.Group|ProjectileEngine", src: pg.sprite.Sprite, bird: "Bird",
+                large: bool = False, center: tuple[int, int] = None, rng: random.Random = random,
+                speed: int = 6):
+    """
+    srcからbirdに向けて爆弾を投下する
+    bombsがProjectileEngineのときはスプライトを作らずに配列へ追加する
+    引数5 center：指定した場合は爆弾の中心をここにする
+    引数6 rng：爆弾の半径と色を決める乱数生成器
+    引数7 speed：爆弾の速さ
+    """
+    if isinstance(bombs, ProjectileEngine):
+        bombs.launch(src.rect, bird.rect, large, center, speed, rng)
+        return
+    bomb = Bomb.acquire(src, bird, large, rng, speed)
+    if center is not None:
+        bomb.rect.center = center
+    bombs.add(bomb)
+
+
+# ボスの弾幕の定義：攻撃名 -> 弾の出し方のリスト（BulletPatternで一度だけ表に変換する）
+# shape："ring"（全方位にcount発），"spread"（angleを中心にarc度の扇にcount発），
+#        "line"（同じ向きにspeedからspeed_stepずつ速さを変えてcount発）
+# angle：向き（度，0が右，90が下），aimがTrueならこうかとんの方向からの角度
+# delay：最初に撃つフレーム，repeat, every：everyフレームおきにrepeat回撃つ，spin：1回ごとに回す角度
+# rad, color：爆弾の半径とBomb.colorsの添字
+BOSS_PATTERNS = {
+    "ring": [{"shape": "ring", "count": 16, "speed": 5, "repeat": 3, "every": 20, "spin": 11.25,
+              "rad": 12, "color": 4}],
+    "spread": [{"shape": "spread", "count": 5, "arc": 60, "speed": 7, "aim": True,
+                "repeat": 4, "every": 15, "rad": 15, "color": 3}],
+    "spiral": [{"shape": "ring", "count": 4, "speed": 4, "repeat": 40, "every": 2, "spin": 13,
+                "rad": 10, "color": 5}],
+    "volley": [{"shape": "line", "count": 5, "speed": 6, "speed_step": 1, "aim": True,
+                "repeat": 3, "every": 25, "rad": 18, "color": 0},
+               {"shape": "ring", "count": 12, "speed": 3, "delay": 75, "rad": 20, "color": 2}],
+}
+
+
+class BulletPattern:
+    """
+    BOSS_PATTERNSの1つの攻撃を，撃つフレーム順に並べた弾の表（速度，半径，色，狙うか）に変換したもの
+    撃つときは1フレーム分の行をまとめて取り出し，こうかとんへの向きの回転も配列演算で行う
+    """
+    def __init__(self, volleys: list[dict]):
+        """
+        引数 volleys：弾の出し方の辞書のリスト（BOSS_PATTERNSの値）
+        """
+        if np is None:
+            raise RuntimeError("BulletPatternにはNumPyが必要です")
+        rows = []  # (フレーム, 角度, 速さ, 半径, 色, 狙うか)
+        for v in volleys:
+            shape, count, aim = v["shape"], v.get("count", 1), v.get("aim", False)
+            for r in range(v.get("repeat", 1)):
+                frame = v.get("delay", 0) + r*v.get("every", 1)
+                base = v.get("angle", 0 if aim else 90) + r*v.get("spin", 0)
+                for i in range(count):
+                    speed = v["speed"]
+                    if shape == "ring":
+                        angle = base + 360*i/count
+                    elif shape == "spread":
+                        arc = v.get("arc", 0)
+                        angle = base - arc/2 + arc*i/(count-1) if count > 1 else base
+                    elif shape == "line":
+                        angle = base
+                        speed += i*v.get("speed_step", 1)
+                    else:
+                        raise ValueError(f"未知の弾の形です: {shape}")
+                    rows.append((frame, angle, speed, v.get("rad", 15), v.get("color", 0), aim))
+        rows.sort(key=lambda row: row[0])
+        frame, angle, speed, rad, color, aim = (np.array(col) for col in zip(*rows))
+        self.frame = frame.astype(np.int64)
+        self.vx = speed * np.cos(np.radians(angle))  # 狙う弾はこうかとんの方向を右とした速度
+        self.vy = speed * np.sin(np.radians(angle))
+        self.rad = rad.astype(np.int64)
+        self.color = color.astype(np.int64)
+        self.aim = aim.astype(bool)
+        self.length = int(self.frame[-1]) + 1  # 攻撃が続くフレーム数
+        self.starts = np.searchsorted(self.frame, np.arange(self.length+1))  # フレーム -> 表の先頭の行
+        self.aimed = np.zeros(self.length, bool)  # そのフレームに狙う弾があるか
+        self.aimed[self.frame[self.aim]] = True
+
+    def volley(self, tick: int, aim: tuple[float, float]) -> tuple["np.ndarray", ...]:
+        """
+        tickフレーム目に撃つ弾の(dx, dy, 半径, 色)の配列を返す
+        引数2 aim：こうかとんへの単位ベクトル（狙う弾の向きの基準）
+        """
+        s = slice(self.starts[tick], self.starts[tick+1])
+        vx, vy, aimed = self.vx[s], self.vy[s], self.aim[s]
+        if self.aimed[tick]:
+            ux, uy = aim
+            vx, vy = np.where(aimed, vx*ux - vy*uy, vx), np.where(aimed, vx*uy + vy*ux, vy)
+        # Bombと同じく1フレームの移動量は小数点以下を切り捨てる
+        return np.trunc(vx).astype(np.int64), np.trunc(vy).astype(np.int64), self.rad[s], self.color[s]
+
+
+PATTERN_TABLES: dict[str, BulletPattern] = {}  # BOSS_PATTERNSを変換した表（最初に使うときに作る）
+
+
+def compile_patterns() -> dict[str, BulletPattern]:
+    """
+    BOSS_PATTERNSを一度だけ表に変換して返す
+    """
+    if not PATTERN_TABLES:
+        PATTERN_TABLES.update((name, BulletPattern(v)) for name, v in BOSS_PATTERNS.items())
+    return PATTERN_TABLES
+
+
+def emit_volley(bombs: "pg.sprite.Group|ProjectileEngine", pattern: BulletPattern, tick: int,
+                src: pg.Rect, bird: "Bird") -> int:
+    """
+    patternのtickフレーム目の弾をsrcの中心からまとめて撃つ
+    bombsがProjectileEngineなら1回の配列追加で済ませる
+    戻り値：撃った弾の数
+    """
+    lo, hi = pattern.starts[tick], pattern.starts[tick+1]
+    if lo == hi:
+        return 0
+    aim = calc_orientation(src, bird.rect) if pattern.aimed[tick] else (1.0, 0.0)
+    dx, dy, rad, color = pattern.volley(tick, aim)
+    if isinstance(bombs, ProjectileEngine):
+        bombs.spawn(src.centerx, src.centery, dx, dy, rad, color)
+    else:
+        bombs.add(*[PatternBomb.acquire(src.center, *row)
+                    for row in zip(dx.tolist(), dy.tolist(), rad.tolist(), color.tolist())])
+    return int(hi - lo)
+
+
+class Flame(Animated, pg.sprite.Sprite):
     """
     Flameクラス：
     ・警告（半透明赤) → 一時的に非表示  → 攻撃（不透明赤） → 消える
     """
-    def __init__(self, x: int):
+    # 状態は警告90，攻撃前30，攻撃120フレーム
+    # 画像は状態が変わった次のフレームで切り替わる（出現直後は透明）
+    animation = Animation(
+        [lambda: ASSETS.fill((40, HEIGHT), (0, 0, 0, 0)),  # 完全に透明
+         lambda: ASSETS.fill((40, HEIGHT), (255, 0, 0, 100)),  # 半透明赤
+         lambda: ASSETS.fill((40, HEIGHT), (255, 0, 0, 255))],  # 不透明赤
+        [(0, 1), (1, 90), (0, 30), (2, 119)],
+        states=[("warning", 90), ("pause", 30), ("attack", 120)])
+
+    def __init__(self, x: int, timers: "TimerWheel"):
+        """
+        引数1 x：炎柱の左端のX座標
+        引数2 timers：コマと状態の切り替えと消滅を予約するタイマーホイール
+        """
         super().__init__()
-        self.image = pg.Surface((40, HEIGHT), pg.SRCALPHA)
+        self.start_animation()
         self.rect = self.image.get_rect()
         self.rect.left = x
         self.rect.top = 0
-        self.mode = "warning"
-        self.warn_timer = 90  # 各状態表示時間
-        self.pause_timer = 30
-        self.attack_timer = 120
+        # 毎フレーム進める代わりに，表が変わるフレームと消えるフレームだけを予約する
+        for tick in self.animation.changes:
+            timers.schedule(tick, self.show, tick)
+        timers.schedule(self.animation.length, self.kill)
 
-    def update(self):
-        if self.mode == "warning":  # 警告状態
-            self.image.fill((255, 0, 0, 100))  # 半透明赤
-            self.warn_timer -= 1
-            if self.warn_timer <= 0:
-                self.mode = "pause"
-
-        elif self.mode == "pause":  #　攻撃前状態
-            self.image.fill((0, 0, 0, 0))  # 完全に透明
-            self.pause_timer -= 1
-            if self.pause_timer <= 0:
-                self.mode = "attack"
-
-        elif self.mode == "attack":  # 攻撃状態
-            self.image.fill((255, 0, 0, 255))  # 不透明赤
-            self.attack_timer -= 1
-            if self.attack_timer <= 0:
-                self.kill()
+    @property
+    def mode(self) -> str:
+        states = self.animation.states
+        return states[min(self.tick, len(states)-1)]
 
     @property
     def active(self):
         return self.mode == "attack"
 
+    @property
+    def mask(self) -> pg.mask.Mask:
+        # 当たり判定は表示中のコマによらず炎柱全体（不透明赤のコマのマスク）
+        return ASSETS.mask(self.animation.image(2))
+
 
-class Beam(pg.sprite.Sprite):  
+class Beam(Pooled, pg.sprite.Sprite):
     """  
     ビームに関するクラス  
     """  
-    def __init__(self, bird: Bird):  
-        """  
-        ビーム画像Surfaceを生成する  
-        引数 bird：ビームを放つこうかとん  
-        """  
-        super().__init__()  
+    def __init__(self, bird: Bird):
+        super().__init__()
+        self.reset(bird)
+
+    def reset(self, bird: Bird):
+        """
+        ビーム画像Surfaceを設定する（プールから再利用するときも呼ばれる）
+        引数 bird：ビームを放つこうかとん
+        """
         self.vx, self.vy = bird.dire  
         angle = math.degrees(math.atan2(-self.vy, self.vx))  
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/beam.png"), angle, 1.0)  
+        self.image = ASSETS.get("fig/beam.png", ("rotozoom", angle, 1.0))
         self.vx = math.cos(math.radians(angle))  
         self.vy = -math.sin(math.radians(angle))  
         self.rect = self.image.get_rect()  
@@ -250,31 +1374,42 @@ class Beam(pg.sprite.Sprite):
         self.rect.centerx = bird.rect.centerx+bird.rect.width*self.vx  
         self.speed = 10  
 
-    def update(self):  
+    def update(self, area: pg.Rect = None):  
         """  
         ビームを速度ベクトルself.vx, self.vyに基づき移動させる  
-        引数 screen：画面Surface  
+        引数 area：この範囲から出たら消える（省略時は画面）
         """  
         self.rect.move_ip(self.speed*self.vx, self.speed*self.vy)  
-        if check_bound(self.rect) != (True, True):  
+        if check_bound(self.rect, area) != (True, True):  
             self.kill()  
 
+    @property
+    def mask(self) -> pg.mask.Mask:
+        return ASSETS.mask(self.image)  # 精密な衝突判定用（画像ごとに一度だけ作る）
+
 
-class Explosion(pg.sprite.Sprite):  
+class Explosion(Pooled, Animated, pg.sprite.Sprite):
     """  
     爆発に関するクラス  
     """  
-    def __init__(self, obj: "Bomb|Enemy", life: int):  
-        """  
-        爆弾が爆発するエフェクトを生成する  
-        引数1 obj：爆発するBombまたは敵機インスタンス  
-        引数2 life：爆発時間  
-        """  
-        super().__init__()  
-        img = pg.image.load(f"fig/explosion.gif")  
-        self.imgs = [img, pg.transform.flip(img, 1, 1)]  
-        self.image = self.imgs[0]  
-        self.rect = self.image.get_rect(center=obj.rect.center)  
+    # 残り時間lifeの10フレームごとに，元画像と反転画像を交互に表示する
+    animation = Animation([lambda: ASSETS.load("fig/explosion.gif"),
+                           lambda: ASSETS.get("fig/explosion.gif", ("flip", 1, 1))],
+                          [(0, 10), (1, 10)], loop=True)
+
+    def __init__(self, obj: "Bomb|Enemy|pg.Rect", life: int):
+        super().__init__()
+        self.reset(obj, life)
+
+    def reset(self, obj: "Bomb|Enemy|pg.Rect", life: int):
+        """
+        爆弾が爆発するエフェクトを設定する（プールから再利用するときも呼ばれる）
+        引数1 obj：爆発するBombまたは敵機インスタンス（ProjectileEngineの爆弾はRect）
+        引数2 life：爆発時間
+        """
+        self.start_animation(life, shown=0)
+        rect = obj if isinstance(obj, pg.Rect) else obj.rect
+        self.rect = self.image.get_rect(center=rect.center)
         self.life = life  
 
     def update(self):  
@@ -283,55 +1418,86 @@ class Explosion(pg.sprite.Sprite):
         爆発エフェクトを表現する  
         """  
         self.life -= 1  
-        self.image = self.imgs[self.life//10%2]  
+        self.show(self.life)
         if self.life < 0:  
             self.kill()  
 
-    
-class Enemy(pg.sprite.Sprite):
+
+Bomb.pool = SpritePool(Bomb)
+PatternBomb.pool = SpritePool(PatternBomb)
+Beam.pool = SpritePool(Beam)
+Explosion.pool = SpritePool(Explosion)
+
+
+def pool_stats() -> dict[str, dict[str, float]]:
     """
-    敵機に関するクラス
-    地面に接地した状態で画面右側から出現
+    各プールの保管数，生成数，再利用数，再利用率を返す
     """
-    enemy_imgs = [
-        pg.image.load(f"fig/devil1.png"),
-        pg.image.load(f"fig/devil4.png")
-    ]
-    imgs = [
-        pg.transform.scale(img, (int(img.get_width() * 0.3), int(img.get_height() * 0.3)))
-        for img in enemy_imgs
-    ]
+    return {cls.__name__: cls.pool.stats() for cls in (Bomb, PatternBomb, Beam, Explosion)}
 
-    def __init__(self):
-        super().__init__()
-        self.image = random.choice(Enemy.imgs)
+
+def prerender_bomb_bank():
+    """
+    爆弾の全ての半径（10〜50と大砲用の70）と色の組み合わせを描画しておく
+    """
+    for rad in [*range(10, 51), 70]:
+        for color in Bomb.colors:
+            ASSETS.circle(rad, color)
+
+    
+class Enemy(Animated, pg.sprite.Sprite):
+    """
+    敵機に関するクラス
+    地面に接地した状態で画面右側から出現
+    """
+    img_files = ["fig/devil1.png", "fig/devil4.png"]
+    # 15フレームごとに2枚の画像を交互に表示する
+    animation = Animation([lambda path=path: ASSETS.get(path, ("scale_by", 0.3)) for path in img_files],
+                          [(0, 15), (1, 15)], loop=True)
+
+    def __init__(self, rng: random.Random = random, origin: int = 0):
+        """
+        引数1 rng：画像，停止位置，爆弾投下間隔を決める乱数生成器
+        引数2 origin：カメラの位置（画面の左端のステージ上のX座標）
+        """
+        super().__init__()
+        self.start_animation(shown=rng.choice(range(len(Enemy.img_files))))  # 最初の画像はランダム
         self.rect = self.image.get_rect()
 
         # 画面右端から出現、地面と接地
-        self.rect.right = WIDTH
+        self.rect.right = origin + WIDTH
         self.rect.bottom = GROUND_Y
 
         self.vx, self.vy = -5, 0  # 左向きに移動（右から左へ）
-        self.target_x = random.randint(WIDTH // 2, WIDTH - 100)  # 停止するX座標
+        self.target_x = origin + rng.randint(WIDTH // 2, WIDTH - 100)  # 停止するX座標
         self.state = "move"  # 移動中か停止中かの状態
-        self.interval = random.randint(50, 300)  # 爆弾投下間隔
+        self.interval = rng.randint(50, 300)  # 爆弾投下間隔
         self.frame = 0
+        self.on_stop = None  # 停止したときに呼ぶ関数（GameWorldが設定する）
+        self.drop_timer = None  # 次の爆弾投下の予約
+        self.order = 0  # 敵機グループに加えられた順番（同じフレームの投下順）
 
     def update(self):
         self.frame += 1
 
-        # アニメーション
-        old_pos = self.rect.topleft  # 現在の位置を保持
-        self.image = Enemy.imgs[(self.frame // 15) % 2]
-        self.rect = self.image.get_rect(topleft=old_pos)  # 同じ位置に画像を差し替え
+        # アニメーション（画像が変わったときだけ同じ位置で矩形を作り直す）
+        if self.show(self.frame):
+            self.rect = self.image.get_rect(topleft=self.rect.topleft)
 
         # 停止条件
         if self.rect.left <= self.target_x:
             self.vx = 0
-            self.state = "stop"
+            if self.state != "stop":
+                self.state = "stop"
+                if self.on_stop is not None:
+                    self.on_stop(self)  # 爆弾投下の予約を始めてもらう
 
         self.rect.move_ip(self.vx, self.vy)
 
+    @property
+    def mask(self) -> pg.mask.Mask:
+        return ASSETS.mask(self.image)  # 精密な衝突判定用（画像ごとに一度だけ作る）
+
 
 
 class Result:
@@ -363,16 +1529,14 @@ class Result:
             # ゲームオーバー時に，こうかとん画像を切り替え，5秒間表示させる
             bird.change_img(8, screen)
             #ゲームオーバー文字列を表示。フォントを怖いのにする
-            fonto = pg.font.SysFont("hg正楷書体pro",200)
+            fonto = ("hg正楷書体pro", 200, True)
 
             # fonto = pg.font.Font(None, 80)
-            txt1 = fonto.render("Score:"+str(score.value), True, (255, 0, 0))
-            txt2 = fonto.render("Game Over", True, (255, 0, 0))
+            txt1 = TEXT.render("Score:"+str(score.value), (255, 0, 0), *fonto)
+            txt2 = TEXT.render("Game Over", (255, 0, 0), *fonto)
             screen.blit(txt1, [WIDTH//2-450, HEIGHT//2])
             screen.blit(txt2, [WIDTH//2-550, HEIGHT//2-200])
-            pg.display.update()
-            time.sleep(5)  #5秒間主人公泣いてる result用。
-            return True
+            return True  # 5秒間の表示はResultSceneが行う
         
         
 
@@ -381,7 +1545,7 @@ class Result:
             #　ボス撃破時に,主人公画像を切り替え、5秒間表示させる
             bird.change_img(6, screen)
             #勝利文字列を表示するためにフォントをかっこいいのにする
-            fonto = pg.font.SysFont("AdobeGothicStdKalin",200)
+            fonto = ("AdobeGothicStdKalin", 200, True)
 
 
             #一行で勝利後の結果を表示する場合
@@ -390,16 +1554,13 @@ class Result:
         
 
             #3行使って勝利後の結果を表示する場合。
-            txt1 =fonto.render("Congratulations", True, (255, 255, 0))
-            txt2 = fonto.render("You win!! " ,True, (255, 255, 0))
-            txt3 = fonto.render("Yourscore :  "+str(score.value),True, (255, 255, 0))
+            txt1 = TEXT.render("Congratulations", (255, 255, 0), *fonto)
+            txt2 = TEXT.render("You win!! ", (255, 255, 0), *fonto)
+            txt3 = TEXT.render("Yourscore :  "+str(score.value), (255, 255, 0), *fonto)
             screen.blit(txt1, [WIDTH//2-550, HEIGHT//2-100])
             screen.blit(txt2, [WIDTH//2-550, HEIGHT//2+50])
             screen.blit(txt3, [WIDTH//2-550, HEIGHT//2+200])
-
-            pg.display.update()
-            time.sleep(5)  #5秒間主人公喜んでる result
-            return True
+            return True  # 5秒間の表示はResultSceneが行う
         else:
             return False
         
@@ -408,81 +1569,125 @@ class Boss(pg.sprite.Sprite):
     """
     ボスキャラクターのクラス。
     """
-    def __init__(self):
+    def __init__(self, rng: random.Random = random, maxhp: int = 50, bomb_speed: int = 6, origin: int = 0,
+                 timers: "TimerWheel|None" = None, patterns: "dict[str, BulletPattern]|None" = None):
+        """
+        引数1 rng：攻撃パターンや炎柱の位置を決める乱数生成器
+        引数2 maxhp：ボスの最大HP
+        引数3 bomb_speed：ボスが投げる爆弾の速さ
+        引数4 origin：ボス戦の画面の左端のステージ上のX座標
+        引数5 timers：攻撃までの待ち時間などを予約するタイマーホイール
+        引数6 patterns：3種の攻撃に加えて使う弾幕（攻撃名 -> BulletPattern）
+        """
         super().__init__()
-        self.image = pg.transform.rotozoom(pg.image.load("fig/BOSS.png"), 0, 0.2)
-        self.rect = self.image.get_rect(center=(WIDTH//2, -100))
-        self.maxhp = 50  # ボスHP
+        self.rng = rng
+        self.timers = TimerWheel() if timers is None else timers
+        self.ready = set()  # 待ち時間が終わった合図（"attack"，"bomb"，"flame"）
+        self.patterns = patterns or {}
+        self.pattern_tick = 0  # 弾幕を撃ち始めてからのフレーム数
+        self.waits = []  # 待っている予約
+        self.bomb_speed = bomb_speed
+        self.origin = origin
+        self.image = ASSETS.get("fig/BOSS.png", ("rotozoom", 0, 0.2))
+        self.rect = self.image.get_rect(center=(origin + WIDTH//2, -100))
+        self.maxhp = maxhp  # ボスHP
         self.hp = self.maxhp
-        self.attack_timer = 0
         self.state = "enter"  # 画面外から登場。初期状態
-        self.attack_pattern = random.choice(["bombing", "flame", "cannon"])  # ボスの攻撃パターん
+        self.attack_pattern = rng.choice(["bombing", "flame", "cannon"])  # ボスの攻撃パターん
         self.direction = 1  # 横移動方向
-        self.bomb_cooldown = 0  # 爆弾のタイマー
-        self.flame_timer = 0
         self.flame = []  # flameの攻撃座標リスト
         self.ascending = True  # boming攻撃上昇中か確認
         self.repeat_bomb= 0
 
-    def update(self, bird: Bird, bombs: pg.sprite.Group, flames: pg.sprite.Group):
+    def update(self, bird: Bird, bombs: "pg.sprite.Group|ProjectileEngine", flames: pg.sprite.Group):
         if self.state == "enter":
-            if self.rect.right <= WIDTH:
-                self.rect.center = (WIDTH - 100, HEIGHT // 2 + 50)  # 画面右側座標
+            if self.rect.right <= self.origin + WIDTH:
+                self.rect.center = (self.origin + WIDTH - 100, HEIGHT // 2 + 50)  # 画面右側座標
                 self.state = "idle"
+                self.wait(101, "attack")
         elif self.state == "idle":  # 攻撃のクールダウン
-            self.attack_timer += 1
-            if self.attack_timer > 100:  # idle移行後100フレームたったら
-                self.attack_pattern = random.choice(["bombing", "flame", "cannon", "flame", "flame","bombing"])  # ３種の攻撃からランダムに選択
-                self.attack_timer = 0
-                self.bomb_cooldown = 0
-                self.state = self.attack_pattern
+            if "attack" in self.ready:  # idle移行後100フレームたったら
+                self.start_attack(self.rng.choice(["bombing", "flame", "cannon", "flame", "flame","bombing"]
+                                                  + list(self.patterns)))  # ３種の攻撃（と弾幕）からランダムに選択
         elif self.state == "bombing":  # 一定上昇後、横移動しながら一定間隔でbombを落とす
             if self.ascending:  # 上昇
                 self.rect.centery -= 2
                 if self.rect.centery < HEIGHT // 4:
                     self.ascending = False
+                    self.wait(1, "bomb")  # 次のフレームから投下を始める
             else:
-                if self.bomb_cooldown % 50 == 0 and self.repeat_bomb < 10:  # 50フレームごとに爆弾
-                    bombs.add(Bomb(self, bird))
+                if "bomb" in self.ready and self.repeat_bomb < 10:  # 50フレームごとに爆弾
+                    self.ready.discard("bomb")
+                    launch_bomb(bombs, self, bird, rng=self.rng, speed=self.bomb_speed)
                     self.repeat_bomb += 1
-                self.bomb_cooldown += 1
+                    if self.repeat_bomb < 10:
+                        self.wait(50, "bomb")
                 self.rect.move_ip(-4 * self.direction, 0)
-                if self.rect.left <= 0 or self.rect.right >= WIDTH:  # 左端に届いたら元に戻る
+                if self.rect.left <= self.origin or self.rect.right >= self.origin + WIDTH:  # 左端に届いたら元に戻る
                     self.direction *= -1
                 if self.repeat_bomb >= 10:
                     self.state = "return"
         elif self.state == "flame":  # ３か所に警告後数秒後にflameクラスの攻撃
             if not self.flame:
                 for _ in range(6):
-                    x = random.randint(0, WIDTH - 20)
+                    x = self.origin + self.rng.randint(0, WIDTH - 20)
                     self.flame.append(x)  #　ランダムなx座標を選択リストに追加
-                self.flame_warn_timer = 60  #　警告時間
-            elif self.flame_warn_timer > 0:
-                self.flame_warn_timer -= 1
-            else:
+                self.wait(61, "flame")  #　警告時間
+            elif "flame" in self.ready:
+                self.ready.discard("flame")
                 for x in self.flame:
-                    flames.add(Flame(x))
+                    flames.add(Flame(x, self.timers))
                 self.state = "return"
         elif self.state == "cannon":  # 大きなbombをプレイヤー方向に１つ発射
-            b = Bomb(self, bird, large = True)  # 爆弾サイズをTrueの攻撃だけ固定化
-            b.rect.center = (self.rect.centerx, self.rect.centery)
-            bombs.add(b)
+            launch_bomb(bombs, self, bird, large=True, center=self.rect.center, rng=self.rng, speed=self.bomb_speed)  # 爆弾サイズをTrueの攻撃だけ固定化
             self.state = "return"
+        elif self.state in self.patterns:  # 弾幕の表に従ってまとめて撃つ
+            pattern = self.patterns[self.state]
+            emit_volley(bombs, pattern, self.pattern_tick, self.rect, bird)
+            self.pattern_tick += 1
+            if self.pattern_tick >= pattern.length:
+                self.state = "return"
         elif self.state == "return":  # 初期位置に戻る
-            self.rect.center = (WIDTH - 100,HEIGHT // 2 + 50)
+            self.rect.center = (self.origin + WIDTH - 100,HEIGHT // 2 + 50)
             self.state = "idle"  #　攻撃大気に移行
+            self.wait(101, "attack")
             self.flame = []  #　攻撃座標のリセット
             self.ascending = True  # 上昇状態を初期化
             self.repeat_bomb = 0  # boming攻撃のリセット
 
-    def draw_hp(self, screen):  # bossのhp表記
+    def start_attack(self, pattern: str):
+        """
+        攻撃を始める
+        引数 pattern："bombing"，"flame"，"cannon"またはpatternsの攻撃名
+        """
+        self.attack_pattern = pattern
+        self.pattern_tick = 0
+        for timer in self.waits:  # 前の待ち時間は捨てる
+            timer.cancel()
+        self.waits = []
+        self.ready.clear()
+        self.state = pattern
+
+    def wait(self, frames: int, name: str):
+        """
+        framesフレーム後の更新でreadyに合図nameが入るよう予約する
+        """
+        self.waits = [timer for timer in self.waits if not timer.cancelled]
+        self.waits.append(self.timers.schedule(frames, self.ready.add, name))
+
+    @property
+    def mask(self) -> pg.mask.Mask:
+        return ASSETS.mask(self.image)  # 精密な衝突判定用（画像ごとに一度だけ作る）
+
+    def draw_hp(self, screen) -> pg.Rect:  # bossのhp表記
         bar_width = 400  # 横幅
         hp = self.hp / self.maxhp
-        pg.draw.rect(screen, (0, 0, 0),(298, 8, bar_width+4, 24))  #黒い枠
-        pg.draw.rect(screen, (255, 0, 0), (300, 10, bar_width*hp, 20))
-        font = pg.font.Font(None, 36)
-        label = font.render("BOSS", True, (255, 0, 0))
-        screen.blit(label, ( 220, 10))
+        frame = screen.fill((0, 0, 0), (298, 8, bar_width+4, 24))  #黒い枠（TextureCanvasにも描けるようfillで塗る）
+        bar = pg.Rect(300, 10, bar_width*hp, 20)
+        if bar.w > 0:
+            screen.fill((255, 0, 0), bar)
+        label = TEXT.render("BOSS", (255, 0, 0), None, 36)
+        return frame.union(screen.blit(label, ( 220, 10)))  # 描画した範囲
 
 
 class HP:
@@ -490,26 +1695,26 @@ class HP:
     プレイヤーのHPを管理するクラス
     """
     def __init__(self, font_path:str):
-        self.font = pg.font.Font(font_path, 50)
+        self.font = TEXT.font(font_path, 50)
         self.color = (255, 0, 0)
+        self.label = TEXT.render("HP", self.color, font_path, 50)  # 変わらないので一度だけ描画する
         self.max_life = 3
         self.current_life = self.max_life
-        self.heart_image = pg.image.load("fig/color_heart2.png")
-        self.no_heart_image = pg.image.load("fig/no_heart1.png")
-        self.heart_image = pg.transform.scale(self.heart_image, (40, 40))  # ハートのサイズを30x30に変更
-        self.no_heart_image = pg.transform.scale(self.no_heart_image, (40, 40)) # ハートのサイズを30x30に変更
+        self.heart_image = ASSETS.get("fig/color_heart2.png", ("scale", 40, 40))  # ハートのサイズを40x40に変更
+        self.no_heart_image = ASSETS.get("fig/no_heart1.png", ("scale", 40, 40)) # ハートのサイズを40x40に変更
         self.rects = [self.heart_image for _ in range(self.max_life)]
 
-    def update(self, screen:pg.Surface):
+    def update(self, screen:pg.Surface) -> pg.Rect:
         """
         HPを画面に描画する
+        戻り値：描画した範囲
         """
-        hp_text = self.font.render("HP", True, self.color)
-        screen.blit(hp_text, (WIDTH - 250, 20)) # HPテキストの位置
+        drawn = screen.blit(self.label, (WIDTH - 250, 20)) # HPテキストの位置
         for i in range(self.max_life):
             heart_rect = self.rects[i].get_rect()
             heart_rect.topleft = (WIDTH - 170 + i * 50, 30) # ハートの位置
-            screen.blit(self.rects[i], heart_rect)
+            drawn.union_ip(screen.blit(self.rects[i], heart_rect))
+        return drawn
 
     def hit(self):
         """
@@ -534,197 +1739,2059 @@ class Score:
     敵機：10点
     """
     def __init__(self):
-        self.font = pg.font.Font(None, 50)
+        self.font = TEXT.font(None, 50)
         self.color = (0, 0, 255)
         self.value = 0
-        self.image = self.font.render(f"Score: {self.value}", 0, self.color)
+        self.shown = self.value  # 描画済みのスコア
+        self.image = TEXT.render(f"Score: {self.value}", self.color, None, 50, antialias=False)
         self.rect = self.image.get_rect()
         self.rect.center = 100, HEIGHT-50
 
-    def update(self, screen: pg.Surface):  
-        self.image = self.font.render(f"Score: {self.value}", 0, self.color)  
-        screen.blit(self.image, self.rect)  
+    def update(self, screen: pg.Surface) -> pg.Rect:
+        if self.value != self.shown:  # スコアが変わったときだけ描画し直す
+            self.shown = self.value
+            self.image = TEXT.render(f"Score: {self.value}", self.color, None, 50, antialias=False)
+        return screen.blit(self.image, self.rect)  # 描画した範囲
 
 
-def main():
-    pg.display.set_caption("HeroShooter")
-    screen = pg.display.set_mode((WIDTH, HEIGHT))
-    bg_img = pg.transform.rotozoom(pg.image.load(f"fig/22823124.jpg"),0, 1.1)
-    screen.blit(bg_img, [0, 0])
-    score = Score()
-    hp = HP("disturbed-zrrgd.ttf") # HPクラスのインスタンスを作成
-   
-
-
-    bird = Bird(3, (100, GROUND_Y - 50))
-    boss = Boss()
-    # 編集必須
-    result = Result(player_hp=1, boss_hp=boss.hp)
-
-    bombs = pg.sprite.Group()
-    beams = pg.sprite.Group()
-    exps = pg.sprite.Group()
-    emys = pg.sprite.Group()
-    bosses = pg.sprite.Group()
-    flames = pg.sprite.Group()
-
-    #仮です。result画面用です。
-     #ゲームオーバー画面用画像の追加(簡単に呼び出せるように)
-    # crying_kk_img = pg.image.load("fig/8.png")
-    
-    # screen.blit(crying_kk_img, [300, 200])
-    #仮です。result画面用です。
-    
-    tmr = 0
-    clock = pg.time.Clock()
-    boss_mode = False
-    boss_spawned = False
-     
-
-    # スタート画面
-    start_font = pg.font.Font(None, 100)
-    start_text = start_font.render("Press SPACE to Start", True, (0,0, 0))
-    start_text_rect = start_text.get_rect(center=(WIDTH/2, HEIGHT/2))
-
-
-   
-    game_active = False
-
-    while True:
-        key_lst = pg.key.get_pressed()
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                return 0
-            if event.type == pg.KEYDOWN:
-                if not game_active: # ゲームがまだ開始されていない場合
-                    if event.key == pg.K_SPACE:
-                        game_active = True # スペースキーでゲーム開始
-                else: # ゲームが開始されている場合
-                    if event.key == pg.K_SPACE:
-                        beams.add(Beam(bird))
-                    if event.key == pg.K_SPACE:
-                        beams.add(Beam(bird))
-                    if event.key == pg.K_UP:
-                        bird.jump_requested = True  #ジャンプリクエストは押された瞬間のみ
-                    if event.key == pg.K_RETURN:  # エンターキーが押されたら
-                    # スコアが100以上、かつ無敵状態ではない場合のみ発動
-                        if score.value >= 100 and not bird.is_invincible:
-                            score.value -= 100  # 100ポイント消費
-                            bird.is_invincible = True  # 無敵状態にする
-                            bird.invincible_timer = 300 # 無敵時間を300フレームに設定 (約6秒)
-                    
-
-        screen.blit(bg_img, [0, 0])
-
-        if not game_active:
-            screen.blit(start_text, start_text_rect)
-            pg.display.update()
-            continue # ゲームが開始されていない間はメインループの残りの処理をスキップ
-        
-        if tmr == 1000 and not boss_spawned:  # tmrフレーム後に赤い警告をだし、ボス登場
-            red_overlay = pg.Surface((WIDTH, HEIGHT), pg.SRCALPHA)
-            red_overlay.fill((255, 0, 0, 100))  #赤画面
-            bg_img = pg.transform.rotozoom(pg.image.load(f"fig/22828803.jpg"),0, 1.1)  # 背景の切り替え
-            for _ in range(10):
-                screen.blit(bg_img, [0, 0])
-                screen.blit(red_overlay, [0, 0])
-                pg.display.update()
-                time.sleep(0.1)
-            emys.empty()
-            boss = Boss()
-            bosses.add(boss)
-            boss_mode = True
-            boss_spawned = True
-        
-        if tmr%200 == 0 and not boss_mode:
-                emys.add(Enemy())
-        
-        if tmr%200 == 0:
-            emys.add(Enemy())
+class SpatialHash:
+    """
+    一様グリッドによる衝突判定の絞り込み（ブロードフェーズ）を行うクラス
+    スプライトごとに占有しているセル範囲を覚えておき，
+    sync()ではセル範囲が変わったスプライトだけを付け替える
+    """
+    def __init__(self, cell: int = 64):
+        """
+        引数 cell：セル1辺の長さ（ピクセル）
+        """
+        self.cell = cell
+        self.cells: dict[tuple[int, int], set[pg.sprite.Sprite]] = {}  # セル座標 -> スプライト集合
+        self.spans: dict[pg.sprite.Sprite, tuple[int, int, int, int]] = {}  # スプライト -> 占有セル範囲
+        self.group = None
+
+    def _span(self, rect: pg.Rect) -> tuple[int, int, int, int]:
+        c = self.cell
+        return (rect.left//c, rect.top//c,
+                max(rect.right-1, rect.left)//c, max(rect.bottom-1, rect.top)//c)
+
+    def _link(self, sprite: pg.sprite.Sprite, span: tuple[int, int, int, int]):
+        x0, y0, x1, y1 = span
+        for cx in range(x0, x1+1):
+            for cy in range(y0, y1+1):
+                bucket = self.cells.get((cx, cy))
+                if bucket is None:
+                    bucket = self.cells[cx, cy] = set()
+                bucket.add(sprite)
+
+    def _unlink(self, sprite: pg.sprite.Sprite, span: tuple[int, int, int, int]):
+        x0, y0, x1, y1 = span
+        for cx in range(x0, x1+1):
+            for cy in range(y0, y1+1):
+                bucket = self.cells[cx, cy]
+                bucket.discard(sprite)
+                if not bucket:
+                    del self.cells[cx, cy]
+
+    def sync(self, group: pg.sprite.AbstractGroup):
+        """
+        グリッドの内容をgroupの現在の状態に合わせる
+        移動してセル範囲が変わったもの，追加・削除されたものだけを処理する
+        """
+        self.group = group
+        spans = self.spans
+        for sprite in [s for s in spans if s not in group]:
+            self._unlink(sprite, spans.pop(sprite))
+        for sprite in group:
+            span = self._span(sprite.rect)
+            old = spans.get(sprite)
+            if old != span:
+                if old is not None:
+                    self._unlink(sprite, old)
+                self._link(sprite, span)
+                spans[sprite] = span
+
+    def query(self, rect: pg.Rect) -> list[pg.sprite.Sprite]:
+        """
+        rectと重なっている，グループに所属中のスプライトのリストを返す
+        """
+        x0, y0, x1, y1 = self._span(rect)
+        cells = self.cells
+        members = self.group.spritedict  # Group.__contains__より速い所属判定
+        if x0 == x1 and y0 == y1:  # 1セルに収まる場合は重複除去が要らない
+            found = cells.get((x0, y0), ())
+        else:
+            found = set()
+            for cx in range(x0, x1+1):
+                for cy in range(y0, y1+1):
+                    bucket = cells.get((cx, cy))
+                    if bucket:
+                        found.update(bucket)
+        colliderect = rect.colliderect
+        return [s for s in found if s in members and colliderect(s.rect)]
+
+
+def grid_spritecollide(sprite: pg.sprite.Sprite, group: pg.sprite.AbstractGroup,
+                       grid: SpatialHash, dokill: bool, collided=None) -> list[pg.sprite.Sprite]:
+    """
+    pg.sprite.spritecollideと同じ結果をSpatialHash経由で求める
+    引数3 grid：groupでsync()済みのSpatialHash
+    引数5 collided：rectが重なったものをさらに絞り込む判定関数（collide_preciseなど）
+    """
+    hits = grid.query(sprite.rect)
+    if collided is not None and hits:
+        hits = [s for s in hits if collided(sprite, s)]
+    if dokill:
+        for s in hits:
+            s.kill()
+    return hits
 
-        for emy in emys:  
-            if emy.state == "stop" and tmr%emy.interval == 0:  
-                # 敵機が停止状態に入ったら，intervalに応じて爆弾投下  
-                bombs.add(Bomb(emy, bird))  
 
-        for emy in pg.sprite.groupcollide(emys, beams, True, True).keys():  # ビームと衝突した敵機リスト  
-            exps.add(Explosion(emy, 100))  # 爆発エフェクト  
-            score.value += 10  # 10点アップ  
-            bird.change_img(6, screen)  # こうかとん喜びエフェクト 
+def grid_groupcollide(groupa: pg.sprite.AbstractGroup, groupb: pg.sprite.AbstractGroup,
+                      grid: SpatialHash, dokilla: bool, dokillb: bool, collided=None) -> dict:
+    """
+    pg.sprite.groupcollideと同じ結果をSpatialHash経由で求める
+    groupaは所属順に処理するため，dokillbで先に消されたものが後の判定に残らない点も同じ
+    引数3 grid：groupbでsync()済みのSpatialHash
+    引数6 collided：rectが重なったものをさらに絞り込む判定関数（collide_preciseなど）
+    """
+    crashed = {}
+    for a in groupa.sprites():
+        hits = grid_spritecollide(a, groupb, grid, dokillb, collided)
+        if hits:
+            crashed[a] = hits
+            if dokilla:
+                a.kill()
+    return crashed
+
 
-        for bomb in pg.sprite.groupcollide(bombs, beams, True, True).keys():  # ビームと衝突した爆弾リスト  
-            exps.add(Explosion(bomb, 50))  # 爆発エフェクト  
-            score.value += 1  # 1点アップ  
+def circle_hits_rect(center: tuple[int, int], rad: int, rect: pg.Rect) -> bool:
+    """
+    中心center，半径radの円とrectが重なるかを式で判定する
+    """
+    cx, cy = center
+    dx = cx - min(max(cx, rect.left), rect.right)  # 円の中心からrectの最も近い点まで
+    dy = cy - min(max(cy, rect.top), rect.bottom)
+    return dx*dx + dy*dy <= rad*rad
 
-        for bomb in pg.sprite.spritecollide(bird, bombs, True):  # こうかとんと衝突した爆弾リスト
-            if not bird.is_invincible:  # 無敵中じゃなかったら
-                bird.change_img(8, screen)  # こうかとん悲しみエフェクト
-                hp.hit()# HPを減少させる
 
-            # ここで時間を短縮
-            pg.display.update()
-            hp.draw(screen)
-            score.update(screen)
-
-            if hp.current_life <= 0:
-                if result.update(screen, bird, score, player_hp=0, boss_hp=boss.hp):
-                    return # HPが0になったらゲームオーバー
-
-        # こうかとんと爆弾の衝突判定
-        if not bird.is_invincible:  # 無敵状態でない場合のみ衝突判定を行う
-            for bomb in pg.sprite.spritecollide(bird, bombs, True):  # こうかとんと衝突した爆弾リスト  
-                bird.change_img(8, screen)  # こうかとん悲しみエフェクト  
-                score.update(screen)  
-                pg.display.update()  
-                time.sleep(2)  
-                return  
-
-        for flame in flames:  # 炎柱攻撃との衝突判定
-            if flame.active and bird.rect.colliderect(flame.rect):
-                if not bird.is_invincible:  #　無敵中じゃなかったら
-                    bird.change_img(8, screen)
-                    hp.hit()
-                    pg.display.update()
-                    time.sleep(1)
-                    if hp.current_life <= 0:
-                        if result.update(screen, bird, score, player_hp=0, boss_hp=boss.hp):
-                            return
-    
-        for boss in pg.sprite.groupcollide(bosses, beams, False, True):  #ビームがボスに当たる処理
+def collide_precise(a: pg.sprite.Sprite, b: pg.sprite.Sprite) -> bool:
+    """
+    rectが重なったa, bを画像の形で判定する（grid_spritecollideなどのcollidedに渡す）
+    爆弾は先に円と矩形の式でふるい，残ったものだけ画像ごとに一度だけ作ったマスクを重ねる
+    """
+    for bomb, other in ((a, b), (b, a)):
+        if isinstance(bomb, Bomb) and not circle_hits_rect(bomb.rect.center, bomb.rect.width//2, other.rect):
+            return False
+    return a.mask.overlap(b.mask, (b.rect.x - a.rect.x, b.rect.y - a.rect.y)) is not None
+
+
+def lerp_pos(rect: pg.Rect, prev: "tuple[int, int]|None", alpha: float) -> "pg.Rect|tuple[int, int]":
+    """
+    前のシミュレーション時点の位置prevからrectまでを割合alphaで補間した描画位置を返す
+    prevがない（新しく出た）ときや，ワープのように大きく動いたときは現在の位置を返す
+    """
+    if prev is None:
+        return rect
+    dx, dy = rect.x - prev[0], rect.y - prev[1]
+    if abs(dx) > LERP_LIMIT or abs(dy) > LERP_LIMIT:
+        return rect
+    return round(prev[0] + dx*alpha), round(prev[1] + dy*alpha)
+
+
+LERP_LIMIT = 64  # 1回のシミュレーションでこれより大きく動いたものは補間しない
+
+
+def draw_group(screen: pg.Surface, group: "pg.sprite.AbstractGroup|ProjectileEngine",
+               prev: dict = None, alpha: float = 1.0, offset: int = 0, view: pg.Rect = None) -> list[pg.Rect]:
+    """
+    グループを描画し，描画した範囲のリストを返す（pg.sprite.Group.drawは範囲を返さないため）
+    引数3 prev：スプライト -> 前のシミュレーション時点の左上座標（補間描画用）
+    引数4 alpha：前の位置から現在の位置までのどこに描くか（1.0なら現在の位置）
+    引数5 offset：カメラの位置（ステージの座標から引いて画面の座標にする）
+    引数6 view：指定した場合はこの範囲（ステージの座標）と重なるスプライトだけを描く
+    """
+    if isinstance(group, ProjectileEngine):
+        return group.draw(screen, alpha, offset, view)
+    if prev is None or alpha >= 1.0:
+        if not offset and view is None:
+            return screen.blits([(s.image, s.rect) for s in group])
+        prev = {}
+    seq = []
+    for s in group:
+        if view is not None and not view.colliderect(s.rect):
+            continue
+        pos = lerp_pos(s.rect, prev.get(s), alpha)
+        seq.append((s.image, (pos[0] - offset, pos[1])))
+    return screen.blits(seq)
+
+
+class Camera:
+    """
+    横に長いステージのどこを画面に映すかを表すクラス
+    スプライトの座標はすべてステージ上の座標で，画面へはXからカメラの位置xを引いて描く
+    有効範囲（画面の左右にmarginを足した範囲）の外にあるものは更新も描画もしない
+    """
+    def __init__(self, stage: pg.Rect, margin: int = 200):
+        """
+        引数1 stage：ステージ全体の範囲
+        引数2 margin：画面の左右に足す有効範囲の幅
+        """
+        self.stage = stage
+        self.margin = margin
+        self.x = stage.left  # 画面の左端のステージ上のX座標
+        self.prev_x = self.x  # remember()した時点の位置（補間描画用）
+        self.locked = False  # Trueならこうかとんを追わない（ボス戦）
+
+    def follow(self, rect: pg.Rect):
+        """
+        rectが画面の中央に来るように動く（ステージの端では止まる）
+        """
+        if not self.locked:
+            self.x = max(self.stage.left, min(rect.centerx - WIDTH//2, self.stage.right - WIDTH))
+
+    def remember(self):
+        self.prev_x = self.x
+
+    def offset(self, alpha: float = 1.0) -> int:
+        """
+        描画に使うカメラの位置（remember()した位置から割合alphaだけ進めた位置）
+        """
+        return round(self.prev_x + (self.x - self.prev_x)*alpha)
+
+    @property
+    def view(self) -> pg.Rect:
+        return pg.Rect(self.x, 0, WIDTH, HEIGHT)
+
+    @property
+    def active(self) -> pg.Rect:
+        return pg.Rect(self.x - self.margin, 0, WIDTH + 2*self.margin, HEIGHT)
+
+
+class TiledBackground:
+    """
+    背景画像を縦長の短冊（タイル）に切り分けて持ち，カメラの位置に応じて必要なタイルだけを描くクラス
+    ステージが画像より長いときは画像を横に繰り返す
+    """
+    tile_width = 256
+
+    def __init__(self, img: pg.Surface):
+        self.img = img
+        self.period = img.get_width()  # 繰り返しの周期
+        self.starts = list(range(0, self.period, self.tile_width))  # 各タイルの画像上の左端
+        self.tiles = [img.subsurface((x, 0, min(self.tile_width, self.period - x), img.get_height())).copy()
+                      for x in self.starts]
+
+    def draw(self, screen: pg.Surface, offset: int = 0, area: pg.Rect = None):
+        """
+        画面のarea（省略時は画面全体）に，カメラの位置offsetから見える背景を描く
+        """
+        area = screen.get_rect() if area is None else area.clip(screen.get_rect())
+        wx = offset + area.left  # areaの左端のステージ上のX座標
+        i = bisect.bisect_right(self.starts, wx % self.period) - 1
+        wx -= wx % self.period - self.starts[i]  # そのタイルの左端
+        seq = []
+        while wx < offset + area.right:
+            tile = self.tiles[i]
+            x = wx - offset
+            dest = area.clip((x, 0, tile.get_width(), tile.get_height()))
+            if dest:
+                seq.append((tile, dest, dest.move(-x, 0)))
+            wx += tile.get_width()
+            i = (i + 1) % len(self.tiles)
+        screen.blits(seq)
+
+
+class Inputs(NamedTuple):
+    """
+    1フレーム分のプレイヤー入力
+    left, right：左右キーを押し続けているか
+    fire：このフレームでスペースキーが押された回数
+    jump：このフレームで上キーが押されたか
+    special：このフレームでエンターキーが押されたか
+    """
+    left: bool = False
+    right: bool = False
+    fire: int = 0
+    jump: bool = False
+    special: bool = False
+
+    @classmethod
+    def from_keys(cls, key_lst, keydowns: list[int]) -> "Inputs":
+        """
+        pg.key.get_pressed()の結果と，このフレームに押されたキーのリストから入力を作る
+        """
+        return cls(bool(key_lst[pg.K_LEFT]), bool(key_lst[pg.K_RIGHT]),
+                   keydowns.count(pg.K_SPACE), pg.K_UP in keydowns, pg.K_RETURN in keydowns)
+
+
+class GameWorld:
+    """
+    ゲーム中の状態（こうかとん，敵機，爆弾，ビーム，炎柱，ボス，スコア，HP，経過フレーム）をまとめ，
+    1フレーム分の進行を行うクラス
+    描画は一切行わないため，SDLのdummyドライバでも画面なしで動かせる
+    """
+    def __init__(self, bullet_engine: bool = False, seed: "int|None" = None,
+                 enemy_interval: int = 200, boss_maxhp: int = 50, bomb_speed: int = 6,
+                 stage_width: int = WIDTH, boss_patterns: bool = False, precise_hitbox: bool = False,
+                 players: int = 1):
+        """
+        引数1 bullet_engine：Trueなら爆弾をProjectileEngine（NumPy配列）で扱う
+        引数2 seed：乱数の種（Noneなら毎回異なる種を選ぶ）
+        引数3 enemy_interval：敵機が出現する間隔（フレーム）
+        引数4 boss_maxhp：ボスの最大HP
+        引数5 bomb_speed：爆弾の速さ
+        引数6 stage_width：ステージの横幅（画面より長ければカメラがこうかとんを追ってスクロールする）
+        引数7 boss_patterns：Trueならボスの攻撃にBOSS_PATTERNSの弾幕を加える
+        引数8 precise_hitbox：Trueなら衝突判定を矩形ではなく爆弾の円と画像のマスクで行う
+        引数9 players：こうかとんの数（2なら2人協力プレイ．HPとスコアは共有で，敵機とボスは1人目を狙う）
+        """
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.rng = random.Random(self.seed)  # ゲーム中の乱数はすべてこれを使う
+        self.opts = {"bullet_engine": bullet_engine, "enemy_interval": enemy_interval,
+                     "boss_maxhp": boss_maxhp, "bomb_speed": bomb_speed,
+                     "stage_width": stage_width, "boss_patterns": boss_patterns,
+                     "precise_hitbox": precise_hitbox}  # リプレイに保存するオプション
+        self.enemy_interval = enemy_interval
+        self.boss_maxhp = boss_maxhp
+        self.bomb_speed = bomb_speed
+        self.patterns = compile_patterns() if boss_patterns else {}
+        # 爆弾投下や無敵時間などの予約（各フレームの更新の最初にtmrまで進めるので，それまでは前のフレーム）
+        self.timers = TimerWheel(start=-1)
+        self.due_drops: list[Enemy] = []  # このフレームに爆弾を投下する敵機
+        # 2人目以降は見分けられるように別の画像を使う
+        self.birds = [Bird(num, (100 + 100*i, GROUND_Y - 50), self.timers)
+                      for i, num in enumerate(PLAYER_IMAGES[:players])]
+        self.bird = self.birds[0]  # 1人目（カメラが追い，敵機とボスが狙う）
+        self.precise_hitbox = precise_hitbox
+        self.collided = collide_precise if precise_hitbox else None  # grid_*collideに渡す判定関数
+        if precise_hitbox:  # こうかとんの全方向と敵機の全コマのマスクを先に作っておく
+            for img in [*(img for bird in self.birds for img in bird.imgs.values()),
+                        *map(Enemy.animation.image, range(len(Enemy.img_files)))]:
+                ASSETS.mask(img)
+        self.boss = Boss(self.rng, boss_maxhp, bomb_speed, timers=self.timers)  # ボス登場前のリザルト判定用
+        self.score = Score()
+        self.hp = HP("disturbed-zrrgd.ttf")
+        self.bombs = ProjectileEngine() if bullet_engine else pg.sprite.Group()
+        self.beams = pg.sprite.Group()
+        self.exps = pg.sprite.Group()
+        self.emys = pg.sprite.Group()
+        self.bosses = pg.sprite.Group()
+        self.flames = pg.sprite.Group()
+        self.tmr = 0
+        self.boss_mode = False
+        self.boss_spawned = False
+        self.result = None  # "gameover"：ゲームオーバー，"clear"：ボス撃破
+        self.beam_grid = SpatialHash()  # 衝突判定用のグリッド
+        self.bomb_grid = SpatialHash()
+        self.flame_grid = SpatialHash()
+        self.profiler = NO_PROFILER
+        self.prev = {}  # スプライト -> remember_positions()した時点の左上座標
+        self.stage = pg.Rect(0, 0, max(stage_width, WIDTH), HEIGHT)
+        self.camera = Camera(self.stage)
+        self.scrolling = self.stage.width > WIDTH
+        self.dormant: list[tuple[int, int, Enemy]] = []  # 有効範囲外の敵機（中心のX座標順）
+        self.enemy_serial = 0  # 同じX座標の敵機を並べる順番，敵機グループに加えた順番
+        if self.scrolling:
+            self.populate_stage()
+
+    def populate_stage(self, spacing: int = 100):
+        """
+        最初の画面より先のステージにspacingおきに停止した敵機を置く（有効範囲に入るまで眠らせておく）
+        """
+        for x in range(WIDTH + spacing, self.stage.right - spacing, spacing):
+            emy = Enemy(self.rng)
+            emy.rect.centerx = x
+            emy.target_x = emy.rect.left  # 最初の更新でその場に止まる
+            self.sleep(emy)
+
+    def sleep(self, emy: Enemy):
+        if emy.drop_timer is not None:  # 眠っている間は爆弾を投下しない
+            emy.drop_timer.cancel()
+            emy.drop_timer = None
+        self.enemy_serial += 1
+        bisect.insort(self.dormant, (emy.rect.centerx, self.enemy_serial, emy))
+
+    def add_enemy(self, emy: Enemy):
+        """
+        敵機グループに敵機を加える（停止中ならすぐに爆弾投下を予約する）
+        """
+        self.enemy_serial += 1
+        emy.order = self.enemy_serial
+        emy.on_stop = self.schedule_drop
+        self.emys.add(emy)
+        if emy.state == "stop":
+            self.schedule_drop(emy)
+
+    def schedule_drop(self, emy: Enemy):
+        """
+        停止中の敵機の次の爆弾投下を予約する
+        爆弾はtmrがemy.intervalの倍数になるフレームの出現処理で投下するので，
+        その1フレーム前の更新でdue_dropsに入るようにする
+        """
+        now = self.timers.now
+        drop = -(-(now+1) // emy.interval) * emy.interval  # now+1以上で最初の倍数
+        emy.drop_timer = self.timers.schedule(drop - 1 - now, self.due_drops.append, emy)
+
+    def drop_bombs(self):
+        """
+        予約どおりに停止中の敵機から爆弾を投下し，次の投下を予約する
+        同じフレームの投下は敵機グループに加えた順に行う（乱数を使う順番を保つため）
+        """
+        due = sorted(self.due_drops, key=lambda emy: emy.order)
+        self.due_drops.clear()  # 予約はこのリストのappendを持っているので作り直さない
+        for emy in due:
+            if emy not in self.emys:  # 倒された敵機と眠った敵機は投下をやめる
+                continue
+            launch_bomb(self.bombs, emy, self.bird, rng=self.rng, speed=self.bomb_speed)
+            emy.drop_timer = self.timers.schedule(emy.interval, self.due_drops.append, emy)
+
+    def cull(self):
+        """
+        有効範囲の外に出た敵機を眠らせ，有効範囲に入った敵機を起こす
+        眠っている敵機はX座標順に並んでいるので，起こす分だけを二分探索で取り出す
+        """
+        active = self.camera.active
+        for emy in self.emys.sprites():
+            if not active.left <= emy.rect.centerx < active.right:
+                self.emys.remove(emy)
+                self.sleep(emy)
+        lo = bisect.bisect_left(self.dormant, (active.left,))
+        hi = bisect.bisect_left(self.dormant, (active.right,))
+        for _, _, emy in self.dormant[lo:hi]:
+            self.add_enemy(emy)
+        del self.dormant[lo:hi]
+
+    def step(self, inputs: Inputs, *partners: Inputs) -> list[str]:
+        """
+        入力に従ってゲームを1フレーム進める
+        引数1 inputs：このフレームの入力
+        引数2 partners：2人目以降のこうかとんへの入力（足りない分は何も押していないものとする）
+        戻り値：このフレームで起きた出来事のリスト
+                "boss"：ボス登場，"hit"：爆弾被弾，"flame_hit"：炎柱被弾，
+                "gameover"：HPが0になった，"clear"：ボス撃破
+        """
+        score, hp = self.score, self.hp
+        profiler = self.profiler
+        events = []
+        controls = [inputs, *partners[:len(self.birds)-1]]
+        controls += [Inputs()] * (len(self.birds) - len(controls))
+
+        for bird, control in zip(self.birds, controls):
+            for _ in range(control.fire):
+                self.beams.add(Beam.acquire(bird))
+                self.beams.add(Beam.acquire(bird))
+            if control.jump:
+                bird.jump_requested = True  #ジャンプリクエストは押された瞬間のみ
+            if control.special:  # エンターキーが押されたら
+                # スコアが100以上、かつ無敵状態ではない場合のみ発動
+                if score.value >= 100 and not bird.is_invincible:
+                    score.value -= 100  # 100ポイント消費
+                    bird.is_invincible = True  # 無敵状態にする
+                    bird.invincible_timer = 300 # 無敵時間を300フレームに設定 (約6秒)
+
+        if self.scrolling:
+            self.cull()
+
+        if self.tmr == 1000 and not self.boss_spawned:  # tmrフレーム後にボス登場
+            self.emys.empty()
+            self.dormant.clear()
+            self.camera.locked = True  # ボス戦の間は画面を止める
+            self.boss = Boss(self.rng, self.boss_maxhp, self.bomb_speed, self.camera.x, self.timers, self.patterns)
+            self.bosses.add(self.boss)
+            self.boss_mode = True
+            self.boss_spawned = True
+            events.append("boss")
+
+        if self.tmr%self.enemy_interval == 0 and not self.boss_mode:
+            self.add_enemy(Enemy(self.rng, self.camera.x))
+        if self.tmr%self.enemy_interval == 0:
+            self.add_enemy(Enemy(self.rng, self.camera.x))
+
+        if self.due_drops:
+            # 敵機が停止状態に入ったら，intervalに応じて爆弾投下
+            self.drop_bombs()
+        profiler.lap("spawn")
+
+        engine = isinstance(self.bombs, ProjectileEngine)
+        self.beam_grid.sync(self.beams)
+        if not engine:
+            self.bomb_grid.sync(self.bombs)
+        self.flame_grid.sync(self.flames)
+
+        collided = self.collided
+        for emy in grid_groupcollide(self.emys, self.beams, self.beam_grid, True, True, collided).keys():  # ビームと衝突した敵機リスト
+            self.exps.add(Explosion.acquire(emy, 100))  # 爆発エフェクト
+            score.value += 10  # 10点アップ
+
+        if engine:
+            shot = self.bombs.collide_group(self.beams, True, self.precise_hitbox)
+        else:
+            shot = grid_groupcollide(self.bombs, self.beams, self.beam_grid, True, True, collided).keys()
+        for bomb in shot:  # ビームと衝突した爆弾リスト
+            self.exps.add(Explosion.acquire(bomb, 50))  # 爆発エフェクト
+            score.value += 1  # 1点アップ
+
+        for bird in self.birds:
+            if engine:
+                hits = self.bombs.collide_rect(bird.rect, True, bird.mask if self.precise_hitbox else None)
+            else:
+                hits = grid_spritecollide(bird, self.bombs, self.bomb_grid, True, collided)
+            for bomb in hits:  # こうかとんと衝突した爆弾リスト
+                if not bird.is_invincible:  # 無敵中じゃなかったら
+                    hp.hit()  # HPを減少させる
+                    events.append("hit")
+                if hp.current_life <= 0:
+                    self.result = "gameover"
+                    events.append("gameover")
+                    return events
+
+        for bird in self.birds:
+            for flame in grid_spritecollide(bird, self.flames, self.flame_grid, False, collided):  # 炎柱攻撃との衝突判定
+                if flame.active:
+                    if not bird.is_invincible:  #　無敵中じゃなかったら
+                        hp.hit()
+                        events.append("flame_hit")
+                        if hp.current_life <= 0:
+                            self.result = "gameover"
+                            events.append("gameover")
+                            return events
+
+        for boss in grid_groupcollide(self.bosses, self.beams, self.beam_grid, False, True, collided):  #ビームがボスに当たる処理
             boss.hp -= 1
             if boss.hp <= 0:
                 boss.kill()
                 score.value += 100
- 
-        bird.update(key_lst, screen)
-        beams.update()
-        beams.draw(screen)
-        emys.update()
-        emys.draw(screen)
-        bombs.update()
-        bombs.draw(screen)
-        flames.update()
-        flames.draw(screen)
-        exps.update()
-        exps.draw(screen) 
-        if boss_mode:
-            bosses.draw(screen)
-            for boss in bosses:
-                boss.draw_hp(screen)
-                bosses.update(bird, bombs, flames)
-        hp.update(screen) # HPを更新して描画
-        score.update(screen)
-        tmr += 1
-        
-        if result.update(screen, bird, score, player_hp=1, boss_hp=boss.hp):
-            return
+        profiler.lap("collision")
+
+        self.timers.advance_to(self.tmr)  # このフレームに予約された処理を実行する
+        bounds = self.stage.clip(self.camera.active)  # ビームと爆弾はここから出たら消える
+        area = self.camera.view if self.camera.locked else self.stage
+        for bird, control in zip(self.birds, controls):
+            bird.update(control, area)
+        bird = self.bird
+        self.camera.follow(bird.rect)
+        self.beams.update(bounds)
+        self.emys.update()
+        self.bombs.update(bounds)
+        self.exps.update()
+        if self.boss_mode:
+            for boss in self.bosses:
+                self.bosses.update(bird, self.bombs, self.flames)
+        self.tmr += 1
+        profiler.lap("update")
+
+        if self.boss.hp <= 0:
+            self.result = "clear"
+            events.append("clear")
+        return events
+
+    def remember_positions(self):
+        """
+        全スプライトの現在の位置を補間描画の始点として覚える（シミュレーションを1回進める前に呼ぶ）
+        """
+        self.camera.remember()
+        prev = {bird: bird.rect.topleft for bird in self.birds}
+        for group in (self.beams, self.emys, self.bombs, self.flames, self.exps, self.bosses):
+            if isinstance(group, ProjectileEngine):
+                group.remember()
+                continue
+            for s in group:
+                prev[s] = s.rect.topleft
+        self.prev = prev
+
+    def draw(self, screen: pg.Surface, alpha: float = 1.0) -> list[pg.Rect]:
+        """
+        ゲーム画面（背景以外）を描画する
+        引数1 screen：画面Surface
+        引数2 alpha：remember_positions()した位置から現在の位置までのどこに描くか（1.0なら現在の位置）
+        戻り値：描画した範囲のリスト
+        """
+        prev = self.prev if alpha < 1.0 else None
+        offset = self.camera.offset(alpha)
+        view = pg.Rect(offset, 0, WIDTH, HEIGHT) if self.scrolling else None  # 画面外のものは描かない
+        draw = (lambda group: draw_group(screen, group, prev, alpha, offset, view))
+        drawn = []
+        for bird in self.birds:
+            pos = lerp_pos(bird.rect, prev.get(bird), alpha) if prev else bird.rect
+            drawn.append(screen.blit(bird.image, (pos[0] - offset, pos[1])))
+        drawn += draw(self.beams)
+        drawn += draw(self.emys)
+        drawn += draw(self.bombs)
+        drawn += draw(self.flames)
+        drawn += draw(self.exps)
+        if self.boss_mode:
+            drawn += draw(self.bosses)
+            for boss in self.bosses:
+                drawn.append(boss.draw_hp(screen))
+        drawn.append(self.hp.update(screen)) # HPを更新して描画
+        drawn.append(self.score.update(screen))
+        return drawn
+
+    def digest(self) -> str:
+        """
+        ゲーム状態のハッシュ値を返す（リプレイで同じ結果になったかの確認用）
+        """
+        if isinstance(self.bombs, ProjectileEngine):
+            bombs = self.bombs.rects()
+        else:
+            bombs = [s.rect for s in self.bombs]
+        state = [self.tmr, self.score.value, self.hp.current_life, self.boss.hp, self.result,
+                 tuple(self.bird.rect), sorted(tuple(r) for r in bombs)]
+        for name in ("emys", "beams", "exps", "flames", "bosses"):
+            state.append(sorted(tuple(s.rect) for s in getattr(self, name)))
+        state += [tuple(bird.rect) for bird in self.birds[1:]]  # 1人プレイのハッシュ値は変えない
+        return hashlib.md5(repr(state).encode()).hexdigest()
+
+    # 他から参照されない爆弾などのグループ（RewindBufferはpickleの外で属性ごとの列に詰める）
+    PACKED_GROUPS = ("bombs", "beams", "exps")
+
+    def __getstate__(self) -> dict:
+        """
+        pickle用の状態（RewindBufferのスナップショット）
+        衝突判定のグリッドと補間用の位置は毎フレーム作り直されるので保存しない
+        """
+        state = self.__dict__.copy()
+        state["beam_grid"] = state["bomb_grid"] = state["flame_grid"] = None
+        state["prev"] = {}
+        state["profiler"] = None
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.beam_grid, self.bomb_grid, self.flame_grid = SpatialHash(), SpatialHash(), SpatialHash()
+        self.profiler = NO_PROFILER
+
+
+class InputRecorder:
+    """
+    GameWorldに渡した入力を1フレーム1バイトで記録し，リプレイファイルに保存するクラス
+    ファイルの内容：識別子，版数，乱数の種，GameWorldのオプション(JSON)，フレーム数，
+                    最後の状態のハッシュ値，zlibで圧縮した入力列
+    入力1バイトの内訳：bit0 左，bit1 右，bit2 ジャンプ，bit3 無敵化，bit4-7 ビーム発射回数
+    """
+    MAGIC = b"HSRP"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBQH")  # 識別子，版数，種，オプションの長さ
+    FOOTER = struct.Struct("<I16s")  # フレーム数，ハッシュ値
+
+    def __init__(self, world: GameWorld):
+        self.seed = world.seed
+        self.opts = dict(world.opts)
+        self.frames = bytearray()
+
+    @staticmethod
+    def encode(inputs: Inputs) -> int:
+        return (inputs.left | inputs.right << 1 | inputs.jump << 2 | inputs.special << 3
+                | min(inputs.fire, 15) << 4)
+
+    @staticmethod
+    def decode(byte: int) -> Inputs:
+        return Inputs(bool(byte & 1), bool(byte & 2), byte >> 4, bool(byte & 4), bool(byte & 8))
+
+    def record(self, inputs: Inputs):
+        """
+        1フレーム分の入力を記録する
+        """
+        self.frames.append(self.encode(inputs))
+
+    def save(self, path: str, world: GameWorld):
+        """
+        記録した入力をworldの最後の状態のハッシュ値と一緒に保存する
+        """
+        opts = json.dumps(self.opts).encode()
+        with open(path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.seed, len(opts)))
+            f.write(opts)
+            f.write(self.FOOTER.pack(len(self.frames), bytes.fromhex(world.digest())))
+            f.write(zlib.compress(bytes(self.frames), 9))
+
+    @classmethod
+    def load(cls, path: str) -> tuple[int, dict, list[Inputs], str]:
+        """
+        リプレイファイルを読み込む
+        戻り値：乱数の種，GameWorldのオプション，入力のリスト，最後の状態のハッシュ値
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, seed, opts_len = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"{path}はこの版のリプレイファイルではありません")
+        pos = cls.HEADER.size
+        opts = json.loads(data[pos:pos+opts_len])
+        pos += opts_len
+        count, digest = cls.FOOTER.unpack_from(data, pos)
+        frames = zlib.decompress(data[pos+cls.FOOTER.size:])
+        assert len(frames) == count, "リプレイファイルが壊れています"
+        return seed, opts, [cls.decode(b) for b in frames], digest.hex()
+
+
+def _pack_column(values: tuple) -> tuple:
+    """
+    スプライトの1つの属性の値の列を詰める
+    整数・小数・真偽値はarrayに並べ，Rectは複製のタプルにし，
+    それ以外（画像など）は重複を除いた値のリストとその添字にする
+    """
+    kinds = set(map(type, values))
+    kind = next(iter(kinds), None)
+    if len(kinds) == 1:
+        if kind is pg.Rect:  # 4つの整数に分けるより，そのまま複製するほうがずっと速い
+            return "rect", tuple(map(pg.Rect.copy, values))
+        code = {int: "q", float: "d", bool: "b"}.get(kind)
+        if code is not None:
+            try:
+                return kind.__name__, array(code, values)
+            except OverflowError:  # 64ビットに収まらない整数は参照で持つ
+                pass
+    if len(kinds) == 1 and kind.__hash__ is object.__hash__:  # 画像などはそのまま同一性で重複を除ける
+        keys = values
+    else:  # 等しい別の値（1と1.0など）をまとめないようにidで区別する
+        keys = list(map(id, values))
+    objs = dict(zip(keys, values))  # キー -> 値（最初に出てきた順）
+    index = {key: i for i, key in enumerate(objs)}
+    return "ref", list(objs.values()), array("H" if len(objs) <= 0xFFFF else "L", map(index.__getitem__, keys))
+
+
+def _unpack_column(column: tuple) -> list:
+    kind = column[0]
+    if kind == "rect":
+        return list(map(pg.Rect, column[1]))
+    if kind == "ref":
+        return list(map(column[1].__getitem__, column[2]))
+    values = column[1].tolist()
+    return list(map(bool, values)) if kind == "bool" else values
+
+
+def pack_sprites(group: pg.sprite.AbstractGroup) -> tuple[list, array]:
+    """
+    グループのスプライトを，型と属性名の組ごとに属性ごとの列へ詰める
+    スプライトごとのオブジェクトを作らないので，数千個の爆弾でもpickleより速く，小さくなる
+    画像などの数値でない値は参照だけを持つ（スプライトが差し替えるだけで中身を変えない値であること）
+    戻り値：(型, 属性名, 列のリスト)の表のリストと，グループの順に並べた各スプライトの表の番号
+    """
+    # 1スプライトずつの処理はPythonのループにせず，mapとzipで列ごとにまとめて行う
+    sprites = group.sprites()
+    attrs = list(map(vars, sprites))
+    types = list(map(type, sprites))
+    try:  # 型と属性の数で分ける（同じ型で数が同じなら，ふつうは属性名も同じ．違えば列を取り出すときにKeyErrorになる）
+        keys = list(map(len, attrs)) if len(set(types)) == 1 else list(zip(types, map(len, attrs)))
+        return _pack_layouts(types, attrs, keys)
+    except KeyError:
+        return _pack_layouts(types, attrs, list(zip(types, map(tuple, attrs))))
+
+
+def _pack_layouts(types: list[type], attrs: list[dict], keys: list) -> tuple[list, array]:
+    layouts = {key: i for i, key in enumerate(dict.fromkeys(keys))}  # 型と属性の分け方 -> 表の番号
+    if len(layouts) == 1:
+        order, rows = array("B", bytes(len(keys))), [attrs]
+    else:
+        order = array("B", map(layouts.__getitem__, keys))
+        rows = [list(compress(attrs, map(i.__eq__, order))) for i in layouts.values()]
+    return [_pack_table(types[keys.index(key)], table[0], table) for key, table in zip(layouts, rows)], order
+
+
+def _pack_table(cls: type, names, attrs: list[dict]) -> tuple:
+    names = tuple(name for name in names if name != "_Sprite__g")  # 所属グループは詰め直すときに作る
+    return cls, names, [_pack_column(tuple(map(itemgetter(name), attrs))) for name in names]
+
+
+def unpack_sprites(packed: tuple[list, array]) -> pg.sprite.Group:
+    """
+    pack_spritesで詰めたスプライトを作り直し，元の順番でグループに入れて返す
+    """
+    tables, order = packed
+    made = []  # 表ごとのスプライトの列
+    for cls, names, columns in tables:
+        sprites = []
+        for values in zip(*map(_unpack_column, columns)):
+            sprite = cls.__new__(cls)
+            pg.sprite.Sprite.__init__(sprite)
+            sprite.__dict__.update(zip(names, values))
+            sprites.append(sprite)
+        made.append(iter(sprites))
+    return pg.sprite.Group([next(made[i]) for i in order])
+
+
+def _shared_ref(index: int):
+    """
+    RewindBufferのスナップショットの中で共有物（画像など）を指す印
+    復元するときは_SnapshotUnpicklerがスナップショットごとの共有物のリストに差し替える
+    """
+    raise RuntimeError("RewindBufferのスナップショットはRewindBufferでしか復元できません")
+
+
+def _packed_ref(index: int):
+    """
+    RewindBufferのスナップショットの中で，pickleの外に詰めて保存した爆弾などのグループを指す印
+    """
+    raise RuntimeError("RewindBufferのスナップショットはRewindBufferでしか復元できません")
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, data: bytes, shared: list, packed: list):
+        super().__init__(io.BytesIO(data))
+        self.shared = shared
+        self.packed = packed
+
+    def find_class(self, module: str, name: str):
+        if name == _shared_ref.__name__:
+            return self.shared.__getitem__
+        if name == _packed_ref.__name__:
+            return self.unpack
+        return super().find_class(module, name)
+
+    def unpack(self, index: int) -> "pg.sprite.Group|ProjectileEngine":
+        packed = self.packed[index]
+        if isinstance(packed, dict):  # ProjectileEngineの配列
+            engine = ProjectileEngine.__new__(ProjectileEngine)
+            engine.__setstate__(packed)
+            return engine
+        return unpack_sprites(packed)
+
+
+class RewindBuffer:
+    """
+    直近のゲーム状態を毎フレーム保存しておき，巻き戻せるようにするリングバッファ
+    数の多い爆弾・ビーム・爆発（GameWorld.PACKED_GROUPS）は，スプライトならpack_spritesで属性ごとの列に，
+    ProjectileEngineなら使用中の範囲の配列の複製にしてpickleの外に持ち，残りの状態をpickleでバイト列にする
+    （画像・フォント・マスク・弾幕の表は作り直さず参照だけ残す）
+    バイト列と詰めた列，スナップショットが参照している共有物（重複は1つと数える）の合計を上限に収め，
+    フレーム数とバイト数のどちらかが上限を超えたら古いものから捨てる
+    """
+    SHARED = (pg.Surface, pg.font.Font, pg.mask.Mask, BulletPattern)  # コピーせずに共有するもの
+    RECT_SIZE = sys.getsizeof(pg.Rect(0, 0, 0, 0))
+
+    def __init__(self, seconds: float = 5.0, max_bytes: int = 64 << 20, compress: bool = False):
+        """
+        引数1 seconds：巻き戻せる時間（秒）
+        引数2 max_bytes：保存するバイト列と詰めた列，参照している共有物の合計の上限
+        引数3 compress：Trueならpickleのバイト列をzlibで圧縮して保存する（保存が遅くなる代わりに多くのフレームを持てる）
+        """
+        self.capacity = max(1, round(seconds*FPS))
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.snapshots: deque[tuple[bytes, list, list, int]] = deque()  # (バイト列, 共有物, 詰めたグループ, バイト数)
+        self.nbytes = 0  # スナップショットのバイト数（共有物を除く）の合計
+        self.retained: dict[int, list] = {}  # id(共有物) -> [共有物, 参照しているスナップショットの数, バイト数]
+        self.shared_bytes = 0  # retainedの共有物のバイト数の合計
+        self.shared: list = []  # capture中のスナップショットが参照する共有物
+        self.shared_index: dict[int, int] = {}  # id(共有物) -> sharedの添字
+        self.packing: set[int] = set()  # capture中のworldの詰めるグループのid
+        self.packed: list = []  # capture中のスナップショットの詰めたグループ
+        self.dispatch_table = dict(copyreg.dispatch_table)
+        for cls in self.SHARED:
+            self.dispatch_table[cls] = self._share
+        for cls in (pg.sprite.Group, ProjectileEngine):
+            self.dispatch_table[cls] = self._pack
+
+    def _share(self, obj) -> tuple:
+        index = self.shared_index.get(id(obj))
+        if index is None:
+            index = self.shared_index[id(obj)] = len(self.shared)
+            self.shared.append(obj)
+        return _shared_ref, (index,)
+
+    def _pack(self, obj) -> tuple:
+        if id(obj) not in self.packing:  # 敵機などのグループは他から参照されるのでpickleに入れる
+            return obj.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+        self.packed.append(obj.__getstate__() if isinstance(obj, ProjectileEngine) else pack_sprites(obj))
+        return _packed_ref, (len(self.packed) - 1,)
+
+    @staticmethod
+    def _sizeof(obj) -> int:
+        """
+        共有物が使っているメモリのおおよそのバイト数
+        """
+        if isinstance(obj, pg.Surface):
+            return obj.get_pitch() * obj.get_height()
+        if isinstance(obj, pg.mask.Mask):
+            w, h = obj.get_size()
+            return (w*h + 7) // 8
+        return sys.getsizeof(obj) + sum(getattr(v, "nbytes", 0) for v in getattr(obj, "__dict__", {}).values())
+
+    def _packed_size(self, packed: "dict|tuple") -> int:
+        """
+        詰めたグループのバイト数（参照している画像などはsharedに加え，共有物として数える）
+        """
+        if isinstance(packed, dict):
+            return sum(getattr(v, "nbytes", 0) for v in packed.values())
+        tables, order = packed
+        size = len(order)
+        for _, _, columns in tables:
+            for kind, *data in columns:
+                if kind == "rect":
+                    size += sys.getsizeof(data[0]) + self.RECT_SIZE*len(data[0])
+                elif kind == "ref":
+                    objs, index = data
+                    size += len(index) * index.itemsize
+                    for obj in objs:
+                        if isinstance(obj, self.SHARED):
+                            self._share(obj)
+                        else:
+                            size += sys.getsizeof(obj)
+                else:
+                    size += len(data[0]) * data[0].itemsize
+        return size
+
+    def _release(self, snapshot: tuple):
+        self.nbytes -= snapshot[3]
+        for obj in snapshot[1]:
+            entry = self.retained[id(obj)]
+            entry[1] -= 1
+            if not entry[1]:
+                del self.retained[id(obj)]
+                self.shared_bytes -= entry[2]
+
+    def capture(self, world: GameWorld):
+        """
+        worldの今の状態を保存する
+        """
+        self.shared, self.shared_index, self.packed = [], {}, []
+        self.packing = {id(getattr(world, name)) for name in world.PACKED_GROUPS}
+        buf = io.BytesIO()
+        pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+        pickler.dispatch_table = self.dispatch_table
+        pickler.dump(world)
+        data = buf.getvalue()
+        if self.compress:
+            data = zlib.compress(data, 1)
+        size = len(data) + sum(map(self._packed_size, self.packed))
+        for obj in self.shared:
+            entry = self.retained.get(id(obj))
+            if entry is None:
+                entry = self.retained[id(obj)] = [obj, 0, self._sizeof(obj)]
+                self.shared_bytes += entry[2]
+            entry[1] += 1
+        self.snapshots.append((data, self.shared, self.packed, size))
+        self.nbytes += size
+        while self.snapshots and (len(self.snapshots) > self.capacity
+                                  or self.nbytes + self.shared_bytes > self.max_bytes):
+            self._release(self.snapshots.popleft())
+
+    def rewind(self, frames: int = 1) -> "GameWorld|None":
+        """
+        framesフレーム前に保存した状態を復元して返す（それより新しいものは捨てる）
+        戻り値：復元したGameWorld（保存されたものがなければNone）
+        """
+        snapshot = None
+        for _ in range(min(frames, len(self.snapshots))):
+            snapshot = self.snapshots.pop()
+            self._release(snapshot)
+        if snapshot is None:
+            return None
+        data, shared, packed, _ = snapshot
+        if self.compress:
+            data = zlib.decompress(data)
+        return _SnapshotUnpickler(data, shared, packed).load()
+
+    def __len__(self) -> int:
+        return len(self.snapshots)
+
+    def stats(self) -> dict[str, float]:
+        """
+        保存しているフレーム数，秒数，バイト数（共有物を含む），1フレームあたりのバイト数（共有物を除く），共有物のバイト数
+        """
+        count = len(self.snapshots)
+        return {"frames": count, "seconds": count/FPS, "bytes": self.nbytes + self.shared_bytes,
+                "bytes_per_frame": self.nbytes/count if count else 0.0, "shared_bytes": self.shared_bytes}
+
+
+class NullProfiler:
+    """
+    計測しないときに使う，何もしないプロファイラ
+    """
+    enabled = False
+
+    def begin(self):
+        pass
+
+    def lap(self, phase: str):
+        pass
+
+    def end(self, world: "GameWorld|None" = None):
+        pass
+
+
+NO_PROFILER = NullProfiler()
+
+
+class FrameProfiler(NullProfiler):
+    """
+    メインループの処理段階ごとの時間を毎フレーム記録するプロファイラ
+    記録は固定長のリングバッファに入り，古いフレームから上書きされる
+    """
+    enabled = True
+    phases = ("events", "spawn", "collision", "update", "draw", "present")  # 処理段階
+    groups = ("emys", "bombs", "beams", "flames", "exps", "bosses")  # 数を記録するグループ
+
+    def __init__(self, size: int = 600):
+        """
+        引数 size：記録しておくフレーム数
+        """
+        self.size = size
+        self.times = {p: array("d", bytes(8*size)) for p in self.phases}  # 秒
+        self.counts = {g: array("l", bytes(array("l").itemsize*size)) for g in self.groups}
+        self.frames = 0  # これまでに記録したフレーム数
+        self.current = dict.fromkeys(self.phases, 0.0)
+        self.last = time.perf_counter()
+        self.show = False  # オーバーレイを表示するか
+        self.overlay = None  # オーバーレイ画像（一定間隔で作り直す）
+
+    def begin(self):
+        """
+        1フレームの計測を始める
+        """
+        for p in self.current:
+            self.current[p] = 0.0
+        self.last = time.perf_counter()
+
+    def lap(self, phase: str):
+        """
+        前回のlap（またはbegin）からの時間を処理段階phaseに加える
+        """
+        now = time.perf_counter()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end(self, world: "GameWorld|None" = None):
+        """
+        1フレームの計測を終えてリングバッファに書き込む
+        引数 world：指定した場合は各グループの数も記録する
+        """
+        i = self.frames % self.size
+        for p, t in self.current.items():
+            self.times[p][i] = t
+        for g in self.groups:
+            self.counts[g][i] = len(getattr(world, g)) if world is not None else 0
+        self.frames += 1
+
+    def _rows(self) -> range:
+        n = min(self.frames, self.size)
+        return range(self.frames - n, self.frames)
+
+    def percentiles(self) -> dict[str, tuple[float, float, float]]:
+        """
+        処理段階ごとの50, 95, 99パーセンタイル（ミリ秒）を返す
+        """
+        result = {}
+        idx = [f % self.size for f in self._rows()]
+        for p in self.phases:
+            values = sorted(self.times[p][i] for i in idx)
+            if not values:
+                result[p] = (0.0, 0.0, 0.0)
+                continue
+            pick = lambda q: values[min(len(values)-1, int(q*len(values)))]*1000
+            result[p] = (pick(0.50), pick(0.95), pick(0.99))
+        return result
+
+    def means(self) -> dict[str, float]:
+        """
+        処理段階ごとの1フレームあたりの平均時間（ミリ秒）を返す
+        """
+        idx = [f % self.size for f in self._rows()]
+        return {p: sum(self.times[p][i] for i in idx)*1000/max(1, len(idx)) for p in self.phases}
+
+    def dump_csv(self, path: str):
+        """
+        リングバッファの内容を古い順にCSVファイルへ書き出す（時間はミリ秒）
+        """
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", *(f"{p}_ms" for p in self.phases), *self.groups])
+            for frame in self._rows():
+                i = frame % self.size
+                writer.writerow([frame, *(f"{self.times[p][i]*1000:.4f}" for p in self.phases),
+                                 *(self.counts[g][i] for g in self.groups)])
+
+    def draw_overlay(self, screen: pg.Surface) -> "pg.Rect|None":
+        """
+        showがTrueなら，処理段階ごとのp50/p95/p99と各グループの数を左上に表示する
+        文字の描画は重いので，表示内容は0.5秒ごとに作り直す
+        戻り値：描画した範囲（表示しないときはNone）
+        """
+        if not self.show:
+            return None
+        if self.overlay is None or self.frames % (FPS//2) == 0:
+            font = TEXT.font(None, 22)
+            i = (self.frames - 1) % self.size
+            lines = [f"{'phase':<10} p50   p95   p99 (ms)"]
+            lines += [f"{p:<10} {a:5.2f} {b:5.2f} {c:5.2f}" for p, (a, b, c) in self.percentiles().items()]
+            lines.append("  ".join(f"{g}:{self.counts[g][i]}" for g in self.groups))
+            imgs = [font.render(line, True, (255, 255, 255)) for line in lines]
+            self.overlay = pg.Surface((max(img.get_width() for img in imgs)+8, 18*len(imgs)+8), pg.SRCALPHA)
+            self.overlay.fill((0, 0, 0, 160))
+            for n, img in enumerate(imgs):
+                self.overlay.blit(img, (4, 4+18*n))
+        return screen.blit(self.overlay, (8, 60))
+
+
+class LatencyTracer:
+    """
+    キー入力から画面に表示されるまでの遅れを操作（ビーム，ジャンプ，無敵化）ごとに記録するクラス
+    押されたキーをイベントキューから取り出した時刻，それを使ったシミュレーションの時刻，
+    その結果を最初に描いた画面転送の時刻を記録する
+    pygameのイベントには押された時刻がないため，キューで待った時間は前回キューを読んでからの間隔（最大値）で記録する
+    """
+    actions = {pg.K_SPACE: "fire", pg.K_UP: "jump", pg.K_RETURN: "special"}  # キー -> 操作名
+    stages = {"queue": (1, 2), "input": (2, 3), "display": (3, 4), "total": (2, 4)}  # 段階 -> 記録の添字（始め，終わり）
+
+    def __init__(self):
+        self.polled = time.perf_counter()  # 最後にイベントキューを読んだ時刻
+        self.waited = 0.0  # その前にキューを読んでからの間隔
+        self.pending: list[tuple[str, float, float]] = []  # 使われていない入力：(操作名, 最も早く押せた時刻, キーの時刻)
+        self.acted: list[tuple] = []  # 表示待ちの入力：pendingの各項目＋使った時刻
+        self.samples: list[tuple] = []  # actedの各項目＋表示した時刻
+        self.ticks: list[int] = []  # samplesの各入力を使ったときのtmr
+
+    def poll(self):
+        """
+        イベントキューを読んだことを記録する（この後のkeydownはこの時刻に押されたものとする）
+        """
+        now = time.perf_counter()
+        self.waited, self.polled = now - self.polled, now
 
+    def keydown(self, key: int):
+        """
+        キーが押されたことを記録する（記録対象でないキーは無視する）
+        """
+        action = self.actions.get(key)
+        if action is not None:
+            self.pending.append((action, self.polled - self.waited, self.polled))
+
+    def tick(self, tmr: int):
+        """
+        記録中の入力がtmrのシミュレーションで使われたことを記録する
+        """
+        now = time.perf_counter()
+        self.acted += [(*entry, now, tmr) for entry in self.pending]
+        self.pending.clear()
+
+    def discard(self):
+        """
+        まだ使われていない入力を捨てる（巻き戻し中など，シミュレーションに渡さなかったとき）
+        """
+        self.pending.clear()
+
+    def present(self):
+        """
+        画面を転送したことを記録する（使われた入力の結果が表示されたとみなす）
+        """
+        now = time.perf_counter()
+        for *entry, tmr in self.acted:
+            self.samples.append((*entry, now))
+            self.ticks.append(tmr)
+        self.acted.clear()
+
+    def summary(self) -> dict[str, dict[str, tuple[float, float, float, float]]]:
+        """
+        操作ごとに，キューでの待ち（最大値），キー→シミュレーション，シミュレーション→表示，
+        キー→表示の遅れの50, 95, 99パーセンタイルと最大（ミリ秒）を返す
+        """
+        result = {}
+        for action in self.actions.values():
+            rows = [s for s in self.samples if s[0] == action]
+            if not rows:
+                continue
+            stats = {}
+            for name, (a, b) in self.stages.items():
+                values = sorted((row[b] - row[a])*1000 for row in rows)
+                pick = lambda q: values[min(len(values)-1, int(q*len(values)))]
+                stats[name] = (pick(0.50), pick(0.95), pick(0.99), values[-1])
+            result[action] = stats
+        return result
+
+    def report(self) -> str:
+        """
+        summary()を表にした文字列を返す
+        """
+        lines = [f"{'action':<8} {'count':>5} {'stage':<8} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} (ms)"]
+        for action, stats in self.summary().items():
+            count = sum(1 for s in self.samples if s[0] == action)
+            for name, (p50, p95, p99, top) in stats.items():
+                lines.append(f"{action:<8} {count:>5} {name:<8} {p50:7.2f} {p95:7.2f} {p99:7.2f} {top:7.2f}")
+        return "\n".join(lines)
+
+    def dump_csv(self, path: str):
+        """
+        入力1つごとの記録をCSVファイルへ書き出す（時刻は最初に記録した入力のキーの時刻からのミリ秒）
+        """
+        start = self.samples[0][2] if self.samples else 0.0
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["action", "tmr", "earliest_ms", "keydown_ms", "tick_ms", "present_ms"])
+            for (action, *times), tmr in zip(self.samples, self.ticks):
+                writer.writerow([action, tmr, *(f"{(t - start)*1000:.3f}" for t in times)])
+
+
+class MemoryMode:
+    """
+    循環参照のごみ集め（GC）の止まり時間を記録し，止まる場所を選べるようにするクラス
+    manualなら，読み込み済みの長生きするオブジェクトをgc.freezeでGCの対象から外し，
+    自動のGCを止めて，場面の切り替え（safe_point）とフレームの最後（描画後の待ち時間の前）にだけ回収する
+    trace_allocsを指定すると，tracemallocでフレームごとに増えたメモリを確保した場所（ファイルと行）ごとに集計する
+    """
+    def __init__(self, manual: bool = False, trace_allocs: int = 0, young_limit: "int|None" = None):
+        """
+        引数1 manual：TrueならGCを自動で動かさず，safe_pointとend_frameでだけ回収する
+        引数2 trace_allocs：確保した場所ごとの集計で報告する場所の数（0なら集計しない）
+        引数3 young_limit：manualのとき，end_frameで一番若い世代を回収する目安の数（省略時はgcの閾値）
+        """
+        self.manual = manual
+        self.trace_allocs = trace_allocs
+        self.young_limit = young_limit or gc.get_threshold()[0]
+        self.frames = 0  # end_frameを呼んだ回数
+        self.planned = False  # 自分で回収を始めたところか
+        self.started = 0.0
+        self.pauses: list[tuple[int, int, float, bool]] = []  # (フレーム, 世代, ミリ秒, 自分で回収したか)
+        self.sites: dict[str, list[int]] = {}  # 確保した場所 -> [増えたバイト数, 増えたブロック数]
+        self.snapshot = None
+
+    def start(self) -> "MemoryMode":
+        """
+        止まり時間の記録を始める（manualなら，ここまでに作られたオブジェクトを凍結して自動のGCを止める）
+        画像などの読み込みが済んだ後に呼ぶ
+        """
+        if self.manual:
+            gc.collect()
+            gc.freeze()
+            gc.disable()
+        gc.callbacks.append(self._on_gc)
+        if self.trace_allocs:
+            tracemalloc.start()
+            self.snapshot = self._take_snapshot()
+        return self
+
+    def stop(self):
+        """
+        記録をやめ，GCの設定を元に戻す
+        """
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        if self.manual:
+            gc.enable()
+            gc.unfreeze()
+        if self.trace_allocs and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _on_gc(self, phase: str, info: dict):
+        if phase == "start":
+            self.started = time.perf_counter()
+        else:
+            self.pauses.append((self.frames, info["generation"],
+                                (time.perf_counter() - self.started)*1000, self.planned))
+
+    def collect(self, generation: int = 2):
+        self.planned = True
+        try:
+            gc.collect(generation)
+        finally:
+            self.planned = False
+
+    def safe_point(self):
+        """
+        止まっても目立たないところ（場面の切り替え）で全世代を回収する
+        """
+        if self.manual:
+            self.collect()
+
+    def end_frame(self):
+        """
+        1フレームの最後に呼ぶ（manualなら若い世代がたまっていれば回収し，集計中ならメモリの増分を数える）
+        """
+        if self.manual and gc.get_count()[0] >= self.young_limit:
+            self.collect(0)
+        if self.snapshot is not None:
+            snapshot = self._take_snapshot()
+            for stat in snapshot.compare_to(self.snapshot, "lineno"):
+                if stat.size_diff > 0:
+                    frame = stat.traceback[0]
+                    site = self.sites.setdefault(f"{frame.filename}:{frame.lineno}", [0, 0])
+                    site[0] += stat.size_diff
+                    site[1] += max(stat.count_diff, 0)
+            self.snapshot = snapshot
+        self.frames += 1
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen *>")))
+
+    def report(self) -> str:
+        """
+        世代ごとのGCの回数と止まり時間，長く止まったフレーム，（集計中なら）フレームあたりの確保量の多い場所を返す
+        """
+        lines = [f"gc: {'manual' if self.manual else 'auto'} ({self.frames} frames)"]
+        for generation in range(3):
+            times = [ms for _, g, ms, _ in self.pauses if g == generation]
+            if times:
+                planned = sum(1 for _, g, _, p in self.pauses if g == generation and p)
+                lines.append(f"  gen{generation}: {len(times)} collections ({planned} planned), "
+                             f"total {sum(times):.2f} ms, max {max(times):.3f} ms")
+        unplanned = sorted((p for p in self.pauses if not p[3]), key=lambda p: -p[2])[:5]
+        for frame, generation, ms, _ in unplanned:
+            lines.append(f"  frame {frame}: gen{generation} {ms:.3f} ms")
+        if self.sites:
+            frames = max(1, self.frames)
+            lines.append(f"allocations per frame (top {self.trace_allocs}):")
+            top = sorted(self.sites.items(), key=lambda item: -item[1][0])[:self.trace_allocs]
+            for site, (size, count) in top:
+                lines.append(f"  {size/frames:10.1f} B {count/frames:8.2f} blocks  {site}")
+        return "\n".join(lines)
+
+
+class Renderer:
+    """
+    毎フレーム背景ごと画面全体を描き直し，画面全体を転送する描画クラス
+    """
+    def __init__(self, screen: pg.Surface, bg: pg.Surface):
+        """
+        引数1 screen：画面Surface
+        引数2 bg：背景画像
+        """
+        self.screen = screen
+        self.bg = bg
+        self.background = TiledBackground(bg)
+        self.profiler = NO_PROFILER
+        self.overlays = []  # ゲーム画面の上に重ねて描く関数（描画した範囲かNoneを返す）
+        self.alpha = 1.0  # 前のシミュレーション結果から最新の結果までの補間の割合
+
+    def set_background(self, bg: pg.Surface):
+        """
+        背景画像を差し替える
+        """
+        self.bg = bg
+        self.background = TiledBackground(bg)
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        次のフレームで画面全体を描き直させる（リザルトや警告など，画面全体を描き換えた後に呼ぶ）
+        """
+
+    def draw_frame(self, world: GameWorld) -> list[pg.Rect]:
+        """
+        worldとオーバーレイを描画し，描画した範囲のリストを返す
+        """
+        drawn = world.draw(self.screen, self.alpha)
+        for overlay in self.overlays:
+            rect = overlay(self.screen)
+            if rect is not None:
+                drawn.append(rect)
+        return drawn
+
+    def render(self, world: GameWorld):
+        """
+        worldを描画して画面に転送する
+        """
+        self.background.draw(self.screen, world.camera.offset(self.alpha))
+        self.draw_frame(world)
+        self.profiler.lap("draw")
+        pg.display.update()
+        self.profiler.lap("present")
+
+    def capture(self):
+        """
+        場面が画面Surfaceにゲーム画面を下敷きにして描けるようにする（画面Surfaceに直接描く描画クラスでは何もしない）
+        """
+
+    def present_screen(self, surface: pg.Surface):
+        """
+        場面が画面Surfaceに直接描いた内容（タイトル，警告，リザルト）を転送する
+        """
         pg.display.update()
-        clock.tick(50)
 
 
-if __name__ == "__main__":  
-    pg.init()  
-    main()  
-    pg.quit()  
-    sys.exit()
\ No newline at end of file
+class DirtyRenderer(Renderer):
+    """
+    前のフレームでスプライトを描いた範囲だけ背景で塗り直し，
+    変化した範囲だけをpg.display.update(rects)で転送する描画クラス
+    """
+    full_ratio = 0.5  # 変化した面積が画面のこの割合を超えたら全体を転送する
+
+    def __init__(self, screen: pg.Surface, bg: pg.Surface):
+        super().__init__(screen, bg)
+        self.prev: list[pg.Rect] = []  # 前のフレームで描画した範囲
+        self.full = True  # 次のフレームで画面全体を描き直すか
+        self.offset = 0  # 前のフレームのカメラの位置
+
+    def invalidate(self):
+        self.full = True
+
+    def render(self, world: GameWorld):
+        screen, background = self.screen, self.background
+        offset = world.camera.offset(self.alpha)
+        if offset != self.offset:  # スクロールしたら画面全体が変わる
+            self.offset = offset
+            self.full = True
+        if self.full:
+            background.draw(screen, offset)
+            self.prev = self.draw_frame(world)
+            self.profiler.lap("draw")
+            pg.display.update()
+            self.profiler.lap("present")
+            self.full = False
+            return
+        for rect in self.prev:
+            background.draw(screen, offset, rect)  # 前のフレームのスプライトを背景で消す
+        drawn = self.draw_frame(world)
+        dirty = self.prev + drawn
+        self.prev = drawn
+        self.profiler.lap("draw")
+        if sum(r.w*r.h for r in dirty) > self.full_ratio*WIDTH*HEIGHT:
+            pg.display.update()
+        else:
+            pg.display.update(dirty)
+        self.profiler.lap("present")
+
+
+class TextureCanvas:
+    """
+    pygame._sdl2のRendererをSurfaceの代わりに使えるようにするクラス（blit，blits，fillなど描画に使う分だけ）
+    画像は初めて描くときに一度だけTextureに転送し，以後は使い回す
+    ASSETSの派生画像は元画像のTextureを描画時に拡大・回転・反転して描き，派生画像ごとの転送を省く
+    """
+    def __init__(self, renderer: "video.Renderer"):
+        self.renderer = renderer
+        self.textures = weakref.WeakKeyDictionary()  # 画像 -> Texture（画像が捨てられたら消える）
+        self.transforms = weakref.WeakKeyDictionary()  # 派生画像 -> (元画像, 幅, 高さ, 角度, 横反転, 縦反転)
+        self.rect = renderer.get_viewport()  # 描画先の範囲
+
+    @staticmethod
+    def reduce_ops(size: tuple[int, int], ops: tuple) -> "tuple[float, float, float, bool, bool]|None":
+        """
+        AssetCacheの変換列を，元画像に対する(幅, 高さ, 角度, 横反転, 縦反転)にまとめる
+        反転してから回転する順（SDL_RenderCopyExと同じ）で表し，まとめられない変換列ならNoneを返す
+        引数1 size：元画像の大きさ
+        引数2 ops：AssetCache.getに渡した変換列
+        """
+        w, h = size
+        angle, flip_x, flip_y = 0.0, False, False
+        for name, *args in ops:
+            if name == "rotozoom":
+                angle += args[0]
+                w, h = w*args[1], h*args[1]
+            elif name == "flip":
+                if bool(args[0]) != bool(args[1]):  # 片方の軸だけの反転は回転の向きを逆にする
+                    angle = -angle
+                flip_x ^= bool(args[0])
+                flip_y ^= bool(args[1])
+            elif name in ("scale", "scale_by") and angle % 360 == 0:
+                w, h = args if name == "scale" else (int(w*args[0]), int(h*args[0]))
+            elif name == "alpha":  # 透明度は描くたびに画像のget_alpha()から反映する
+                pass
+            else:
+                return None
+        return w, h, angle, flip_x, flip_y
+
+    def texture(self, img: pg.Surface) -> "video.Texture":
+        """
+        画像imgのTextureを返す（画像ごとに一度だけ転送する）
+        """
+        tex = self.textures.get(img)
+        if tex is None:
+            tex = self.textures[img] = video.Texture.from_surface(self.renderer, img)
+        return tex
+
+    def _transform(self, img: pg.Surface) -> "tuple|None":
+        """
+        派生画像imgを元画像のTextureから描くための情報を返す（ASSETSの派生画像でなければNone）
+        """
+        if img in self.transforms:
+            return self.transforms[img]
+        origin = ASSETS.origins.get(img)
+        spec = None
+        if origin is not None:
+            path, ops, alpha = origin
+            base = ASSETS.load(path, alpha)
+            reduced = self.reduce_ops(base.get_size(), ops)
+            if reduced is not None:
+                spec = (base, *reduced)
+        self.transforms[img] = spec
+        return spec
+
+    def blit(self, img: pg.Surface, dest, area: pg.Rect = None) -> pg.Rect:
+        """
+        Surface.blitと同じく画像imgを左上がdestの位置に描き，描画した範囲を返す
+        画像に設定された透明度（set_alpha）は描くたびにTextureへ反映する
+        """
+        x, y = dest[0], dest[1]
+        alpha = img.get_alpha()
+        spec = None if area is not None else self._transform(img)
+        if spec is None:
+            tex = self.texture(img)
+            tex.alpha = 255 if alpha is None else alpha
+            rect = pg.Rect(x, y, *(area.size if area is not None else img.get_size()))
+            tex.draw(srcrect=area, dstrect=rect)
+            return rect.clip(self.rect)
+        base, w, h, angle, flip_x, flip_y = spec
+        tex = self.texture(base)
+        tex.alpha = 255 if alpha is None else alpha
+        rect = pg.Rect(x, y, *img.get_size())
+        dst = pg.Rect(0, 0, round(w), round(h))
+        dst.center = rect.center
+        tex.draw(dstrect=dst, angle=-angle, flip_x=flip_x, flip_y=flip_y)  # SDLは時計回りが正
+        return rect.clip(self.rect)
+
+    def blits(self, seq, doreturn: bool = True) -> "list[pg.Rect]|None":
+        drawn = [self.blit(*item) for item in seq]
+        return drawn if doreturn else None
+
+    def fill(self, color, rect=None) -> pg.Rect:
+        """
+        Surface.fillと同じく範囲rect（省略時は全体）を色colorで塗り，塗った範囲を返す
+        """
+        rect = self.rect.copy() if rect is None else pg.Rect(rect).clip(self.rect)
+        self.renderer.draw_color = pg.Color(color)
+        self.renderer.fill_rect(rect)
+        return rect
+
+    def get_rect(self) -> pg.Rect:
+        return self.rect.copy()
+
+    def get_size(self) -> tuple[int, int]:
+        return self.rect.size
+
+    def get_width(self) -> int:
+        return self.rect.w
+
+    def get_height(self) -> int:
+        return self.rect.h
+
+
+class TextureRenderer(Renderer):
+    """
+    pygame._sdl2のRenderer/Textureで描画する描画クラス（要pygame._sdl2）
+    スプライトの画像はTextureとして一度だけ転送し，透明度・反転・回転は描画時にRendererが行う
+    タイトルや警告などの場面は画面の代わりのsurfaceに描かれ，present_screenでTextureに転送して表示する
+    """
+    def __init__(self, bg: pg.Surface, software: bool = False):
+        """
+        引数1 bg：背景画像
+        引数2 software：Trueならソフトウェアレンダラーを使う（GPUのない環境用）
+        """
+        if video is None:
+            raise RuntimeError("TextureRendererにはpygame._sdl2が必要です")
+        self.window = video.Window("HeroShooter", (WIDTH, HEIGHT))
+        self.device = video.Renderer(self.window, accelerated=0 if software else -1)
+        super().__init__(TextureCanvas(self.device), bg)
+        self.surface = pg.Surface((WIDTH, HEIGHT))  # 場面が描き込む画面Surfaceの代わり
+        self.world = None  # 最後に描いたworld
+
+    def render(self, world: GameWorld):
+        self.world = world
+        self.background.draw(self.screen, world.camera.offset(self.alpha))
+        self.draw_frame(world)
+        self.profiler.lap("draw")
+        self.device.present()
+        self.profiler.lap("present")
+
+    def capture(self):
+        """
+        最後に描いたworldをもう一度描いてsurfaceに読み戻す（表示後の描画先の中身は保証されないため）
+        """
+        if self.world is not None:
+            self.background.draw(self.screen, self.world.camera.offset(self.alpha))
+            self.draw_frame(self.world)
+            self.device.to_surface(self.surface)
+
+    def present_screen(self, surface: pg.Surface):
+        video.Texture.from_surface(self.device, surface).draw()
+        self.device.present()
+
+
+class Scene:
+    """
+    場面（タイトル，プレイ中，ボス警告，被弾硬直，リザルト）の基底クラス
+    待ち時間はtime.sleepではなくフレーム数で数えるため，待っている間もイベント処理と描画が続く
+    """
+    def __init__(self, game: "Game"):
+        self.game = game
+
+    def handle(self, event: pg.event.Event):
+        """
+        イベントを1つ処理する
+        """
+
+    def update(self, key_lst) -> "Scene|None":
+        """
+        1フレーム進め，次のフレームの場面を返す（Noneならゲーム終了）
+        引数 key_lst：pg.key.get_pressed()の結果
+        """
+        return self
+
+    def draw(self):
+        """
+        場面を描画する
+        """
+
+
+class TitleScene(Scene):
+    """
+    スペースキーが押されるまでスタート画面を表示する場面
+    """
+    def __init__(self, game: "Game"):
+        super().__init__(game)
+        self.text = TEXT.render("Press SPACE to Start", (0,0, 0), None, 100)
+        self.rect = self.text.get_rect(center=(WIDTH/2, HEIGHT/2))
+        self.started = False
+
+    def handle(self, event: pg.event.Event):
+        if event.type == pg.KEYDOWN and event.key == pg.K_SPACE:
+            self.started = True # スペースキーでゲーム開始
+
+    def update(self, key_lst) -> Scene:
+        if self.started:
+            self.game.renderer.invalidate()
+            return PlayingScene(self.game)
+        return self
+
+    def draw(self):
+        screen = self.game.screen
+        screen.blit(self.game.renderer.bg, [0, 0])
+        screen.blit(self.text, self.rect)
+        preloader = self.game.preloader
+        if preloader is not None and not preloader.ready:  # 先読みの進み具合
+            status = preloader.progress()
+            screen.blit(TEXT.render(f"Loading {status['loaded']}/{status['total']}", (0, 0, 0), None, 30),
+                        (10, HEIGHT-30))
+        self.game.renderer.present_screen(screen)
+
+
+class PlayingScene(Scene):
+    """
+    入力をGameWorldに渡して1フレームずつ進める場面
+    巻き戻しが有効なら，バックスペースキーを押している間は1フレームずつ前の状態に戻る
+    """
+    def __init__(self, game: "Game"):
+        super().__init__(game)
+        self.keydowns = []
+
+    def handle(self, event: pg.event.Event):
+        if event.type == pg.KEYDOWN:
+            self.keydowns.append(event.key)
+            if self.game.tracer is not None:
+                self.game.tracer.keydown(event.key)
+
+    def update(self, key_lst) -> Scene:
+        rewind, tracer = self.game.rewind, self.game.tracer
+        if rewind is not None and key_lst[pg.K_BACKSPACE]:
+            self.keydowns = []
+            if tracer is not None:
+                tracer.discard()
+            self.game.restore(rewind.rewind())
+            return self
+        world = self.game.world
+        if rewind is not None:
+            rewind.capture(world)  # 進める前の状態を保存する
+        inputs = Inputs.from_keys(key_lst, self.keydowns)
+        if self.game.recorder is not None:
+            self.game.recorder.record(inputs)
+        events = world.step(inputs)
+        if tracer is not None:
+            tracer.tick(world.tmr)
+        self.keydowns = []
+        if world.result is not None:
+            return ResultScene(self.game)
+        if "boss" in events:
+            return BossWarningScene(self.game, self)
+        if "flame_hit" in events:
+            return HitStunScene(self.game, self)
+        return self
+
+    def draw(self):
+        self.game.renderer.render(self.game.world)
+
+
+class TimedScene(Scene):
+    """
+    決められた秒数が経ったら次の場面に移る場面
+    """
+    seconds = 1.0
+
+    def __init__(self, game: "Game", after: Scene):
+        """
+        引数2 after：時間が経った後に移る場面
+        """
+        super().__init__(game)
+        self.after = after
+        self.timer = round(self.seconds * game.sim_rate)  # 残りのシミュレーション回数
+
+    def update(self, key_lst) -> "Scene|None":
+        self.timer -= 1
+        if self.timer <= 0:
+            return self.finish()
+        return self
+
+    def finish(self) -> "Scene|None":
+        return self.after
+
+
+class BossWarningScene(TimedScene):
+    """
+    ボス登場前に1秒間，新しい背景に赤い警告を重ねて表示する場面
+    """
+    seconds = 1.0
+
+    def __init__(self, game: "Game", after: Scene):
+        super().__init__(game, after)
+        self.overlay = pg.Surface((WIDTH, HEIGHT), pg.SRCALPHA)
+        self.overlay.fill((255, 0, 0, 100))  #赤画面
+        self.bg = ASSETS.get("fig/22828803.jpg", ("rotozoom", 0, 1.1), alpha=False)  # 背景の切り替え
+
+    def finish(self) -> Scene:
+        self.game.renderer.set_background(self.bg)
+        return self.after
+
+    def draw(self):
+        screen = self.game.screen
+        screen.blit(self.bg, [0, 0])
+        screen.blit(self.overlay, [0, 0])
+        self.game.renderer.present_screen(screen)
+
+
+class HitStunScene(TimedScene):
+    """
+    炎柱に当たった後，1秒間ゲームを止めて画面をそのまま表示する場面
+    """
+    seconds = 1.0
+
+    def draw(self):
+        self.game.renderer.render(self.game.world)
+
+
+class ResultScene(TimedScene):
+    """
+    リザルト画面を5秒間表示してからゲームを終える場面
+    """
+    seconds = 5.0
+
+    def __init__(self, game: "Game"):
+        super().__init__(game, None)
+        self.shown = False
+
+    def draw(self):
+        if self.shown:  # 一度描いた画面をそのまま表示し続ける
+            return
+        world = self.game.world
+        self.game.renderer.render(world)
+        self.game.renderer.capture()
+        player_hp = 0 if world.result == "gameover" else 1
+        self.game.result.update(self.game.screen, world.bird, world.score, player_hp=player_hp, boss_hp=world.boss.hp)
+        self.game.renderer.present_screen(self.game.screen)
+        self.shown = True
+
+
+class Game:
+    """
+    画面，描画クラス，GameWorldを持ち，場面を切り替えながらメインループを回すクラス
+    シミュレーションは常に1秒にsim_rate回の固定間隔で進め，描画の回数だけをrender_fpsで変えられる
+    """
+    # 速度・重力・アニメーション・TimerWheelの予約はすべて1回あたりの量なので，この回数は変えない
+    sim_rate = FPS
+
+    def __init__(self, screen: pg.Surface, renderer: Renderer, world: GameWorld,
+                 profiler: NullProfiler = NO_PROFILER, recorder: InputRecorder = None,
+                 preloader: AssetPreloader = None, render_fps: int = FPS,
+                 max_steps: int = 5, rewind: RewindBuffer = None, tracer: LatencyTracer = None,
+                 memory: MemoryMode = None):
+        """
+        引数4 profiler：処理段階ごとの時間を記録するプロファイラ（F3でオーバーレイ表示）
+        引数5 recorder：指定した場合はworldに渡した入力を記録する
+        引数6 preloader：指定した場合は毎フレーム先読みの済んだ画像をキャッシュへ移す
+        引数7 render_fps：1秒あたりの描画回数の上限（0なら無制限，sim_rateと違えば位置を補間して描く）
+        引数8 max_steps：描画が遅れたときに1回の描画の間に進めるシミュレーションの最大回数
+        引数9 rewind：指定した場合は毎フレームの状態を保存し，プレイ中に巻き戻せるようにする
+        引数10 tracer：指定した場合はキー入力から表示までの遅れを記録する
+        引数11 memory：指定した場合は場面の切り替えとフレームの最後をGCしてよいところとして知らせる
+        """
+        self.render_fps = render_fps
+        self.max_steps = max_steps
+        self.interpolate = render_fps != self.sim_rate  # 描画とシミュレーションの間隔が違うときだけ補間する
+        self.screen = screen
+        self.renderer = renderer
+        self.world = world
+        self.recorder = recorder
+        self.preloader = preloader
+        self.rewind = rewind
+        self.tracer = tracer
+        self.memory = memory
+        self.stage_bg = renderer.bg  # ボス登場前まで巻き戻したときに戻す背景
+        self.profiler = world.profiler = renderer.profiler = profiler
+        if profiler.enabled:
+            renderer.overlays.append(profiler.draw_overlay)
+        self.result = Result(player_hp=1, boss_hp=world.boss.hp)
+        self.clock = pg.time.Clock()
+
+    def restore(self, world: "GameWorld|None"):
+        """
+        RewindBufferから復元したworldに差し替える（記録中の入力も同じフレームまで切り詰める）
+        """
+        if world is None:
+            return
+        if self.world.boss_mode and not world.boss_mode:
+            self.renderer.set_background(self.stage_bg)
+        world.profiler = self.profiler
+        self.world = world
+        if self.recorder is not None:
+            del self.recorder.frames[world.tmr:]
+        self.renderer.invalidate()
+
+    def run(self, scene: Scene) -> "int|None":
+        """
+        sceneから始めてメインループを回す
+        戻り値：ウィンドウが閉じられたら0，リザルト表示を終えたらNone
+        """
+        profiler = self.profiler
+        step_ms = 1000 / self.sim_rate
+        acc = 0.0  # まだシミュレーションに反映していない経過時間（ミリ秒）
+        elapsed = 0
+        while scene is not None:
+            profiler.begin()
+            events = pg.event.get()
+            if self.tracer is not None:
+                self.tracer.poll()
+            for event in events:
+                if event.type == pg.QUIT:
+                    return 0
+                if event.type == pg.KEYDOWN and event.key == pg.K_F3 and profiler.enabled:
+                    profiler.show = not profiler.show  # 計測オーバーレイの表示切り替え
+                scene.handle(event)
+            if self.preloader is not None and not self.preloader.ready:
+                self.preloader.poll()
+            profiler.lap("events")
+            # 固定間隔でシミュレーションを進める（遅れた分はmax_steps回までまとめて追いつく）
+            acc = min(acc + elapsed, self.max_steps*step_ms)
+            key_lst = pg.key.get_pressed()
+            while acc >= step_ms and scene is not None:
+                if self.interpolate:
+                    self.world.remember_positions()
+                before, scene = scene, scene.update(key_lst)
+                if scene is not before and self.memory is not None:
+                    self.memory.safe_point()
+                acc -= step_ms
+            if scene is not None:
+                self.renderer.alpha = acc/step_ms if self.interpolate else 1.0
+                scene.draw()
+                if self.tracer is not None:
+                    self.tracer.present()
+            profiler.end(self.world)
+            if self.memory is not None:
+                self.memory.end_frame()
+            elapsed = self.clock.tick(self.render_fps)
+
+
+def demo_inputs(tmr: int) -> Inputs:
+    """
+    画面なしで動かすときの自動操作
+    左右に歩きながら一定間隔でビームとジャンプを繰り返す
+    """
+    return Inputs(left=tmr//100%2 == 1, right=tmr//100%2 == 0,
+                  fire=int(tmr%10 == 0), jump=tmr%37 == 0)
+
+
+def run_headless(frames: int, world_opts: dict = None, profiler: NullProfiler = NO_PROFILER,
+                 record: str = None, memory: MemoryMode = None) -> GameWorld:
+    """
+    画面を作らずにframesフレームだけゲームを進め，1秒あたりの処理フレーム数を表示する
+    引数2 world_opts：GameWorldに渡すオプション
+    引数3 profiler：処理段階ごとの時間を記録するプロファイラ
+    引数4 record：指定した場合は入力をこのリプレイファイルに保存する
+    引数5 memory：指定した場合はGCの記録を始め，毎フレームの最後を知らせる
+    """
+    prerender_bomb_bank()
+    world = GameWorld(**(world_opts or {}))
+    world.profiler = profiler
+    recorder = InputRecorder(world)
+    if memory is not None:
+        memory.start()
+    start = time.perf_counter()
+    for _ in range(frames):
+        profiler.begin()
+        inputs = demo_inputs(world.tmr)
+        recorder.record(inputs)
+        world.step(inputs)
+        profiler.end(world)
+        if memory is not None:
+            memory.end_frame()
+        if world.result is not None:
+            break
+    elapsed = time.perf_counter() - start
+    print(f"{world.tmr} frames in {elapsed:.3f}s ({world.tmr/elapsed:.0f} ticks/s) "
+          f"result={world.result} score={world.score.value}")
+    if record:
+        recorder.save(record, world)
+    print("assets:", ASSETS.stats())
+    print("text:", TEXT.stats())
+    for name, stats in pool_stats().items():
+        print(f"pool {name}: {stats}")
+    return world
+
+
+def run_replay(path: str, world_opts: dict = None) -> GameWorld:
+    """
+    リプレイファイルの入力で画面を作らずに最速でゲームを再実行し，
+    最後の状態が記録時と一致するかを表示する
+    引数2 world_opts：リプレイファイルに保存されたオプションを上書きするもの
+    """
+    seed, opts, frames, digest = InputRecorder.load(path)
+    opts.update(world_opts or {})
+    prerender_bomb_bank()
+    world = GameWorld(**opts, seed=seed)
+    start = time.perf_counter()
+    for inputs in frames:
+        world.step(inputs)
+    elapsed = time.perf_counter() - start
+    match = "match" if world.digest() == digest else "MISMATCH"
+    print(f"replayed {len(frames)} frames in {elapsed:.3f}s ({len(frames)/max(elapsed, 1e-9):.0f} ticks/s) "
+          f"seed={seed} opts={opts} result={world.result} score={world.score.value} state={match}")
+    return world
+
+
+def stage_assets() -> list[tuple[str, tuple, bool]]:
+    """
+    ゲーム中に初めて使われる画像（ボス戦の背景，ボス，敵機，爆発，ビーム）の一覧を返す
+    変換列はそれぞれのクラスがASSETS.getに渡すものと同じにする
+    """
+    specs = [("fig/22828803.jpg", (("rotozoom", 0, 1.1),), False),
+             ("fig/BOSS.png", (("rotozoom", 0, 0.2),), True),
+             ("fig/explosion.gif", (("flip", 1, 1),), True)]
+    specs += [(path, (("scale_by", 0.3),), True) for path in Enemy.img_files]
+    for vx in (-1, 0, 1):  # こうかとんの8方向の向きごとのビーム
+        for vy in (-1, 0, 1):
+            if (vx, vy) != (0, 0):
+                specs.append(("fig/beam.png", (("rotozoom", math.degrees(math.atan2(-vy, vx)), 1.0),), True))
+    return specs
+
+
+def bundle_assets() -> list[tuple[str, tuple, bool]]:
+    """
+    アセットバンドルに入れる画像の一覧を返す
+    fig/の全ファイルの元画像（JPGはα無し）と，タイトル画面までに使う変換済みの画像（背景，ハート，こうかとん），
+    stage_assets()の画像
+    """
+    specs = [(f"fig/{name}", (), not name.endswith(".jpg")) for name in sorted(os.listdir("fig"))]
+    specs.append(("fig/22823124.jpg", (("rotozoom", 0, 1.1),), False))
+    specs += [(path, (("scale", 40, 40),), True) for path in ("fig/color_heart2.png", "fig/no_heart1.png")]
+    specs += [(f"fig/{num}.png", ops, True) for num in PLAYER_IMAGES for ops in Bird.img_ops.values()]
+    return list(dict.fromkeys(specs + stage_assets()))
+
+
+def main(world_opts: dict = None, dirty: bool = False, profiler: NullProfiler = None, record: str = None,
+         render_fps: int = FPS, backend: str = "surface", software: bool = False,
+         rewind: float = 0, rewind_mb: float = 64, tracer: LatencyTracer = None,
+         memory: MemoryMode = None, bundle: "str|None" = AssetBundle.PATH):
+    """
+    引数1 world_opts：GameWorldに渡すオプション
+    引数2 dirty：Trueなら変化した範囲だけを描き直すDirtyRendererを使う
+    引数3 profiler：処理段階ごとの時間を記録するプロファイラ（省略時はF3で表示できるものを作る）
+    引数4 record：指定した場合は入力をこのリプレイファイルに保存する
+    引数5 render_fps：1秒あたりの描画回数の上限（0なら無制限，FPSと違えば位置を補間して描く）
+    引数6 backend："surface"ならSurfaceに描いて転送し，"texture"ならTextureRendererで描く
+    引数7 software：backendが"texture"のとき，ソフトウェアレンダラーを使うか
+    引数8 rewind：巻き戻せる秒数（0なら巻き戻さない）
+    引数9 rewind_mb：巻き戻し用に保存する状態の上限（MB）
+    引数10 tracer：指定した場合はキー入力から表示までの遅れを記録する
+    引数11 memory：指定した場合は画像の読み込み後にGCの記録（と凍結）を始める
+    引数12 bundle：アセットバンドルのパス（ファイルがあれば画像とフォントをここから読む，Noneなら使わない）
+    """
+    if bundle and os.path.exists(bundle):
+        AssetBundle(bundle).install()
+    pg.display.set_caption("HeroShooter")
+    if backend == "surface":
+        screen = pg.display.set_mode((WIDTH, HEIGHT))
+        ASSETS.convert_all()  # 画面生成前に読み込んだ画像を画面の形式に揃える
+    prerender_bomb_bank()
+    bg_img = ASSETS.get("fig/22823124.jpg", ("rotozoom", 0, 1.1), alpha=False)
+    world = GameWorld(**(world_opts or {}))
+    if backend == "texture":
+        renderer = TextureRenderer(bg_img, software)
+        screen = renderer.surface
+    else:
+        renderer = (DirtyRenderer if dirty else Renderer)(screen, bg_img)
+    recorder = InputRecorder(world) if record else None
+    preloader = AssetPreloader(stage_assets()).start()  # タイトル画面の間に読み込んでおく
+    rewind_buffer = RewindBuffer(rewind, int(rewind_mb * (1 << 20))) if rewind > 0 else None
+    game = Game(screen, renderer, world, profiler or FrameProfiler(), recorder, preloader,
+                render_fps, rewind=rewind_buffer, tracer=tracer, memory=memory)
+    if memory is not None:
+        memory.start()
+    try:
+        return game.run(TitleScene(game))
+    finally:
+        if recorder is not None:
+            recorder.save(record, game.world)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HeroShooter")
+    parser.add_argument("--headless", type=int, metavar="FRAMES",
+                        help="画面を作らずに指定フレーム数だけ進め，処理速度を表示する")
+    parser.add_argument("--bullet-engine", action="store_true",
+                        help="爆弾をNumPy配列でまとめて処理する（要NumPy）")
+    parser.add_argument("--dirty", action="store_true",
+                        help="変化した範囲だけを描き直して転送する")
+    parser.add_argument("--backend", choices=("surface", "texture"), default="surface",
+                        help="描画方式（textureはpygame._sdl2のRenderer/Textureで描く）")
+    parser.add_argument("--software-renderer", action="store_true",
+                        help="--backend textureでソフトウェアレンダラーを使う")
+    parser.add_argument("--profile-csv", metavar="PATH",
+                        help="終了時に処理段階ごとのフレーム時間をCSVに書き出す")
+    parser.add_argument("--profile-frames", type=int, default=600, metavar="N",
+                        help="プロファイラが記録しておくフレーム数")
+    parser.add_argument("--trace-latency", action="store_true",
+                        help="終了時にキー入力から画面に表示されるまでの遅れを操作ごとに表示する")
+    parser.add_argument("--latency-csv", metavar="PATH",
+                        help="キー入力ごとの遅れの記録をCSVに書き出す（--trace-latencyを含む）")
+    parser.add_argument("--manual-gc", action="store_true",
+                        help="読み込み後のオブジェクトを凍結し，GCを場面の切り替えとフレームの最後にだけ行う")
+    parser.add_argument("--gc-report", action="store_true",
+                        help="終了時にGCの回数と止まり時間を表示する")
+    parser.add_argument("--trace-allocs", type=int, default=0, metavar="N",
+                        help="フレームごとに増えたメモリを確保した場所ごとに集計し，上位N件を表示する（遅くなる）")
+    parser.add_argument("--bundle", default=AssetBundle.PATH, metavar="PATH",
+                        help="build_bundle.pyで作ったアセットバンドル（あれば画像とフォントをデコードせずに読む）")
+    parser.add_argument("--no-bundle", action="store_true", help="アセットバンドルを使わない")
+    parser.add_argument("--render-fps", type=int, default=FPS, metavar="FPS",
+                        help="1秒あたりの描画回数の上限（0なら無制限）．ゲームを進める回数（50）と違うときは位置を補間して描く")
+    parser.add_argument("--stage-width", type=int, default=WIDTH, metavar="PX",
+                        help="ステージの横幅（画面より長ければスクロールする）")
+    parser.add_argument("--precise-hitbox", action="store_true",
+                        help="衝突判定を矩形ではなく爆弾の円と画像のマスクで行う")
+    parser.add_argument("--boss-patterns", action="store_true",
+                        help="ボスの攻撃に表から撃つ弾幕（ring，spread，spiral，volley）を加える")
+    parser.add_argument("--rewind", type=float, default=0, metavar="SECONDS",
+                        help="直近の指定秒数の状態を保存し，バックスペースキーを押している間巻き戻す")
+    parser.add_argument("--rewind-mb", type=float, default=64, metavar="MB",
+                        help="巻き戻し用に保存する状態の上限（MB）")
+    parser.add_argument("--seed", type=int, help="乱数の種")
+    parser.add_argument("--record", metavar="PATH", help="入力をリプレイファイルに記録する")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="リプレイファイルを画面なし・最速で再実行し，記録時と同じ結果になるか確かめる")
+    args = parser.parse_args()
+    profiler = FrameProfiler(args.profile_frames)
+    tracer = LatencyTracer() if args.trace_latency or args.latency_csv else None
+    memory = (MemoryMode(args.manual_gc, args.trace_allocs)
+              if args.manual_gc or args.gc_report or args.trace_allocs else None)
+    world_opts = {"bullet_engine": args.bullet_engine, "seed": args.seed, "stage_width": args.stage_width,
+                  "boss_patterns": args.boss_patterns, "precise_hitbox": args.precise_hitbox}
+    if args.headless or args.replay:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pg.init()
+    if args.replay:
+        run_replay(args.replay, {"bullet_engine": True} if args.bullet_engine else None)
+    elif args.headless:
+        run_headless(args.headless, world_opts, profiler, args.record, memory)
+    else:
+        main(world_opts, args.dirty, profiler, args.record, args.render_fps,
+             args.backend, args.software_renderer, args.rewind, args.rewind_mb, tracer, memory,
+             None if args.no_bundle else args.bundle)
+    if args.profile_csv:
+        profiler.dump_csv(args.profile_csv)
+    if tracer is not None:
+        print(tracer.report())
+        if args.latency_csv:
+            tracer.dump_csv(args.latency_csv)
+    if memory is not None:
+        memory.stop()
+        print(memory.report())
+    pg.quit()
+    sys.exit()
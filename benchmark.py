@@ -0,0 +1,599 @@
+"""
+HeroShooterの性能計測スクリプト
+python benchmark.py collision：衝突判定の総当たりとSpatialHashの比較
+python benchmark.py hitbox：矩形，精密判定（円の式とキャッシュしたマスク），毎回マスクを作る判定の比較
+python benchmark.py render：全体描画（Renderer），差分描画（DirtyRenderer），Texture描画（TextureRenderer）の比較
+python benchmark.py scenarios：決まった場面を一定フレーム動かし，処理段階ごとの時間とメモリをJSONで出力する
+    --baseline FILEを指定すると保存済みの結果と比べ，--thresholdを超えて遅く（大きく）なったら終了コード1で終わる
+python benchmark.py vecenv：VecEnvの作業プロセス数と1回に送るフレーム数ごとの処理速度を，同じプロセスのループと比較する
+python benchmark.py rewind：場面ごとにRewindBufferの保存・復元の時間と1フレームあたりのバイト数を計測する
+python benchmark.py gc：場面ごとに自動のGCとMemoryMode（凍結と手動の回収）でフレーム時間の最大とGCの止まり時間を比べる
+python benchmark.py pacing：描画回数（30/60/120Hzなど）を変えても，同じ時間でボスが同じ状態になるかを確かめる
+python benchmark.py startup：プロセスの起動から最初のタイトル画面の転送までの時間を，アセットバンドルの有無で比べる
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame as pg
+
+import HeroShooter as hs
+
+
+def make_group(n: int, size: tuple[int, int], rng: random.Random) -> pg.sprite.Group:
+    """
+    画面内のランダムな位置に，大きさsizeのスプライトをn個並べたグループを作る
+    """
+    group = pg.sprite.Group()
+    for _ in range(n):
+        s = pg.sprite.Sprite()
+        s.rect = pg.Rect(rng.randrange(hs.WIDTH-size[0]), rng.randrange(hs.HEIGHT-size[1]), *size)
+        group.add(s)
+    return group
+
+
+def bench_collision(sizes: list[int], repeat: int, dokill: bool):
+    """
+    爆弾n個とビームn個のgroupcollide(bombs, beams, dokill, dokill)を
+    総当たりとSpatialHashで計測し，結果が一致することも確かめる
+    SpatialHashの時間にはグリッドの作り直し（sync）も含む
+    """
+    print(f"{'n':>6} {'brute ms':>10} {'grid ms':>10} {'grid us/obj':>12}")
+    for n in sizes:
+        brute = grid = 0.0
+        for r in range(repeat):
+            order_a = make_group(n, (20, 20), random.Random(r)).sprites()
+            order_b = make_group(n, (40, 10), random.Random(r+1000)).sprites()
+            index_a = {s: i for i, s in enumerate(order_a)}
+            index_b = {s: i for i, s in enumerate(order_b)}
+
+            bombs, beams = pg.sprite.Group(order_a), pg.sprite.Group(order_b)
+            start = time.perf_counter()
+            expected = pg.sprite.groupcollide(bombs, beams, dokill, dokill)
+            brute += time.perf_counter() - start
+            expected = {index_a[a]: sorted(index_b[b] for b in bs) for a, bs in expected.items()}
+
+            bombs, beams = pg.sprite.Group(order_a), pg.sprite.Group(order_b)
+            beam_grid = hs.SpatialHash()
+            start = time.perf_counter()
+            beam_grid.sync(beams)
+            got = hs.grid_groupcollide(bombs, beams, beam_grid, dokill, dokill)
+            grid += time.perf_counter() - start
+            got = {index_a[a]: sorted(index_b[b] for b in bs) for a, bs in got.items()}
+            assert got == expected, f"n={n}: SpatialHashの結果が総当たりと一致しません"
+        brute, grid = brute/repeat*1000, grid/repeat*1000
+        print(f"{n:>6} {brute:>10.2f} {grid:>10.2f} {grid*1000/n:>12.2f}")
+
+
+def bench_hitbox(n: int, repeat: int):
+    """
+    こうかとんの周りに置いた爆弾n個との衝突判定を，矩形，collide_precise，
+    毎回pg.mask.from_surfaceでマスクを作る判定の3通りで計測し，当たった数も表示する
+    """
+    pg.display.set_mode((hs.WIDTH, hs.HEIGHT))
+    hs.ASSETS.convert_all()
+    rng = random.Random(0)
+    bird = hs.Bird(3, (hs.WIDTH//2, hs.HEIGHT//2))
+    bombs = []
+    for _ in range(n):
+        center = (bird.rect.centerx + rng.randint(-120, 120), bird.rect.centery + rng.randint(-120, 120))
+        bombs.append(hs.PatternBomb(center, 0, 0, rng.randint(10, 50), rng.randrange(len(hs.Bomb.colors))))
+
+    def naive(a, b):
+        offset = (b.rect.x - a.rect.x, b.rect.y - a.rect.y)
+        return pg.mask.from_surface(a.image).overlap(pg.mask.from_surface(b.image), offset) is not None
+
+    tests = {
+        "rect": lambda a, b: True,
+        "precise": hs.collide_precise,
+        "mask every call": naive,
+    }
+    print(f"{'method':>16} {'ms':>8} {'hits':>6}")
+    for name, test in tests.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            hits = sum(1 for b in bombs if bird.rect.colliderect(b.rect) and test(bird, b))
+        print(f"{name:>16} {(time.perf_counter()-start)/repeat*1000:>8.3f} {hits:>6}")
+
+
+def bench_render(frames: int, software: bool):
+    """
+    同じ乱数の種と自動操作でゲームを進め，描画と転送にかかる時間を描画クラスごとに計測する
+    引数2 software：TextureRendererでソフトウェアレンダラーを使うか
+    """
+    screen = pg.display.set_mode((hs.WIDTH, hs.HEIGHT))
+    hs.ASSETS.convert_all()
+    hs.prerender_bomb_bank()
+    bg = hs.ASSETS.get("fig/22823124.jpg", ("rotozoom", 0, 1.1), alpha=False)
+    makers = {"Renderer": lambda: hs.Renderer(screen, bg), "DirtyRenderer": lambda: hs.DirtyRenderer(screen, bg)}
+    if hs.video is not None:
+        makers["TextureRenderer"] = lambda: hs.TextureRenderer(bg, software=software)
+    for name, make in makers.items():
+        random.seed(0)
+        world = hs.GameWorld()
+        renderer = make()
+        elapsed = 0.0
+        for _ in range(frames):
+            world.step(hs.demo_inputs(world.tmr))
+            start = time.perf_counter()
+            renderer.render(world)
+            elapsed += time.perf_counter() - start
+            if world.result is not None:
+                break
+        print(f"{name:>15}: {elapsed/world.tmr*1000:.3f} ms/frame ({world.tmr} frames)")
+
+
+def bench_vecenv(envs: int, frames: int, workers: list[int], batches: list[int]):
+    """
+    envs個のゲームを自動操作でframesフレーム進め，1秒あたりのゲームフレーム数を計測する
+    基準は同じプロセスでGameWorldのリストを順に進めるだけのループで，
+    VecEnvは作業プロセス数と，1回のやりとりで送るフレーム数（1ならstep，2以上ならstep_many）ごとに比べる
+    どの組み合わせでも最後の結果が同じになることも確かめる
+    """
+    import numpy as np
+    from vecenv import VecEnv
+    codes = np.array([hs.InputRecorder.encode(hs.demo_inputs(tmr)) for tmr in range(frames)], dtype=np.uint8)
+    plan = np.repeat(codes[:, None], envs, axis=1)  # (フレーム数, ゲーム数)
+    hs.prerender_bomb_bank()
+    worlds = [hs.GameWorld(seed=seed) for seed in range(envs)]
+    start = time.perf_counter()
+    for world in worlds:
+        for code in codes.tolist():
+            if world.result is None:
+                world.step(hs.InputRecorder.decode(code))
+    base = envs*frames/(time.perf_counter() - start)
+    expected = [(w.result, w.score.value, w.tmr) for w in worlds]
+    print(f"{'workers':>8} {'batch':>6} {'frames/s':>10} {'speedup':>8}")
+    print(f"{'loop':>8} {'-':>6} {base:>10.0f} {1:>7.2f}x")
+    for w in workers:
+        for batch in batches:
+            with VecEnv(envs, workers=w) as env:
+                env.reset()
+                start = time.perf_counter()
+                for t in range(0, frames, batch):
+                    if batch == 1:
+                        env.step(plan[t])
+                    else:
+                        env.step_many(plan[t:t+batch])
+                elapsed = time.perf_counter() - start
+                results = env.results()
+            assert results == expected, f"workers={w}, batch={batch}: 結果が同じプロセスで進めたときと変わりました"
+            rate = envs*frames/elapsed
+            print(f"{w:>8} {batch:>6} {rate:>10.0f} {rate/base:>7.2f}x")
+
+
+def move_inputs(tmr: int, fire: int = 0) -> hs.Inputs:
+    """
+    こうかとんを50フレームごとに左右へ往復させる入力
+    """
+    left = (tmr // 50) % 2 == 0
+    return hs.Inputs(left=left, right=not left, fire=fire)
+
+
+def keep_alive(world: hs.GameWorld):
+    """
+    場面が途中で終わらないよう，こうかとんを無敵にしてボスのHPを満タンに戻す
+    """
+    world.bird.is_invincible = True
+    world.bird.invincible_timer = 300
+    world.boss.hp = world.boss.maxhp
+
+
+def setup_enemies(world: hs.GameWorld, n: int):
+    """
+    停止位置に着いた敵機をn体並べ，ボスは出さない
+    """
+    world.boss_spawned = True  # tmr == 1000でボスが出ないようにする
+    for _ in range(n):
+        emy = hs.Enemy(world.rng)
+        emy.rect.left = emy.target_x
+        world.add_enemy(emy)
+
+
+def setup_boss(world: hs.GameWorld, n: int):
+    """
+    最初のフレームでボスを登場させる
+    """
+    world.tmr = 1000
+
+
+def boss_tick(pattern: str):
+    """
+    ボスが待機状態になるたびにpatternの攻撃を始めさせる処理を作る
+    """
+    def tick(world: hs.GameWorld, n: int) -> hs.Inputs:
+        if world.boss.state == "idle":
+            world.boss.start_attack(pattern)
+        return move_inputs(world.tmr, fire=world.tmr % 10 == 0)
+    return tick
+
+
+def patterns_tick(world: hs.GameWorld, n: int) -> hs.Inputs:
+    """
+    ボスが待機状態になるたびにBOSS_PATTERNSの弾幕を順に撃たせる
+    """
+    boss = world.boss
+    if boss.state == "idle":
+        names = list(boss.patterns)
+        boss.start_attack(names[(names.index(boss.attack_pattern) + 1) % len(names)]
+                          if boss.attack_pattern in names else names[0])
+    return move_inputs(world.tmr, fire=world.tmr % 10 == 0)
+
+
+def stress_tick(world: hs.GameWorld, n: int) -> hs.Inputs:
+    """
+    画面上端のランダムな位置から爆弾を投げ，常にn個前後の爆弾がある状態にする
+    """
+    src = pg.sprite.Sprite()
+    src.rect = pg.Rect(0, 0, 1, 1)
+    for _ in range(min(n - len(world.bombs), n // 20)):  # 1フレームに増やす数は抑える
+        src.rect.center = (world.rng.randrange(hs.WIDTH), world.rng.randrange(hs.HEIGHT // 3))
+        hs.launch_bomb(world.bombs, src, world.bird, rng=world.rng)
+    return move_inputs(world.tmr, fire=1)
+
+
+def stage_tick(world: hs.GameWorld, n: int) -> hs.Inputs:
+    """
+    右へ走り続けながらビームを撃ち，スクロールさせ続ける（ボスは出さない）
+    """
+    world.boss_spawned = True
+    return hs.Inputs(right=True, fire=world.tmr % 5 == 0)
+
+
+# 場面名: (準備処理, 毎フレームの入力を作る処理, nの既定値)
+SCENARIOS = {
+    "enemies": (setup_enemies, lambda world, n: move_inputs(world.tmr), 40),
+    "boss_bombing": (setup_boss, boss_tick("bombing"), 0),
+    "boss_flame": (setup_boss, boss_tick("flame"), 0),
+    "boss_cannon": (setup_boss, boss_tick("cannon"), 0),
+    "boss_patterns": (setup_boss, patterns_tick, 0),
+    "beam_spam": (setup_enemies, lambda world, n: move_inputs(world.tmr, fire=3), 10),
+    "stress": (lambda world, n: setup_enemies(world, 0), stress_tick, 3000),
+    "long_stage": (lambda world, n: None, stage_tick, 50),
+}
+# 場面名: nからGameWorldのオプションを作る処理（long_stageのnはステージの長さ（画面何枚分か））
+SCENARIO_OPTS = {
+    "long_stage": lambda n: {"stage_width": n*hs.WIDTH},
+    "boss_patterns": lambda n: {"boss_patterns": True},
+}
+
+
+def run_scenario(name: str, frames: int, n: int, world_opts: dict, screen: pg.Surface, bg: pg.Surface,
+                 profiler: hs.NullProfiler = hs.NO_PROFILER, memory: hs.MemoryMode = None) -> hs.GameWorld:
+    """
+    場面nameを乱数の種0でframesフレーム動かす（描画と転送も含む）
+    引数8 memory：指定した場合は準備の後にGCの記録を始め，毎フレームの最後を知らせる
+    """
+    setup, tick, _ = SCENARIOS[name]
+    opts = SCENARIO_OPTS.get(name, lambda n: {})(n)
+    world = hs.GameWorld(**{**world_opts, **opts, "seed": 0})
+    renderer = hs.Renderer(screen, bg)
+    world.profiler = renderer.profiler = profiler
+    setup(world, n)
+    if memory is not None:
+        memory.start()
+    for _ in range(frames):
+        profiler.begin()
+        keep_alive(world)
+        inputs = tick(world, n)
+        profiler.lap("events")
+        world.step(inputs)
+        renderer.render(world)
+        profiler.end(world)
+        if memory is not None:
+            memory.end_frame()
+    if memory is not None:
+        memory.stop()
+    return world
+
+
+def bench_scenarios(names: list[str], frames: int, n: "int|None", world_opts: dict, memory: bool) -> dict:
+    """
+    場面ごとに1フレームあたりの処理段階別の平均時間（ミリ秒），合計のp95，
+    各グループの最大数，（memoryがTrueなら）Pythonのメモリ使用量のピーク（KB）を計測する
+    メモリは計測の負荷で時間が狂わないよう，時間とは別に一度動かして測る
+    """
+    screen = pg.display.set_mode((hs.WIDTH, hs.HEIGHT))
+    hs.ASSETS.convert_all()
+    hs.prerender_bomb_bank()
+    bg = hs.ASSETS.get("fig/22823124.jpg", ("rotozoom", 0, 1.1), alpha=False)
+    results = {}
+    for name in names:
+        size = SCENARIOS[name][2] if n is None else n
+        result = {"frames": frames, "n": size}
+        if memory:  # 画像などのキャッシュもここで温まる
+            tracemalloc.start()
+            run_scenario(name, frames, size, world_opts, screen, bg)
+            result["peak_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            tracemalloc.stop()
+        profiler = hs.FrameProfiler(frames)
+        run_scenario(name, frames, size, world_opts, screen, bg, profiler)
+        ms = profiler.means()
+        totals = sorted(sum(profiler.times[p][i] for p in profiler.phases) * 1000 for i in range(frames))
+        result["ms"] = {p: round(v, 4) for p, v in ms.items()}
+        result["ms"]["total"] = round(sum(ms.values()), 4)
+        result["p95_total_ms"] = round(totals[min(frames-1, int(0.95*frames))], 4)
+        result["max_counts"] = {g: max(profiler.counts[g]) for g in profiler.groups}
+        results[name] = result
+        print(f"{name:>13}: {result['ms']['total']:.3f} ms/frame", file=sys.stderr)
+    return results
+
+
+def bench_rewind(names: list[str], frames: int, world_opts: dict, compress: bool):
+    """
+    場面ごとに毎フレームRewindBufferへ保存しながら画面なしで動かし，
+    保存時間のp50/p95/最大，1フレームあたりのバイト数，スナップショットが参照している共有物（画像など）の大きさ，
+    1秒分巻き戻す復元の時間を計測する
+    巻き戻した状態から同じ入力で進め直して，同じ状態に戻ることも確かめる
+    """
+    hs.prerender_bomb_bank()
+    print(f"{'scenario':>13} {'p50 ms':>7} {'p95 ms':>7} {'max ms':>7} {'bytes/frame':>11} {'shared MB':>9} "
+          f"{'restore ms':>10}")
+    for name in names:
+        setup, tick, n = SCENARIOS[name]
+        opts = SCENARIO_OPTS.get(name, lambda n: {})(n)
+        world = hs.GameWorld(**{**world_opts, **opts, "seed": 0})
+        setup(world, n)
+        buffer = hs.RewindBuffer(seconds=1, max_bytes=1 << 30, compress=compress)
+        times = []
+        for _ in range(frames):
+            keep_alive(world)
+            start = time.perf_counter()
+            buffer.capture(world)
+            times.append(time.perf_counter() - start)
+            world.step(tick(world, n))
+        stats = buffer.stats()
+        count = len(buffer)
+        start = time.perf_counter()
+        restored = buffer.rewind(count)
+        restore = time.perf_counter() - start
+        for _ in range(count):
+            keep_alive(restored)
+            restored.step(tick(restored, n))
+        assert restored.digest() == world.digest(), f"{name}: 巻き戻した状態から進め直すと結果が変わりました"
+        times.sort()
+        print(f"{name:>13} {times[frames//2]*1000:>7.3f} {times[int(0.95*frames)]*1000:>7.3f} "
+              f"{times[-1]*1000:>7.3f} {stats['bytes_per_frame']:>11.0f} {stats['shared_bytes']/(1 << 20):>9.2f} "
+              f"{restore*1000:>10.3f}")
+
+
+def bench_gc(names: list[str], frames: int, world_opts: dict):
+    """
+    場面ごとに，自動のGCとMemoryMode(manual=True)でframesフレーム動かし，
+    フレーム時間のp99と最大，フレームの途中で止まったGCの回数と合計・最大の時間（ミリ秒）を比べる
+    場面の最後の全世代の回収（safe_point）はフレームの外なので数えない
+    """
+    screen = pg.display.set_mode((hs.WIDTH, hs.HEIGHT))
+    hs.ASSETS.convert_all()
+    hs.prerender_bomb_bank()
+    bg = hs.ASSETS.get("fig/22823124.jpg", ("rotozoom", 0, 1.1), alpha=False)
+    print(f"{'scenario':>13} {'gc':>6} {'p99 ms':>7} {'max ms':>7} {'pauses':>6} {'gc ms':>7} {'gc max':>7}")
+    for name in names:
+        size = SCENARIOS[name][2]
+        for manual in (False, True):
+            profiler = hs.FrameProfiler(frames)
+            memory = hs.MemoryMode(manual)
+            run_scenario(name, frames, size, world_opts, screen, bg, profiler, memory)
+            totals = sorted(sum(profiler.times[p][i] for p in profiler.phases) * 1000 for i in range(frames))
+            pauses = [ms for frame, _, ms, _ in memory.pauses if frame < frames]
+            print(f"{name:>13} {'manual' if manual else 'auto':>6} {totals[int(0.99*frames)]:>7.3f} "
+                  f"{totals[-1]:>7.3f} {len(pauses):>6} {sum(pauses):>7.3f} {max(pauses, default=0):>7.3f}")
+
+
+class SteadyClock:
+    """
+    pg.time.Clockの代わりに，毎回ちょうど1/hz秒（整数ミリ秒に丸めても合計はずれない）経ったことにする時計
+    seconds秒分を刻み終えたら，次のtickでpg.QUITを送ってGame.runを終わらせる
+    """
+    def __init__(self, hz: int, seconds: int):
+        self.hz = hz
+        self.ticks = 0
+        self.total = seconds * hz  # 刻む回数
+
+    def tick(self, framerate: int = 0) -> int:
+        if self.ticks >= self.total:
+            pg.event.post(pg.event.Event(pg.QUIT))
+            return 0
+        self.ticks += 1
+        return round(self.ticks*1000/self.hz) - round((self.ticks-1)*1000/self.hz)
+
+
+class DemoScene(hs.PlayingScene):
+    """
+    キーボードの代わりに自動操作でゲームを進め，こうかとんとボスが倒れないようにする場面
+    """
+    def update(self, key_lst) -> hs.Scene:
+        world = self.game.world
+        keep_alive(world)
+        events = world.step(hs.demo_inputs(world.tmr))
+        if "boss" in events:
+            return hs.BossWarningScene(self.game, self)
+        if "flame_hit" in events:
+            return hs.HitStunScene(self.game, self)
+        return self
+
+
+def bench_pacing(rates: list[int], seconds: int) -> bool:
+    """
+    描画回数をratesのそれぞれにしてGame.runをseconds秒分動かし，
+    シミュレーションの回数，ボスの状態とHP，ゲーム状態のハッシュ値が描画回数によらず同じになるかを確かめる
+    戻り値：すべて同じならTrue
+    """
+    screen = pg.display.set_mode((hs.WIDTH, hs.HEIGHT))
+    hs.ASSETS.convert_all()
+    hs.prerender_bomb_bank()
+    bg = hs.ASSETS.get("fig/22823124.jpg", ("rotozoom", 0, 1.1), alpha=False)
+    print(f"{'render Hz':>9} {'draws':>6} {'tmr':>5} {'boss':>8} {'boss hp':>7} digest")
+    states = []
+    for hz in rates:
+        world = hs.GameWorld(seed=0)
+        game = hs.Game(screen, hs.Renderer(screen, bg), world, render_fps=hz)
+        game.clock = SteadyClock(hz, seconds)
+        game.run(DemoScene(game))
+        world = game.world
+        state = (world.tmr, world.boss.state if world.boss_mode else "-", world.boss.hp, world.digest())
+        states.append(state)
+        print(f"{hz:>9} {game.clock.ticks:>6} {state[0]:>5} {state[1]:>8} {state[2]:>7} {state[3]}")
+    same = all(s == states[0] for s in states)
+    print("same state at every rate" if same else "STATE DIFFERS between rates")
+    return same
+
+
+# 最初のタイトル画面を転送した時刻を表示してすぐに終わるゲームのプロセス（引数はバンドルのパス，空なら使わない）
+STARTUP_CHILD = """
+import os, sys, time
+import HeroShooter as hs
+present = hs.Renderer.present_screen
+def first_frame(self, surface):
+    present(self, surface)
+    print(time.time(), flush=True)
+    os._exit(0)
+hs.Renderer.present_screen = first_frame
+hs.pg.init()
+hs.main(bundle=sys.argv[1] or None)
+"""
+IMPORT_CHILD = "import time, HeroShooter; print(time.time())"  # 読み込むだけのプロセス
+
+
+def bench_startup(runs: int, bundle: str):
+    """
+    プロセスを起動してから最初のタイトル画面を転送するまでの時間（ミリ秒）を，
+    HeroShooterを読み込むだけ，アセットバンドルなし，ありのそれぞれruns回計測して比べる
+    バンドルがなければbuild_bundle.pyで作る
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    if not os.path.exists(os.path.join(here, bundle)):
+        subprocess.run([sys.executable, "build_bundle.py", "--out", bundle], cwd=here, check=True)
+    cases = {"import only": (IMPORT_CHILD,), "no bundle": (STARTUP_CHILD, ""), "bundle": (STARTUP_CHILD, bundle)}
+    print(f"{'case':>12} {'median ms':>10} {'min ms':>8}")
+    for name, args in cases.items():
+        times = []
+        for _ in range(runs):
+            start = time.time()
+            out = subprocess.run([sys.executable, "-c", *args], cwd=here, capture_output=True, text=True, check=True)
+            times.append((float(out.stdout.split()[-1]) - start) * 1000)
+        print(f"{name:>12} {statistics.median(times):>10.1f} {min(times):>8.1f}")
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_ms: float) -> list[str]:
+    """
+    baselineと比べて，threshold（割合）を超えて悪化した項目の説明のリストを返す
+    min_ms未満の処理段階は誤差が大きいので比べない
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for phase, value in result["ms"].items():
+            old = base["ms"].get(phase)
+            if old is not None and old >= min_ms and value > old * (1 + threshold):
+                regressions.append(f"{name}.{phase}: {old:.3f} -> {value:.3f} ms")
+        old, value = base.get("peak_kb"), result.get("peak_kb")
+        if old and value and value > old * (1 + threshold):
+            regressions.append(f"{name}.peak_kb: {old:.0f} -> {value:.0f} KB")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HeroShooter benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("collision", help="衝突判定のスケーリングを計測する")
+    p.add_argument("--sizes", type=int, nargs="+", default=[250, 500, 1000, 2000, 4000])
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--kill", action="store_true", help="衝突したスプライトを消しながら判定する")
+    p = sub.add_parser("hitbox", help="精密な衝突判定の時間と当たり方を比べる")
+    p.add_argument("-n", type=int, default=1000, help="爆弾の数")
+    p.add_argument("--repeat", type=int, default=5)
+    p = sub.add_parser("render", help="描画クラスごとの描画時間を計測する")
+    p.add_argument("--frames", type=int, default=900)
+    p.add_argument("--software-renderer", action="store_true", help="TextureRendererでソフトウェアレンダラーを使う")
+    p = sub.add_parser("vecenv", help="VecEnvの作業プロセス数ごとの処理速度を計測する")
+    p.add_argument("--envs", type=int, default=16)
+    p.add_argument("--frames", type=int, default=500)
+    p.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4, os.cpu_count() or 1],
+                   help="計測する作業プロセス数（0は同じプロセスで動かす）")
+    p.add_argument("--batch", type=int, nargs="+", default=[1, 50],
+                   help="1回のやりとりで進めるフレーム数（1はstep，2以上はstep_many）")
+    p = sub.add_parser("rewind", help="巻き戻し用の状態の保存・復元の時間と大きさを計測する")
+    p.add_argument("names", nargs="*", default=[], help="計測する場面（省略時はすべて）")
+    p.add_argument("--frames", type=int, default=600)
+    p.add_argument("--bullet-engine", action="store_true", help="爆弾をProjectileEngineで処理する")
+    p.add_argument("--compress", action="store_true", help="保存する状態をzlibで圧縮する")
+    p = sub.add_parser("gc", help="自動のGCと手動の回収でフレーム時間の最大を比べる")
+    p.add_argument("names", nargs="*", default=[], help="計測する場面（省略時はすべて）")
+    p.add_argument("--frames", type=int, default=600)
+    p.add_argument("--bullet-engine", action="store_true", help="爆弾をProjectileEngineで処理する")
+    p = sub.add_parser("pacing", help="描画回数を変えてもゲームの進み方が同じかを確かめる")
+    p.add_argument("--rates", type=int, nargs="+", default=[30, 60, 120], help="描画回数（Hz）")
+    p.add_argument("--seconds", type=int, default=30, help="動かす時間（秒，ボスは20秒過ぎに登場する）")
+    p = sub.add_parser("startup", help="起動から最初のタイトル画面までの時間を計測する")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--bundle", default=hs.AssetBundle.PATH, help="使うアセットバンドル（なければ作る）")
+    p = sub.add_parser("scenarios", help="場面ごとの処理時間とメモリを計測し，基準値と比べる")
+    p.add_argument("names", nargs="*", default=[], help=f"計測する場面（省略時はすべて）：{', '.join(SCENARIOS)}")
+    p.add_argument("--frames", type=int, default=600)
+    p.add_argument("-n", type=int, default=None, help="敵機の数や爆弾の数（場面ごとの既定値を上書き）")
+    p.add_argument("--bullet-engine", action="store_true", help="爆弾をProjectileEngineで処理する")
+    p.add_argument("--precise-hitbox", action="store_true", help="衝突判定を円とマスクで行う")
+    p.add_argument("--no-memory", action="store_true", help="メモリのピークを計測しない")
+    p.add_argument("--out", help="結果のJSONを書き出すファイル（省略時は標準出力）")
+    p.add_argument("--baseline", help="比べる基準値のJSONファイル")
+    p.add_argument("--save-baseline", help="結果を基準値としてこのファイルに保存する")
+    p.add_argument("--threshold", type=float, default=0.25, help="悪化とみなす割合（0.25なら25%%）")
+    p.add_argument("--min-ms", type=float, default=0.05, help="これより短い処理段階は比べない（ミリ秒）")
+    args = parser.parse_args()
+    pg.init()
+    if args.command == "collision":
+        bench_collision(args.sizes, args.repeat, args.kill)
+    elif args.command == "hitbox":
+        bench_hitbox(args.n, args.repeat)
+    elif args.command == "render":
+        bench_render(args.frames, args.software_renderer)
+    elif args.command == "vecenv":
+        bench_vecenv(args.envs, args.frames, sorted(set(args.workers)), sorted(set(args.batch)))
+    elif args.command == "rewind":
+        for name in args.names:
+            if name not in SCENARIOS:
+                parser.error(f"unknown scenario: {name}")
+        bench_rewind(args.names or list(SCENARIOS), args.frames, {"bullet_engine": args.bullet_engine}, args.compress)
+    elif args.command == "gc":
+        for name in args.names:
+            if name not in SCENARIOS:
+                parser.error(f"unknown scenario: {name}")
+        bench_gc(args.names or list(SCENARIOS), args.frames, {"bullet_engine": args.bullet_engine})
+    elif args.command == "pacing":
+        if not bench_pacing(args.rates, args.seconds):
+            sys.exit(1)
+    elif args.command == "startup":
+        bench_startup(args.runs, args.bundle)
+    elif args.command == "scenarios":
+        for name in args.names:
+            if name not in SCENARIOS:
+                parser.error(f"unknown scenario: {name}")
+        world_opts = {"bullet_engine": args.bullet_engine, "precise_hitbox": args.precise_hitbox}
+        results = bench_scenarios(args.names or list(SCENARIOS), args.frames, args.n, world_opts, not args.no_memory)
+        report = {"world_opts": world_opts, "scenarios": results}
+        text = json.dumps(report, indent=2)
+        if args.out:
+            with open(args.out, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        if args.save_baseline:
+            with open(args.save_baseline, "w") as f:
+                f.write(text + "\n")
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f), args.threshold, args.min_ms)
+            for line in regressions:
+                print("REGRESSION", line, file=sys.stderr)
+            if regressions:
+                sys.exit(1)
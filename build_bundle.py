@@ -0,0 +1,41 @@
+"""
+HeroShooterの画像とフォントを1つのアセットバンドルにまとめるスクリプト
+fig/の全ファイルと，各クラスが使う大きさ・向きに変換済みの画像を生のピクセルのまま入れるので，
+ゲームの起動時にはPNGやJPGのデコードも回転・拡大縮小もせずにメモリマップから画像を作れる
+
+    python build_bundle.py [--out assets.bundle]
+
+画像やフォントを差し替えたら作り直す（変わったファイルの分は起動時に使われず，元のファイルから読まれる）
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame as pg
+
+import HeroShooter as hs
+
+
+def build(out: str) -> dict:
+    """
+    hs.bundle_assets()の画像とhs.AssetBundle.FONTSのフォントをoutに書き出す
+    画像はゲームと同じく画面のピクセル形式に変換してから変換列を適用したものを入れる
+    戻り値：画像の数，ファイルの数，バイト数
+    """
+    pg.display.set_mode((hs.WIDTH, hs.HEIGHT))
+    images = [(path, ops, alpha, hs.ASSETS.get(path, *ops, alpha=alpha)) for path, ops, alpha in hs.bundle_assets()]
+    hs.AssetBundle.write(out, images, list(hs.AssetBundle.FONTS))
+    return {"images": len(images), "files": len(hs.AssetBundle.FONTS), "bytes": os.path.getsize(out)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HeroShooter asset bundle builder")
+    parser.add_argument("--out", default=hs.AssetBundle.PATH, help="書き出すファイル")
+    args = parser.parse_args()
+    pg.init()
+    start = time.perf_counter()
+    stats = build(args.out)
+    print(f"{args.out}: {stats['images']} images, {stats['files']} files, "
+          f"{stats['bytes']/(1 << 20):.1f} MB in {time.perf_counter() - start:.2f}s")
+    pg.quit()
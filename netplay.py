@@ -0,0 +1,562 @@
+"""
+HeroShooterを2人協力プレイでUDP越しに遊ぶためのモジュール
+サーバーがGameWorld(players=2)を進める権威を持ち，クライアントは入力を送ってスナップショットを受け取り描くだけにする
+スナップショットはゲーム全体（こうかとん，HP，スコア，ボス，爆弾，ビーム，炎柱，敵機，爆発）を
+固定長のレコードに詰めたバイト列で，クライアントが受け取ったと返事をした最後のスナップショットとの差分
+（変わったレコードと消えたレコード）だけを送る
+
+    python netplay.py server --port 5000            # 1人目（このウィンドウで操作する）
+    python netplay.py client 127.0.0.1 --port 5000  # 2人目
+    python netplay.py loopback --ticks 1500         # 画面なしで両端を1つのプロセスで動かし，通信量と時間を表示する
+"""
+import argparse
+import math
+import os
+import random
+import socket
+import statistics
+import struct
+import sys
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from typing import NamedTuple
+
+import pygame as pg
+
+import HeroShooter as hs
+
+PORT = 50070
+NO_BASE = 0xFFFFFFFF  # 差分の元がない（全体を送る）ことを表すtick
+# 状態のまとめ：tick，スコア，HP，ボスのHP，ボスの最大HP，ボスの状態，フラグ（bit0 ボス戦，bit1-2 結果），カメラの位置
+HEADER = struct.Struct("<IiBhhBBi")
+BIRD = struct.Struct("<ihhhBB")  # こうかとん：左上のX座標，Y座標，横速度，縦速度，向き，フラグ（bit0 無敵，bit1 半透明）
+ENTITY = struct.Struct("<BHihH")  # スプライト：種類，番号，左上のX座標，Y座標，種類ごとの値（コマ番号など）
+PACKET = struct.Struct("<BIIHH")  # 種類（bit7 zlib圧縮），tick，差分の元のtick，消えたレコード数，変わったレコード数
+REMOVED = struct.Struct("<BH")  # 消えたスプライトの種類と番号
+INPUT = struct.Struct("<BII")  # 種類，最新の入力の通し番号，受け取った最新のスナップショットのtick（この後に入力コードが続く）
+SNAPSHOT, INPUTS, COMPRESSED = 1, 2, 0x80
+
+# 種類の番号は描画順（GameWorld.drawと同じ）
+BEAM, ENEMY, BOMB, FLAME, EXPLOSION, BOSS = range(1, 7)
+DIRECTIONS = ((+1, 0), (+1, -1), (0, -1), (-1, -1), (-1, 0), (-1, +1), (0, +1), (+1, +1))
+BOSS_STATES = ("enter", "idle", "bombing", "flame", "cannon", "return", *hs.BOSS_PATTERNS)
+RESULTS = (None, "gameover", "clear")
+
+
+class Snapshot(NamedTuple):
+    """
+    1フレーム分のゲーム全体の状態
+    tick：作った順の通し番号（ゲームオーバーのフレームはGameWorld.tmrが進まないため別に数える）
+    header：HEADERとこうかとんの数だけのBIRDを詰めたバイト列
+    entities：(種類<<16 | 番号) -> ENTITYレコード（種類ごとにグループに入っている順）
+    """
+    tick: int
+    header: bytes
+    entities: dict[int, bytes]
+
+    def full_size(self) -> int:
+        """
+        差分を取らずに送ったときのバイト数
+        """
+        return PACKET.size + len(self.header) + len(self.entities)*ENTITY.size
+
+    def fields(self) -> tuple[tuple, list[tuple]]:
+        """
+        戻り値：HEADERの値，こうかとんごとのBIRDの値
+        """
+        head = HEADER.unpack_from(self.header)
+        birds = [BIRD.unpack_from(self.header, pos) for pos in range(HEADER.size, len(self.header), BIRD.size)]
+        return head, birds
+
+
+class SnapshotEncoder:
+    """
+    GameWorldからスナップショットを作るクラス
+    スプライトには初めて見たときに番号を振り，同じスプライトは消えるまで同じレコードの差分として送る
+    """
+    def __init__(self):
+        self.ids = weakref.WeakKeyDictionary()  # スプライト -> 番号
+        self.serial = 0
+        self.tick = 0  # 作ったスナップショットの数
+
+    def _id(self, sprite: pg.sprite.Sprite) -> int:
+        sid = self.ids.get(sprite)
+        if sid is None:
+            self.serial = self.serial % 0xFFFF + 1  # 16ビットで一周する（同時に存在する数はずっと少ない）
+            sid = self.ids[sprite] = self.serial
+        return sid
+
+    def capture(self, world: hs.GameWorld) -> Snapshot:
+        boss = world.boss
+        state = BOSS_STATES.index(boss.state) if boss.state in BOSS_STATES else 255
+        flags = world.boss_mode | RESULTS.index(world.result) << 1
+        parts = [HEADER.pack(world.tmr, world.score.value, world.hp.current_life, boss.hp, boss.maxhp,
+                             state, flags, world.camera.x)]
+        for bird in world.birds:
+            translucent = bird.image.get_alpha() not in (None, 255)
+            parts.append(BIRD.pack(bird.rect.x, bird.rect.y, bird.vx, bird.vy, DIRECTIONS.index(bird.dire),
+                                   bird.is_invincible | translucent << 1))
+        entities = {}
+
+        def add(kind: int, sid: int, rect: pg.Rect, aux: int):
+            entities[kind << 16 | sid] = ENTITY.pack(kind, sid, rect.x, rect.y, aux)
+
+        for beam in world.beams:
+            add(BEAM, self._id(beam), beam.rect, DIRECTIONS.index((round(beam.vx), round(beam.vy))))
+        for emy in world.emys:
+            add(ENEMY, self._id(emy), emy.rect, emy.shown)
+        if isinstance(world.bombs, hs.ProjectileEngine):
+            engine = world.bombs
+            alive = hs.np.flatnonzero(engine.alive[:engine.n])
+            sids = (engine.ids[alive] - 1) % 0xFFFF + 1  # 爆弾の通し番号を16ビットで一周させる
+            for i, sid in zip(alive.tolist(), sids.tolist()):
+                add(BOMB, sid, engine.rect(i), int(engine.rad[i]) | int(engine.color[i]) << 8)
+        else:
+            for bomb in world.bombs:
+                add(BOMB, self._id(bomb), bomb.rect, bomb.rect.w//2 | hs.Bomb.colors.index(bomb.color) << 8)
+        for flame in world.flames:
+            add(FLAME, self._id(flame), flame.rect, flame.shown)
+        for exp in world.exps:
+            add(EXPLOSION, self._id(exp), exp.rect, exp.shown)
+        if world.boss_mode:
+            for sprite in world.bosses:
+                add(BOSS, self._id(sprite), sprite.rect, 0)
+        self.tick += 1
+        return Snapshot(self.tick, b"".join(parts), entities)
+
+
+def encode(snap: Snapshot, base: "Snapshot|None" = None) -> bytes:
+    """
+    スナップショットを送信用のバイト列にする
+    引数2 base：相手が持っているスナップショット（指定した場合はこれとの差分だけを詰める）
+    """
+    if base is None:
+        removed, changed = [], list(snap.entities.values())
+    else:
+        old = base.entities
+        removed = [REMOVED.pack(key >> 16, key & 0xFFFF) for key in old.keys() - snap.entities.keys()]
+        changed = [rec for key, rec in snap.entities.items() if old.get(key) != rec]
+    body = snap.header + b"".join(removed) + b"".join(changed)
+    kind = SNAPSHOT
+    packed = zlib.compress(body, 1)
+    if len(packed) < len(body):
+        body, kind = packed, kind | COMPRESSED
+    return PACKET.pack(kind, snap.tick, NO_BASE if base is None else base.tick, len(removed), len(changed)) + body
+
+
+def decode(data: bytes, history: dict[int, Snapshot]) -> "Snapshot|None":
+    """
+    encodeしたバイト列をスナップショットに戻す
+    引数2 history：tick -> 受け取り済みのスナップショット（差分の元を探す）
+    戻り値：スナップショット（差分の元を持っていなければNone）
+    """
+    kind, tick, base_tick, n_removed, n_changed = PACKET.unpack_from(data)
+    body = data[PACKET.size:]
+    if kind & COMPRESSED:
+        body = zlib.decompress(body)
+    if base_tick == NO_BASE:
+        entities = {}
+    elif base_tick in history:
+        entities = dict(history[base_tick].entities)
+    else:
+        return None
+    pos = len(body) - n_changed*ENTITY.size - n_removed*REMOVED.size  # 残りの先頭がヘッダー（長さはこうかとんの数による）
+    header = body[:pos]
+    for _ in range(n_removed):
+        k, sid = REMOVED.unpack_from(body, pos)
+        entities.pop(k << 16 | sid, None)
+        pos += REMOVED.size
+    for _ in range(n_changed):
+        rec = body[pos:pos+ENTITY.size]
+        k, sid = rec[0], rec[1] | rec[2] << 8
+        entities[k << 16 | sid] = rec
+        pos += ENTITY.size
+    return Snapshot(tick, header, entities)
+
+
+class NetStats:
+    """
+    1 tickごとの送信バイト数と，スナップショットを作って詰める（または戻す）のにかかった時間を記録するクラス
+    """
+    def __init__(self):
+        self.sent: list[int] = []  # 実際に送ったバイト数
+        self.full: list[int] = []  # 差分を取らなかった場合のバイト数
+        self.encode_ms: list[float] = []
+        self.decode_ms: list[float] = []
+
+    @staticmethod
+    def _summary(values: list) -> dict[str, float]:
+        if not values:
+            return {}
+        ordered = sorted(values)
+        return {"mean": round(statistics.fmean(values), 3), "p95": round(ordered[int(0.95*(len(ordered)-1))], 3),
+                "max": round(ordered[-1], 3)}
+
+    def report(self) -> dict[str, dict[str, float]]:
+        return {"bytes/tick": self._summary(self.sent), "full bytes/tick": self._summary(self.full),
+                "encode ms/tick": self._summary(self.encode_ms), "decode ms/tick": self._summary(self.decode_ms)}
+
+
+class Endpoint:
+    """
+    サーバーとクライアントに共通のUDPソケットの扱い
+    """
+    def __init__(self, host: str, port: int, loss: float = 0.0, seed: int = 0):
+        """
+        引数1, 2 host, port：待ち受けるアドレス（portが0なら空いている番号）
+        引数3 loss：送信したパケットを捨てる割合（回線の損失を真似る試験用）
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.address = self.sock.getsockname()
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.stats = NetStats()
+
+    def send(self, data: bytes, address):
+        if self.loss and self.rng.random() < self.loss:
+            return
+        self.sock.sendto(data, address)
+
+    def receive(self) -> list[tuple[bytes, tuple]]:
+        """
+        届いているパケットを全て受け取る（待たない）
+        """
+        packets = []
+        while True:
+            try:
+                packets.append(self.sock.recvfrom(65536))
+            except (BlockingIOError, InterruptedError):
+                return packets
+            except ConnectionResetError:  # 相手のポートが閉じている（Windows）
+                continue
+
+    def close(self):
+        self.sock.close()
+
+
+class NetServer(Endpoint):
+    """
+    GameWorldを進める権威サーバー（1人目はこのプロセスで操作し，2人目の入力はクライアントから受け取る）
+    """
+    def __init__(self, world: hs.GameWorld, host: str = "127.0.0.1", port: int = PORT,
+                 history: int = 64, **kwargs):
+        """
+        引数1 world：players=2で作ったGameWorld
+        引数4 history：差分の元として覚えておく送信済みスナップショットの数
+        """
+        super().__init__(host, port, **kwargs)
+        self.world = world
+        self.encoder = SnapshotEncoder()
+        self.client = None  # クライアントのアドレス
+        self.history = history
+        self.sent: OrderedDict[int, Snapshot] = OrderedDict()  # tick -> 送ったスナップショット
+        self.ack = NO_BASE  # クライアントが受け取った最新のtick
+        self.seq = 0  # 反映済みの入力の通し番号
+        self.pending: list[hs.Inputs] = []  # 届いてまだ反映していない入力
+        self.held = hs.Inputs()  # 最後に反映した入力（届かない間は左右キーだけ押し続けているものとする）
+        self.last = None  # 最後に送ったスナップショット
+
+    def poll(self):
+        """
+        クライアントからの入力と受け取り確認を取り込む
+        """
+        for data, address in self.receive():
+            if len(data) < INPUT.size or data[0] != INPUTS:
+                continue
+            self.client = address
+            _, seq, ack = INPUT.unpack_from(data)
+            if ack != NO_BASE and (self.ack == NO_BASE or ack > self.ack):
+                self.ack = ack
+            codes = data[INPUT.size:]
+            first = seq - len(codes) + 1  # 取りこぼしに備えて直近の入力がまとめて届く
+            for i, code in enumerate(codes):
+                if first + i > self.seq:
+                    self.pending.append(hs.InputRecorder.decode(code))
+            self.seq = max(self.seq, seq)
+
+    def partner_inputs(self) -> hs.Inputs:
+        """
+        このtickに2人目へ渡す入力（届いた入力はまとめて1 tickで反映し，押した回数は捨てない）
+        """
+        if not self.pending:
+            return self.held._replace(fire=0, jump=False, special=False)
+        last = self.pending[-1]
+        merged = last._replace(fire=min(15, sum(i.fire for i in self.pending)),
+                               jump=any(i.jump for i in self.pending),
+                               special=any(i.special for i in self.pending))
+        self.pending.clear()
+        self.held = last
+        return merged
+
+    def tick(self, inputs: hs.Inputs) -> list[str]:
+        """
+        クライアントの入力を取り込んでworldを1フレーム進め，スナップショットを送る
+        引数 inputs：1人目の入力
+        """
+        self.poll()
+        events = self.world.step(inputs, self.partner_inputs())
+        self.broadcast()
+        return events
+
+    def broadcast(self):
+        if self.client is None:
+            return
+        start = time.perf_counter()
+        snap = self.encoder.capture(self.world)
+        data = encode(snap, self.sent.get(self.ack))
+        self.stats.encode_ms.append((time.perf_counter() - start)*1000)
+        self.stats.sent.append(len(data))
+        self.stats.full.append(snap.full_size())
+        self.send(data, self.client)
+        self.sent[snap.tick] = self.last = snap
+        while len(self.sent) > self.history:
+            self.sent.popitem(last=False)
+
+
+class NetClient(Endpoint):
+    """
+    入力をサーバーに送り，届いたスナップショットを組み立てるクライアント
+    """
+    redundancy = 8  # 1パケットに入れる直近の入力の数
+
+    def __init__(self, server: tuple[str, int], host: str = "0.0.0.0", history: int = 64, **kwargs):
+        super().__init__(host, 0, **kwargs)
+        self.server = server
+        self.history = history
+        self.received: OrderedDict[int, Snapshot] = OrderedDict()  # tick -> 受け取ったスナップショット
+        self.latest = None
+        self.seq = 0
+        self.recent = bytearray()  # 直近の入力コード
+
+    def send_inputs(self, inputs: hs.Inputs):
+        """
+        このフレームの入力を，直近の入力と受け取り確認と一緒に送る
+        """
+        self.seq += 1
+        self.recent.append(hs.InputRecorder.encode(inputs))
+        del self.recent[:-self.redundancy]
+        ack = NO_BASE if self.latest is None else self.latest.tick
+        self.send(INPUT.pack(INPUTS, self.seq, ack) + bytes(self.recent), self.server)
+
+    def poll(self) -> "Snapshot|None":
+        """
+        届いたスナップショットを組み立てる
+        戻り値：最新のスナップショット（まだ1つも届いていなければNone）
+        """
+        for data, _ in self.receive():
+            if len(data) < PACKET.size or data[0] & ~COMPRESSED != SNAPSHOT:
+                continue
+            start = time.perf_counter()
+            snap = decode(data, self.received)
+            self.stats.decode_ms.append((time.perf_counter() - start)*1000)
+            if snap is None or (self.latest is not None and snap.tick <= self.latest.tick):
+                continue  # 差分の元がないか，追い越された古いパケット
+            self.stats.sent.append(len(data))
+            self.received[snap.tick] = self.latest = snap
+            while len(self.received) > self.history:
+                self.received.popitem(last=False)
+        return self.latest
+
+
+class SnapshotView:
+    """
+    スナップショットをGameWorld.drawと同じ見た目で描くクラス（クライアント用）
+    """
+    def __init__(self, bg: pg.Surface, boss_bg: pg.Surface):
+        self.birds = [hs.Bird(num, (0, 0)) for num in hs.PLAYER_IMAGES]
+        self.hp = hs.HP("disturbed-zrrgd.ttf")
+        self.score = hs.Score()
+        self.boss = hs.Boss()  # HPバーの描画用
+        self.backgrounds = hs.TiledBackground(bg), hs.TiledBackground(boss_bg)
+
+    @staticmethod
+    def image(kind: int, aux: int) -> pg.Surface:
+        if kind == BEAM:
+            vx, vy = DIRECTIONS[aux]
+            return hs.ASSETS.get("fig/beam.png", ("rotozoom", math.degrees(math.atan2(-vy, vx)), 1.0))
+        if kind == ENEMY:
+            return hs.Enemy.animation.image(aux)
+        if kind == BOMB:
+            return hs.ASSETS.circle(aux & 0xFF, hs.Bomb.colors[aux >> 8])
+        if kind == FLAME:
+            return hs.Flame.animation.image(aux)
+        if kind == EXPLOSION:
+            return hs.Explosion.animation.image(aux)
+        return hs.ASSETS.get("fig/BOSS.png", ("rotozoom", 0, 0.2))
+
+    def draw(self, screen: pg.Surface, snap: Snapshot):
+        (_, score, hp, boss_hp, boss_maxhp, _, flags, camera), birds = snap.fields()
+        boss_mode = bool(flags & 1)
+        self.backgrounds[boss_mode].draw(screen, camera)
+        for bird, (x, y, _, _, dire, bflags) in zip(self.birds, birds):
+            img = (bird.blink_imgs if bflags & 2 else bird.imgs)[DIRECTIONS[dire]]
+            screen.blit(img, (x - camera, y))
+        for key in sorted(snap.entities, key=lambda key: key >> 16):  # 同じ種類の中では届いた順のまま
+            kind, _, x, y, aux = ENTITY.unpack(snap.entities[key])
+            screen.blit(self.image(kind, aux), (x - camera, y))
+        if boss_mode:
+            self.boss.hp, self.boss.maxhp = boss_hp, boss_maxhp
+            self.boss.draw_hp(screen)
+        self.hp.rects = [self.hp.heart_image if i < hp else self.hp.no_heart_image for i in range(self.hp.max_life)]
+        self.hp.update(screen)
+        self.score.value = score
+        self.score.update(screen)
+
+
+def run_loopback(ticks: int, world_opts: dict, loss: float = 0.0) -> dict:
+    """
+    サーバーとクライアントを同じプロセスで127.0.0.1越しにつなぎ，両方を自動操作で動かす
+    毎tick，クライアントが組み立てたスナップショットがサーバーのものと一致するかも確かめる
+    戻り値：通信量と時間の集計
+    """
+    world = hs.GameWorld(players=2, **world_opts)
+    server = NetServer(world, port=0, loss=loss, seed=1)
+    client = NetClient(server.address, host="127.0.0.1", loss=loss, seed=2)
+    mismatches = stale = 0
+    try:
+        for _ in range(ticks):
+            client.send_inputs(hs.demo_inputs(world.tmr + 50))  # 2人目は1人目と少しずらして動かす
+            server.tick(hs.demo_inputs(world.tmr))
+            snap = client.poll()
+            for _ in range(100):  # ローカルでも届くまで少し待つことがある
+                if snap is not None and snap.tick == server.last.tick or loss:
+                    break
+                time.sleep(0.0005)
+                snap = client.poll()
+            if snap is None or snap.tick != server.last.tick:
+                stale += 1
+            elif snap.header != server.last.header or snap.entities != server.last.entities:
+                mismatches += 1
+            if world.result is not None:
+                break
+    finally:
+        server.close()
+        client.close()
+    report = server.stats.report()
+    report["decode ms/tick"] = client.stats.report()["decode ms/tick"]
+    report.update({"ticks": world.tmr, "result": world.result, "mismatches": mismatches, "stale": stale})
+    return report
+
+
+def read_inputs(keydowns: list[int]) -> hs.Inputs:
+    return hs.Inputs.from_keys(pg.key.get_pressed(), keydowns)
+
+
+def pump(keydowns: list[int]) -> bool:
+    """
+    イベントを処理してこのフレームに押されたキーを集める
+    戻り値：ウィンドウが閉じられたらFalse
+    """
+    for event in pg.event.get():
+        if event.type == pg.QUIT:
+            return False
+        if event.type == pg.KEYDOWN:
+            keydowns.append(event.key)
+    return True
+
+
+def run_server(port: int, world_opts: dict):
+    """
+    1人目として遊びながら，クライアントに状態を配信する
+    """
+    screen = pg.display.set_mode((hs.WIDTH, hs.HEIGHT))
+    pg.display.set_caption("HeroShooter (server)")
+    hs.ASSETS.convert_all()
+    hs.prerender_bomb_bank()
+    bg = hs.ASSETS.get("fig/22823124.jpg", ("rotozoom", 0, 1.1), alpha=False)
+    world = hs.GameWorld(players=2, **world_opts)
+    server = NetServer(world, host="0.0.0.0", port=port)
+    renderer = hs.Renderer(screen, bg)
+    clock = pg.time.Clock()
+    print(f"listening on {server.address[0]}:{server.address[1]}")
+    try:
+        while world.result is None:
+            keydowns = []
+            if not pump(keydowns):
+                break
+            if "boss" in server.tick(read_inputs(keydowns)):
+                renderer.set_background(hs.ASSETS.get("fig/22828803.jpg", ("rotozoom", 0, 1.1), alpha=False))
+            renderer.render(world)
+            clock.tick(hs.FPS)
+    finally:
+        server.close()
+    return server.stats
+
+
+def run_client(host: str, port: int, timeout: float = 5.0):
+    """
+    2人目として入力を送り，届いた状態を描く
+    引数3 timeout：つながった後にこの秒数スナップショットが届かなければ終わる
+    """
+    screen = pg.display.set_mode((hs.WIDTH, hs.HEIGHT))
+    pg.display.set_caption("HeroShooter (client)")
+    hs.ASSETS.convert_all()
+    hs.prerender_bomb_bank()
+    view = SnapshotView(hs.ASSETS.get("fig/22823124.jpg", ("rotozoom", 0, 1.1), alpha=False),
+                        hs.ASSETS.get("fig/22828803.jpg", ("rotozoom", 0, 1.1), alpha=False))
+    client = NetClient((host, port))
+    clock = pg.time.Clock()
+    last = time.perf_counter()
+    try:
+        while True:
+            keydowns = []
+            if not pump(keydowns):
+                break
+            client.send_inputs(read_inputs(keydowns))
+            before = client.latest
+            snap = client.poll()
+            if snap is not before:
+                last = time.perf_counter()
+                view.draw(screen, snap)
+                pg.display.update()
+                if snap.fields()[0][6] >> 1:  # 結果が出たら終わる
+                    break
+            elif snap is not None and time.perf_counter() - last > timeout:  # サーバーが止まった
+                break
+            clock.tick(hs.FPS)
+    finally:
+        client.close()
+    return client.stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HeroShooter netplay")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("server", help="1人目として遊びながら状態を配信する")
+    serve.add_argument("--port", type=int, default=PORT)
+    p = sub.add_parser("client", help="2人目としてサーバーにつなぐ")
+    p.add_argument("host")
+    p.add_argument("--port", type=int, default=PORT)
+    loop = sub.add_parser("loopback", help="画面なしで両端を127.0.0.1でつなぎ，通信量と時間を計測する")
+    loop.add_argument("--ticks", type=int, default=1500)
+    loop.add_argument("--loss", type=float, default=0.0, help="送信したパケットを捨てる割合")
+    for p in (serve, loop):  # ゲームを進めるのはサーバー側だけ
+        p.add_argument("--seed", type=int, help="乱数の種")
+        p.add_argument("--bullet-engine", action="store_true", help="爆弾をProjectileEngineで処理する")
+        p.add_argument("--boss-patterns", action="store_true", help="ボスの攻撃に弾幕を加える")
+    args = parser.parse_args()
+    if args.command == "loopback":
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pg.init()
+    if args.command == "client":
+        stats = run_client(args.host, args.port)
+    else:
+        world_opts = {"seed": args.seed, "bullet_engine": args.bullet_engine, "boss_patterns": args.boss_patterns}
+        if args.command == "server":
+            stats = run_server(args.port, world_opts)
+        else:
+            hs.prerender_bomb_bank()
+            report = run_loopback(args.ticks, world_opts, args.loss)
+            for key, value in report.items():
+                print(f"{key:>16}: {value}")
+            stats = None
+    if stats is not None:
+        for key, value in stats.report().items():
+            if value:  # サーバーは戻す時間，クライアントは詰める時間を持たない
+                print(f"{key:>16}: {value}")
+    pg.quit()
+    sys.exit()
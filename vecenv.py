@@ -0,0 +1,264 @@
+"""
+HeroShooterを画面なしで複数同時に動かすためのバッチ環境
+難易度調整（敵機の出現間隔，ボスのHP，爆弾の速さ）のために大量の自動対戦を回す用途を想定している
+ゲームはmultiprocessingの作業プロセスに分けて置き，全プロセスが同時に進める
+
+    env = VecEnv(8, seeds=range(8), params={"boss_maxhp": 30}, workers=4)
+    obs = env.reset()
+    obs, rewards, dones = env.step(actions)  # actionsは長さ8の入力コード列
+    obs, rewards, dones = env.step_many(plan)  # planは(フレーム数, 8)の入力コード．まとめて1往復で進める
+    env.close()
+
+stepは1フレームごとにパイプを1往復するので，観測を見ずに入力を決められる自動対戦ではstep_manyでまとめて送る
+入力コードはリプレイファイルと同じ1バイトの形式（InputRecorder.encode）
+"""
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame as pg
+
+import HeroShooter as hs
+
+PARAMS = ("enemy_interval", "boss_maxhp", "bomb_speed", "boss_patterns", "precise_hitbox")  # ゲームごとに変えられる難易度
+
+
+def observe(world: hs.GameWorld, max_enemies: int, max_bombs: int) -> dict[str, np.ndarray]:
+    """
+    ゲーム1つの状態を固定長の配列にまとめる
+    敵機と爆弾は中心座標を先頭から詰め，入りきらない分は捨てる（maskがTrueの行が有効）
+    """
+    obs = {
+        "bird": np.array(world.bird.rect.center, dtype=np.float32),
+        "enemies": np.zeros((max_enemies, 2), dtype=np.float32),
+        "enemy_mask": np.zeros(max_enemies, dtype=bool),
+        "bombs": np.zeros((max_bombs, 2), dtype=np.float32),
+        "bomb_mask": np.zeros(max_bombs, dtype=bool),
+        "boss_mode": np.bool_(world.boss_mode),
+        "boss_hp": np.int32(world.boss.hp),
+        "score": np.int32(world.score.value),
+        "hp": np.int32(world.hp.current_life),
+        "tmr": np.int32(world.tmr),
+    }
+    emys = [emy.rect.center for emy in world.emys][:max_enemies]
+    if emys:
+        obs["enemies"][:len(emys)] = emys
+        obs["enemy_mask"][:len(emys)] = True
+    if isinstance(world.bombs, hs.ProjectileEngine):
+        bombs = [r.center for r in world.bombs.rects()[:max_bombs]]
+    else:
+        bombs = [bomb.rect.center for bomb in world.bombs][:max_bombs]
+    if bombs:
+        obs["bombs"][:len(bombs)] = bombs
+        obs["bomb_mask"][:len(bombs)] = True
+    return obs
+
+
+def stack(observations: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    """
+    ゲームごとの観測を項目ごとに先頭の軸で重ねる
+    """
+    return {key: np.stack([obs[key] for obs in observations]) for key in observations[0]}
+
+
+class WorldSlice:
+    """
+    1つのプロセスが受け持つゲームの集まり
+    終わったゲームはresetされるまで止まったままになる
+    """
+    def __init__(self, seeds: list[int], params: list[dict], bullet_engine: bool,
+                 max_enemies: int, max_bombs: int):
+        self.seeds = seeds
+        self.params = params
+        self.bullet_engine = bullet_engine
+        self.max_enemies = max_enemies
+        self.max_bombs = max_bombs
+        self.worlds: list[hs.GameWorld] = []
+
+    def observe(self) -> dict[str, np.ndarray]:
+        return stack([observe(w, self.max_enemies, self.max_bombs) for w in self.worlds])
+
+    def reset(self, seeds: "list[int]|None" = None) -> dict[str, np.ndarray]:
+        """
+        全ゲームを作り直す
+        引数 seeds：新しい乱数の種（省略時は前回と同じ種）
+        """
+        if seeds is not None:
+            self.seeds = seeds
+        self.worlds = [hs.GameWorld(self.bullet_engine, seed, **params)
+                       for seed, params in zip(self.seeds, self.params)]
+        return self.observe()
+
+    def step(self, actions: np.ndarray) -> tuple[dict, np.ndarray, np.ndarray]:
+        """
+        各ゲームを入力コードactionsで1フレーム進める
+        戻り値：観測，スコアの増分，ゲームが終わったか
+        """
+        obs, rewards, dones = self.step_many(actions[None])
+        return obs, rewards[0], dones[0]
+
+    def step_many(self, actions: np.ndarray) -> tuple[dict, np.ndarray, np.ndarray]:
+        """
+        各ゲームをactionsの行の入力コードで1フレームずつ，行の数だけ進める
+        ゲームごとに続けて進めるので，観測を作るのは最後の1回だけになる
+        引数 actions：(フレーム数, ゲーム数)の入力コード
+        戻り値：最後の観測，フレームごとのスコアの増分，フレームごとのゲームが終わったか（どちらも(フレーム数, ゲーム数)）
+        """
+        rewards = np.zeros(actions.shape, dtype=np.int32)
+        dones = np.zeros(actions.shape, dtype=bool)
+        for i, (world, codes) in enumerate(zip(self.worlds, actions.T)):
+            for t, code in enumerate(codes.tolist()):
+                if world.result is None:
+                    before = world.score.value
+                    world.step(hs.InputRecorder.decode(code))
+                    rewards[t, i] = world.score.value - before
+                dones[t, i] = world.result is not None
+        return self.observe(), rewards, dones
+
+    def results(self) -> list[tuple["str|None", int, int]]:
+        """
+        各ゲームの(結果, スコア, 経過フレーム)を返す
+        """
+        return [(w.result, w.score.value, w.tmr) for w in self.worlds]
+
+
+def worker(conn, *args):
+    """
+    作業プロセスの本体：WorldSliceを作り，パイプから届いた命令を実行して結果を送り返す
+    """
+    pg.init()
+    hs.prerender_bomb_bank()
+    worlds = WorldSlice(*args)
+    while True:
+        command, data = conn.recv()
+        if command == "close":
+            break
+        conn.send(getattr(worlds, command)(*data))
+    conn.close()
+
+
+class VecEnv:
+    """
+    N個の独立したHeroShooterをまとめて1フレームずつ進めるバッチ環境
+    """
+    def __init__(self, n: int, seeds: "list[int]|None" = None, params: "dict|list[dict]|None" = None,
+                 workers: "int|None" = None, bullet_engine: bool = False,
+                 max_enemies: int = 16, max_bombs: int = 64):
+        """
+        引数1 n：同時に動かすゲームの数
+        引数2 seeds：ゲームごとの乱数の種（省略時は0, 1, ..., n-1）
+        引数3 params：GameWorldに渡す難易度（enemy_interval，boss_maxhp，bomb_speed，boss_patterns，precise_hitbox）
+                      1つの辞書なら全ゲーム共通，リストならゲームごと
+        引数4 workers：作業プロセスの数（省略時はCPUのコア数，0なら同じプロセスで動かす）
+        引数5 bullet_engine：Trueなら爆弾をProjectileEngineで扱う
+        引数6 max_enemies, max_bombs：観測に入れる敵機と爆弾の最大数
+        """
+        seeds = list(range(n)) if seeds is None else [int(s) for s in seeds]
+        if isinstance(params, dict) or params is None:
+            params = [dict(params or {}) for _ in range(n)]
+        if len(seeds) != n or len(params) != n:
+            raise ValueError("seedsとparamsはゲームの数と同じ長さにしてください")
+        for p in params:
+            unknown = set(p) - set(PARAMS)
+            if unknown:
+                raise ValueError(f"未知の難易度です: {sorted(unknown)}")
+        self.n = n
+        workers = min(n, os.cpu_count() or 1) if workers is None else min(workers, n)
+        # ゲームをできるだけ均等にプロセスへ割り当てる
+        bounds = [n * i // max(1, workers) for i in range(max(1, workers) + 1)]
+        self.slices = [slice(a, b) for a, b in zip(bounds, bounds[1:])]
+        self.local = None
+        self.conns = []
+        self.procs = []
+        if workers == 0:
+            pg.init()
+            hs.prerender_bomb_bank()
+            self.local = WorldSlice(seeds, params, bullet_engine, max_enemies, max_bombs)
+            return
+        for s in self.slices:
+            parent, child = mp.Pipe()
+            proc = mp.Process(target=worker, daemon=True,
+                              args=(child, seeds[s], params[s], bullet_engine, max_enemies, max_bombs))
+            proc.start()
+            child.close()
+            self.conns.append(parent)
+            self.procs.append(proc)
+
+    def _call(self, command: str, per_slice: list = None) -> list:
+        """
+        全作業プロセスに命令を送ってから結果をまとめて受け取る（その間は各プロセスが並行して動く）
+        """
+        if self.local is not None:
+            return [getattr(self.local, command)(*(per_slice[0] if per_slice else ()))]
+        for i, conn in enumerate(self.conns):
+            conn.send((command, per_slice[i] if per_slice else ()))
+        return [conn.recv() for conn in self.conns]
+
+    def reset(self, seeds: "list[int]|None" = None) -> dict[str, np.ndarray]:
+        """
+        全ゲームを最初からやり直す
+        引数 seeds：新しい乱数の種（省略時は前回と同じ種）
+        戻り値：項目ごとに先頭の軸がゲームの観測
+        """
+        if seeds is not None:
+            seeds = [int(s) for s in seeds]
+            if len(seeds) != self.n:
+                raise ValueError("seedsはゲームの数と同じ長さにしてください")
+        args = [(None if seeds is None else seeds[s],) for s in self.slices]
+        return self._merge(self._call("reset", args))
+
+    def step(self, actions) -> tuple[dict[str, np.ndarray], np.ndarray, np.ndarray]:
+        """
+        全ゲームを1フレーム進める
+        引数 actions：ゲームごとの入力コード（InputRecorder.encodeの形式）
+        戻り値：観測，スコアの増分，ゲームが終わったか
+        """
+        actions = np.asarray(actions, dtype=np.uint8)
+        if actions.shape != (self.n,):
+            raise ValueError(f"actionsの形は({self.n},)にしてください")
+        parts = self._call("step", [(actions[s],) for s in self.slices])
+        obs = self._merge([p[0] for p in parts])
+        return obs, np.concatenate([p[1] for p in parts]), np.concatenate([p[2] for p in parts])
+
+    def step_many(self, actions) -> tuple[dict[str, np.ndarray], np.ndarray, np.ndarray]:
+        """
+        全ゲームをactionsの行の数だけ進める（作業プロセスとのやりとりは全フレームで1往復）
+        stepを行の数だけ呼んだのと同じ結果になるが，途中の観測は返さない
+        引数 actions：(フレーム数, ゲーム数)の入力コード
+        戻り値：最後の観測，フレームごとのスコアの増分，フレームごとのゲームが終わったか（どちらも(フレーム数, ゲーム数)）
+        """
+        actions = np.asarray(actions, dtype=np.uint8)
+        if actions.ndim != 2 or actions.shape[1] != self.n:
+            raise ValueError(f"actionsの形は(フレーム数, {self.n})にしてください")
+        parts = self._call("step_many", [(actions[:, s],) for s in self.slices])
+        obs = self._merge([p[0] for p in parts])
+        return obs, np.concatenate([p[1] for p in parts], axis=1), np.concatenate([p[2] for p in parts], axis=1)
+
+    def results(self) -> list[tuple["str|None", int, int]]:
+        """
+        各ゲームの(結果, スコア, 経過フレーム)を返す
+        """
+        return [r for part in self._call("results") for r in part]
+
+    @staticmethod
+    def _merge(parts: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+        return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+    def close(self):
+        """
+        作業プロセスを終了させる
+        """
+        for conn in self.conns:
+            conn.send(("close", ()))
+            conn.close()
+        for proc in self.procs:
+            proc.join()
+        self.conns, self.procs = [], []
+
+    def __enter__(self) -> "VecEnv":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()